@@ -0,0 +1,41 @@
+import datetime
+
+from fastapi import Response
+
+# Clients must revalidate before reusing a cached copy, which is what makes polling with If-None-Match cheap
+CACHE_CONTROL = "private, no-cache"
+
+
+def session_etag(session_id: int, version: tuple[datetime.datetime | None, int | None] | None) -> str | None:
+    """
+    Weak ETag of a session's state from its version: when it was last written and the id of its last message.
+    Weak, since the same state may be sent with different content encodings.
+    """
+    if version is None:
+        return None
+    updated_at, last_message_id = version
+    if updated_at is not None and updated_at.tzinfo is None:
+        # Stored as naive UTC; read as such so every worker derives the same tag whatever its time zone
+        updated_at = updated_at.replace(tzinfo=datetime.timezone.utc)
+    stamp = int(updated_at.timestamp() * 1_000_000) if updated_at is not None else 0
+    return f'W/"{session_id}-{stamp}-{last_message_id or 0}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str | None) -> bool:
+    """If-None-Match uses the weak comparison: W/ prefixes are ignored."""
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str | None):
+    if etag is not None:
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CACHE_CONTROL
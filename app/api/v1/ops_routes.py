@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+
+from app.core.metrics import metrics
+from app.core.startup import startup_profiler
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+def read_metrics():
+    return metrics.snapshot()
+
+
+@router.get("/startup")
+def read_startup_profile():
+    return startup_profiler.report()
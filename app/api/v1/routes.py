@@ -1,13 +1,20 @@
-import json
+import datetime
 from typing import Annotated, List
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response, status
 from starlette.responses import StreamingResponse
 
+from app.api.v1.etag import etag_matches, not_modified, session_etag, set_etag
+from app.api.v1.sse import sse_stream
+from app.core.admission import admit_llm_request
+from app.core.cancellation import CancellationToken
 from app.model import chat_models
-from app.schema import chat_session_schemas, chat_message_schemas
+from app.core.broadcast import Broadcast
+from app.schema import chat_session_schemas, chat_message_schemas, job_schemas, usage_schemas
 from app.service.chat_message_service import ChatMessageService
 from app.service.chat_session_service import ChatSessionService
+from app.service.generation_queue import generation_queue
+from app.service.stream_registry import RegisteredStream, stream_registry, parse_last_event_id
 
 router = APIRouter()
 
@@ -31,9 +38,14 @@ def read_chat_sessions(
 @router.get("/sessions/{session_id}", response_model=chat_session_schemas.ChatSession)
 def read_chat_session(
         chat_session_service: Annotated[ChatSessionService, Depends(ChatSessionService)],
-        session_id: int
+        session_id: int, response: Response, if_none_match: Annotated[str | None, Header()] = None
 ):
+    # Taken before loading, so a write racing with the load can only make the ETag older than the body
+    etag = session_etag(session_id, chat_session_service.get_version(session_id))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
     chat_session = chat_session_service.get_by_id(session_id=session_id)
+    set_etag(response, etag)
     return chat_session
 
 
@@ -49,13 +61,38 @@ def delete_chat_session(
 @router.get("/sessions/{session_id}/messages/", response_model=List[chat_message_schemas.Message])
 def read_messages(
         chat_message_service: Annotated[ChatMessageService, Depends(ChatMessageService)],
-        session_id: int, skip: int = 0, limit: int = 100
+        session_id: int, skip: int = 0, limit: int = 100,
+        if_none_match: Annotated[str | None, Header()] = None
+):
+    etag = session_etag(session_id, chat_message_service.get_session_version(session_id))
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    # Returned as a ready-made Response, which FastAPI sends without validating it against response_model again;
+    # response_model still documents the payload in the OpenAPI schema
+    content = chat_message_service.get_chat_messages_json(chat_session_id=session_id, skip=skip, limit=limit)
+    response = Response(content=content, media_type="application/json")
+    set_etag(response, etag)
+    return response
+
+
+@router.get("/sessions/{session_id}/usage", response_model=usage_schemas.UsageSummary)
+def read_session_usage(
+        chat_message_service: Annotated[ChatMessageService, Depends(ChatMessageService)],
+        session_id: int
+):
+    return chat_message_service.get_session_usage(session_id=session_id)
+
+
+@router.get("/usage", response_model=usage_schemas.UsageReport)
+def read_usage(
+        chat_message_service: Annotated[ChatMessageService, Depends(ChatMessageService)],
+        start: datetime.datetime | None = None, end: datetime.datetime | None = None, limit: int = 10
 ):
-    messages = chat_message_service.get_chat_messages_by_session_id(chat_session_id=session_id, skip=skip, limit=limit)
-    return messages
+    return chat_message_service.get_usage_report(start=start, end=end, limit=limit)
 
 
-@router.post("/sessions/{session_id}/messages/", response_model=chat_message_schemas.Message)
+@router.post("/sessions/{session_id}/messages/", response_model=chat_message_schemas.Message,
+             dependencies=[Depends(admit_llm_request)])
 def create_message_for_session(
         chat_message_service: Annotated[ChatMessageService, Depends(ChatMessageService)],
         session_id: int, message: chat_message_schemas.MessageCreate
@@ -68,15 +105,91 @@ def create_message_for_session(
 @router.post("/sessions/{session_id}/messages/stream")
 async def create_message_for_session_stream(
         chat_message_service: Annotated[ChatMessageService, Depends(ChatMessageService)],
-        session_id: int, message: chat_message_schemas.MessageCreate
+        session_id: int, message: chat_message_schemas.MessageCreate, request: Request
 ) -> StreamingResponse:
     message_model = chat_models.Message(role=message.role, content=message.content, session_id=session_id)
+    cancellation = CancellationToken()
+
+    def generate():
+        # The generation runs on its own database session so it can outlive this request: a client may resume
+        # it, and once nobody listens any more it is cancelled and its partial answer stored as interrupted
+        with chat_message_service.detached() as service:
+            yield from service.create_chat_message_stream(message=message_model, session_id=session_id,
+                                                          cancellation=cancellation)
+
+    stream = stream_registry.start(session_id, generate, cancellation)
+    return _sse_response(stream.broadcast.subscribe(), stream.stream_id, request, on_close=stream.attach())
+
 
-    async def stream_generator():
+@router.get("/sessions/{session_id}/messages/stream/{stream_id}")
+async def resume_message_stream(
+        session_id: int, stream_id: str, request: Request, last_event_id: Annotated[str | None, Header()] = None
+) -> StreamingResponse:
+    stream = stream_registry.get(stream_id)
+    if stream is None or stream.session_id != session_id:
+        raise HTTPException(status_code=404, detail="Stream not found")
+    return _resume(stream.broadcast, stream_id, last_event_id, request, listener=stream)
+
+
+@router.post("/sessions/{session_id}/jobs", response_model=job_schemas.GenerationJob,
+             status_code=status.HTTP_202_ACCEPTED)
+def create_message_job(
+        chat_message_service: Annotated[ChatMessageService, Depends(ChatMessageService)],
+        session_id: int, message: chat_message_schemas.MessageCreate
+):
+    message_model = chat_models.Message(role=message.role, content=message.content, session_id=session_id)
+    job = chat_message_service.create_chat_message_job(message=message_model, session_id=session_id)
+    return job.to_schema()
+
+
+@router.get("/jobs/{job_id}", response_model=job_schemas.GenerationJob)
+def read_job(job_id: str):
+    job = generation_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_schema()
+
+
+@router.get("/jobs/{job_id}/events")
+async def subscribe_job(job_id: str, request: Request,
+                        last_event_id: Annotated[str | None, Header()] = None) -> StreamingResponse:
+    job = generation_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _resume(job.events, job_id, last_event_id, request)
+
+
+def _resume(broadcast: Broadcast, stream_id: str, last_event_id: str | None, request: Request,
+            listener: RegisteredStream | None = None) -> StreamingResponse:
+    """
+    Stream the events of a broadcast after Last-Event-ID (or from the start) as SSE.
+    A listener stream counts the client as listening, which keeps its generation from being cancelled.
+    """
+    after = -1
+    if last_event_id:
         try:
-            for chunk in chat_message_service.create_chat_message_stream(message=message_model, session_id=session_id):
-                yield f"data: {chunk.model_dump_json()}\n\n"
-        except Exception as e:
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            last_stream_id, after = parse_last_event_id(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Malformed Last-Event-ID")
+        if last_stream_id != stream_id:
+            raise HTTPException(status_code=400, detail="Last-Event-ID belongs to another stream")
+    if after + 1 < broadcast.first_seq:
+        raise HTTPException(status_code=410, detail="Missed events are no longer buffered")
+    on_close = listener.attach() if listener is not None else None
+    return _sse_response(broadcast.subscribe(after), stream_id, request, on_close)
+
+
+def _sse_response(events, stream_id: str, request: Request, on_close=None) -> StreamingResponse:
+    return StreamingResponse(sse_stream(events, id_prefix=f"{stream_id}:", is_disconnected=request.is_disconnected,
+                                        on_close=on_close),
+                             media_type="text/event-stream", headers={"X-Stream-Id": stream_id})
 
-    return StreamingResponse(stream_generator(), media_type="text/event-stream")
+
+@router.post("/batch/messages")
+def create_messages_batch(
+        chat_message_service: Annotated[ChatMessageService, Depends(ChatMessageService)],
+        batch: chat_message_schemas.BatchRequest
+) -> StreamingResponse:
+    results = chat_message_service.answer_batch(batch.questions)
+    return StreamingResponse((f"{result.model_dump_json()}\n" for result in results),
+                             media_type="application/x-ndjson")
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List, Tuple
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.schema.chat_message_schemas import StreamContent
+
+HEARTBEAT = b": keep-alive\n\n"
+
+_END = object()
+
+
+def encode_content(delta: str) -> bytes:
+    return b'{"type":"content","delta":' + json.dumps(delta, ensure_ascii=False).encode("utf-8") + b"}"
+
+
+def encode_event(event: BaseModel) -> bytes:
+    if isinstance(event, StreamContent):
+        # Hot path: one per token, so skip Pydantic serialization
+        return encode_content(event.delta)
+    return event.model_dump_json().encode("utf-8")
+
+
+def encode_frame(data: bytes, event_id: str | None = None) -> bytes:
+    if event_id is None:
+        return b"data: " + data + b"\n\n"
+    return b"id: " + event_id.encode("ascii") + b"\ndata: " + data + b"\n\n"
+
+
+def encode_error(message: str, event_id: str | None = None) -> bytes:
+    return encode_frame(json.dumps({"error": message}, ensure_ascii=False).encode("utf-8"), event_id)
+
+
+def _post(item, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop, stop: threading.Event) -> bool:
+    """Hand an item to the stream's loop; False once the stream was closed and nobody reads any more."""
+    if stop.is_set():
+        return False
+    try:
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+    except RuntimeError:
+        # The loop was closed after the check
+        return False
+    return True
+
+
+def _pump(events: Iterable, queue: asyncio.Queue, loop: asyncio.AbstractEventLoop, stop: threading.Event):
+    """Drain a blocking iterable on a worker thread into an asyncio queue."""
+    iterator = iter(events)
+    try:
+        for item in iterator:
+            if not _post(item, queue, loop, stop):
+                break
+        else:
+            _post(_END, queue, loop, stop)
+    except Exception as e:
+        _post(e, queue, loop, stop)
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+
+async def sse_stream(events: Iterable[Tuple[int, BaseModel]], id_prefix: str = "",
+                     window: float | None = None, max_bytes: int | None = None,
+                     heartbeat: float | None = None,
+                     is_disconnected: Callable[[], Awaitable[bool]] | None = None,
+                     on_close: Callable[[], None] | None = None) -> AsyncIterator[bytes]:
+    """
+    Encode (sequence, event) pairs as Server-Sent Events.
+    Consecutive content deltas are coalesced into one frame until the coalescing window has passed since the
+    first pending delta or the pending payload reaches max_bytes. Each frame's id is the sequence number of the
+    last event it contains, so a client can resume after it. A comment heartbeat is sent while idle.
+    While idle, is_disconnected (Request.is_disconnected) is polled every SSE_DISCONNECT_POLL_S, so a client
+    that went away is noticed without waiting for the next write to fail. on_close is called once the stream
+    ends for any reason, including the client disconnecting.
+    """
+    window = settings.SSE_COALESCE_WINDOW_MS / 1000 if window is None else window
+    max_bytes = settings.SSE_COALESCE_MAX_BYTES if max_bytes is None else max_bytes
+    heartbeat = settings.SSE_HEARTBEAT_S if heartbeat is None else heartbeat
+    poll = settings.SSE_DISCONNECT_POLL_S
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+    threading.Thread(target=_pump, args=(events, queue, loop, stop), name="sse-pump", daemon=True).start()
+
+    pending: List[str] = []
+    pending_bytes = 0
+    pending_seq = None
+    flush_at = 0.0
+    idle_since = time.monotonic()
+
+    def flush() -> bytes:
+        nonlocal pending, pending_bytes
+        frame = encode_frame(encode_content("".join(pending)), f"{id_prefix}{pending_seq}")
+        pending, pending_bytes = [], 0
+        return frame
+
+    try:
+        while True:
+            now = time.monotonic()
+            deadline = flush_at if pending else idle_since + heartbeat
+            if is_disconnected is not None and poll > 0:
+                deadline = min(deadline, now + poll)
+            try:
+                item = await asyncio.wait_for(queue.get(), max(0.0, deadline - now))
+            except asyncio.TimeoutError:
+                if is_disconnected is not None and await is_disconnected():
+                    return
+                now = time.monotonic()
+                if pending and now >= flush_at:
+                    yield flush()
+                elif not pending and now >= idle_since + heartbeat:
+                    yield HEARTBEAT
+                    idle_since = now
+                continue
+            idle_since = time.monotonic()
+
+            if item is _END or isinstance(item, Exception):
+                if pending:
+                    yield flush()
+                if isinstance(item, Exception):
+                    yield encode_error(str(item))
+                return
+
+            seq, event = item
+            if isinstance(event, StreamContent):
+                if not pending:
+                    flush_at = time.monotonic() + window
+                pending.append(event.delta)
+                pending_bytes += len(event.delta.encode("utf-8"))
+                pending_seq = seq
+                if pending_bytes >= max_bytes or window <= 0:
+                    yield flush()
+            else:
+                if pending:
+                    yield flush()
+                yield encode_frame(encode_event(event), f"{id_prefix}{seq}")
+    finally:
+        stop.set()
+        if on_close is not None:
+            on_close()
@@ -0,0 +1,186 @@
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Hashable
+
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+
+class _Waiter:
+    def __init__(self, key: Hashable, grant: Callable[[], None]):
+        self.key = key
+        self.granted = False
+        self._grant = grant
+
+    def grant(self):
+        self.granted = True
+        self._grant()
+
+
+class AdmissionController:
+    """
+    Bounds the number of concurrent LLM calls.
+    Callers beyond the limit wait in per-key FIFO queues that are served round-robin, so one chatty
+    session cannot starve the others. When the wait queue is full callers are rejected immediately
+    with 429, and callers that wait longer than the queue timeout get 503; both carry Retry-After.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float, name: str = "llm"):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.name = name
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        self._queues: OrderedDict[Hashable, deque[_Waiter]] = OrderedDict()
+        # Smoothed slot hold time, used to estimate Retry-After
+        self._avg_hold = 1.0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def _retry_after(self) -> int:
+        waves = (self._queued + 1) / max(self.max_in_flight, 1)
+        return max(1, math.ceil(waves * self._avg_hold))
+
+    def _reject(self, status_code: int, detail: str):
+        metrics.inc("admission_rejected_total", controller=self.name, status=status_code)
+        raise HTTPException(status_code=status_code, detail=detail,
+                            headers={"Retry-After": str(self._retry_after())})
+
+    def _publish(self):
+        metrics.set_gauge("admission_in_flight", self._in_flight, controller=self.name)
+        metrics.set_gauge("admission_queue_depth", self._queued, controller=self.name)
+
+    def _try_enter(self, key: Hashable, grant: Callable[[], None]) -> _Waiter | None:
+        """Take a slot right away or enqueue a waiter. Must be called with the lock held."""
+        if self._in_flight < self.max_in_flight and self._queued == 0:
+            self._in_flight += 1
+            self._publish()
+            return None
+        if self._queued >= self.max_queue:
+            self._reject(status.HTTP_429_TOO_MANY_REQUESTS, "Too many concurrent requests, try again later")
+        waiter = _Waiter(key, grant)
+        self._queues.setdefault(key, deque()).append(waiter)
+        self._queued += 1
+        self._publish()
+        return waiter
+
+    def _withdraw(self, waiter: _Waiter) -> bool:
+        """Take a waiter out of its queue. Returns False if it was granted a slot in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            queue = self._queues.get(waiter.key)
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.key]
+            self._queued -= 1
+            self._publish()
+        return True
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Remove a timed-out waiter. Returns False if it was granted a slot in the meantime."""
+        if not self._withdraw(waiter):
+            return False
+        self._reject(status.HTTP_503_SERVICE_UNAVAILABLE, "Timed out waiting for LLM capacity")
+
+    def _admitted(self, started: float) -> float:
+        waited = time.monotonic() - started
+        metrics.observe("admission_wait_seconds", waited, controller=self.name)
+        return time.monotonic()
+
+    def acquire(self, key: Hashable) -> float:
+        """Block until a slot is available. Returns the admission timestamp to pass to release()."""
+        started = time.monotonic()
+        granted = threading.Event()
+        with self._lock:
+            waiter = self._try_enter(key, granted.set)
+        if waiter is not None and not granted.wait(self.queue_timeout):
+            self._abandon(waiter)
+        return self._admitted(started)
+
+    async def acquire_async(self, key: Hashable) -> float:
+        """Same as acquire() but waits on the event loop instead of blocking a thread."""
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant():
+            loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+        with self._lock:
+            waiter = self._try_enter(key, grant)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._abandon(waiter)
+            except BaseException:
+                # Cancelled while queued (client gone, shutdown): leave the queue, or pass on a slot that was
+                # granted meanwhile, so it is not held by a waiter that will never release it
+                if not self._withdraw(waiter):
+                    self.release(time.monotonic())
+                raise
+        return self._admitted(started)
+
+    def release(self, admitted_at: float):
+        held = time.monotonic() - admitted_at
+        with self._lock:
+            self._avg_hold = 0.8 * self._avg_hold + 0.2 * held
+            waiter = self._next_waiter()
+            if waiter is None:
+                self._in_flight -= 1
+            else:
+                # The slot is handed over directly, so in_flight stays the same
+                waiter.grant()
+            self._publish()
+
+    def _next_waiter(self) -> _Waiter | None:
+        """Pick the head waiter of the next key in round-robin order. Must be called with the lock held."""
+        if not self._queues:
+            return None
+        key, queue = next(iter(self._queues.items()))
+        waiter = queue.popleft()
+        del self._queues[key]
+        if queue:
+            # Re-append so other keys are served before this one again
+            self._queues[key] = queue
+        self._queued -= 1
+        return waiter
+
+    @contextmanager
+    def slot(self, key: Hashable):
+        admitted_at = self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(admitted_at)
+
+
+llm_admission = AdmissionController(
+    max_in_flight=settings.LLM_MAX_IN_FLIGHT,
+    max_queue=settings.LLM_MAX_QUEUE,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT_S,
+)
+
+
+async def admit_llm_request(session_id: int):
+    """FastAPI dependency that holds an LLM admission slot for the lifetime of the request."""
+    admitted_at = await llm_admission.acquire_async(session_id)
+    try:
+        yield
+    finally:
+        llm_admission.release(admitted_at)
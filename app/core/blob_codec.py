@@ -0,0 +1,27 @@
+import zlib
+
+try:
+    # Standard library from Python 3.14
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+# Codec used for new blobs; the codec of each blob is stored with it, so blobs written by either stay readable
+CODEC = "zstd" if zstd is not None else "zlib"
+
+
+def compress(data: bytes) -> tuple[str, bytes]:
+    """Compress data with the best available codec; returns the codec name and the compressed bytes."""
+    if CODEC == "zstd":
+        return CODEC, zstd.compress(data)
+    return CODEC, zlib.compress(data)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zlib":
+        return zlib.decompress(data)
+    if codec == "zstd":
+        if zstd is None:
+            raise ValueError("Blob is zstd-compressed, which needs Python 3.14 or later")
+        return zstd.decompress(data)
+    raise ValueError(f"Unknown codec: {codec}")
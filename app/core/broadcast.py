@@ -0,0 +1,72 @@
+import threading
+from collections import deque
+from typing import Callable, Generic, Iterable, Iterator, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class Broadcast(Generic[T]):
+    """
+    Pumps a source iterable on a background thread and fans its items out to any number of subscribers.
+    Every item gets a sequence number so a subscriber can start (or resume) after any item still buffered.
+    """
+
+    def __init__(self, source: Callable[[], Iterable[T]], max_buffer: int | None = None, name: str = "broadcast"):
+        self._source = source
+        self._buffer: deque[T] = deque(maxlen=max_buffer)
+        self._first_seq = 0
+        self._next_seq = 0
+        self._done = False
+        self._error: BaseException | None = None
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self.run, name=name, daemon=True)
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    @property
+    def first_seq(self) -> int:
+        """Sequence number of the oldest item still buffered."""
+        return self._first_seq
+
+    def start(self) -> "Broadcast[T]":
+        self._thread.start()
+        return self
+
+    def run(self):
+        """Pump the source on the calling thread; start() does this on a background thread."""
+        try:
+            for item in self._source():
+                with self._condition:
+                    if len(self._buffer) == self._buffer.maxlen:
+                        self._first_seq += 1
+                    self._buffer.append(item)
+                    self._next_seq += 1
+                    self._condition.notify_all()
+        except BaseException as e:
+            self._error = e
+        finally:
+            with self._condition:
+                self._done = True
+                self._condition.notify_all()
+
+    def subscribe(self, after: int = -1) -> Iterator[Tuple[int, T]]:
+        """Yield (sequence, item) pairs for every item after the given sequence number, then live items."""
+        seq = after + 1
+        while True:
+            with self._condition:
+                while seq >= self._next_seq and not self._done:
+                    self._condition.wait()
+                if seq < self._first_seq:
+                    raise LookupError(f"Items before sequence {self._first_seq} are no longer buffered")
+                available = [self._buffer[i - self._first_seq] for i in range(seq, self._next_seq)]
+                error = self._error if self._done else None
+                finished = self._done
+            for item in available:
+                yield seq, item
+                seq += 1
+            if finished and not available:
+                if error is not None:
+                    raise error
+                return
@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Tuple
+
+from app.core.config import settings
+from app.core.metrics import metrics
+
+
+class CacheBackend(ABC):
+    """
+    A string key-value store with per-entry TTL and a bounded number of entries (least recently used are evicted).
+    Keys are namespaced by the caller ("knowledge:faq.txt", "answer:<fingerprint>"); the namespace is also
+    the label of the hit/miss metrics.
+    """
+
+    def get(self, key: str) -> str | None:
+        value = self._get(key)
+        metrics.inc("cache_hits_total" if value is not None else "cache_misses_total", namespace=_namespace(key))
+        return value
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: float):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def delete_prefix(self, prefix: str):
+        ...
+
+    @abstractmethod
+    def _get(self, key: str) -> str | None:
+        ...
+
+
+def _namespace(key: str) -> str:
+    return key.partition(":")[0]
+
+
+class NullCache(CacheBackend):
+    def _get(self, key: str) -> str | None:
+        return None
+
+    def set(self, key: str, value: str, ttl: float):
+        pass
+
+    def delete(self, key: str):
+        pass
+
+    def delete_prefix(self, prefix: str):
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """Per-process cache; each worker process has its own copy."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, Tuple[str, float]] = OrderedDict()
+
+    def _get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._entries[key] = (value, time.time() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache in a SQLite file on local disk, shared by every worker process on the host.
+    The database runs in WAL mode so readers never block on a writer. Entries carry their expiry and last
+    access time; once the table grows past max_entries the least recently accessed ones are deleted.
+    """
+
+    # Only refresh an entry's access time once in this many seconds, so hot keys don't turn every read into a write
+    ACCESS_RESOLUTION_S = 1.0
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS cache ("
+                               "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                               "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _get(self, key: str) -> str | None:
+        connection = self._connection()
+        row = connection.execute("SELECT value, expires_at, accessed_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at, accessed_at = row
+        now = time.time()
+        if expires_at <= now:
+            connection.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, now))
+            return None
+        if now - accessed_at > self.ACCESS_RESOLUTION_S:
+            connection.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key: str, value: str, ttl: float):
+        now = time.time()
+        connection = self._connection()
+        updated = connection.execute("UPDATE cache SET value = ?, expires_at = ?, accessed_at = ? WHERE key = ?",
+                                     (value, now + ttl, now, key)).rowcount
+        if updated:
+            return
+        connection.execute("INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                           (key, value, now + ttl, now))
+        # Only a new key grows the table, so only then can it have passed max_entries
+        connection.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at "
+                           "LIMIT max(0, (SELECT count(*) FROM cache) - ?))", (self.max_entries,))
+
+    def delete(self, key: str):
+        self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def delete_prefix(self, prefix: str):
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        self._connection().execute("DELETE FROM cache WHERE key LIKE ? ESCAPE '\\'", (escaped + "%",))
+
+
+@lru_cache
+def get_cache() -> CacheBackend:
+    if settings.CACHE_BACKEND == "sqlite":
+        return SQLiteCache(settings.CACHE_SQLITE_PATH, settings.CACHE_MAX_ENTRIES)
+    if settings.CACHE_BACKEND == "memory":
+        return MemoryCache(settings.CACHE_MAX_ENTRIES)
+    return NullCache()
@@ -0,0 +1,53 @@
+import logging
+import threading
+from typing import Callable, List
+
+logger = logging.getLogger(__name__)
+
+
+class CancellationToken:
+    """
+    Tells work running on another thread that its result is no longer wanted, e.g. because the client went away.
+    The work checks `cancelled` between steps; resources it blocks on (an upstream HTTP stream) register a
+    callback with on_cancel so they are released right away instead of at the next step.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._callbacks: List[Callable[[], None]] = []
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self):
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            _run(callback)
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run callback once cancelled (right away if already cancelled); returns a function unregistering it."""
+        with self._lock:
+            if not self._cancelled:
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        _run(callback)
+        return lambda: None
+
+    def _unregister(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def _run(callback: Callable[[], None]):
+    try:
+        callback()
+    except Exception:
+        # Best effort: the cancelled work still stops at its next check
+        logger.exception("Cancellation callback failed")
@@ -0,0 +1,101 @@
+import threading
+import time
+
+from app.core.metrics import metrics
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Published as the llm_circuit_state gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a backend whose circuit is open; retry_after is when it may be tried again."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Tracks the health of one backend so calls to a failing backend fail fast instead of waiting for a timeout.
+    Closed: calls go through and consecutive failures are counted; failure_threshold of them open the circuit.
+    Open: calls are refused for open_seconds. Half-open: up to half_open_probes trial calls are let through;
+    a success closes the circuit, a failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, open_seconds: float, half_open_probes: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        metrics.set_gauge("llm_circuit_state", STATE_VALUES[CLOSED], backend=name)
+
+    def retry_after(self, now: float | None = None) -> float:
+        """Seconds until an open circuit lets a trial call through; 0 when it does already."""
+        if self.state != OPEN:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(0.0, self._opened_at + self.open_seconds - now)
+
+    def available(self, now: float | None = None) -> bool:
+        """Whether a call would be let through right now, without reserving it."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                return self.retry_after(now) == 0
+            return self._probes < self.half_open_probes
+
+    def acquire(self, now: float | None = None) -> bool:
+        """Reserve a call; False when the circuit refuses it."""
+        with self._lock:
+            if self.state == OPEN and self.retry_after(now) == 0:
+                self._transition(HALF_OPEN)
+                self._probes = 0
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            return False
+
+    def release(self):
+        """Give back a reserved call that ended without telling whether the backend is healthy."""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            # A call started before the circuit opened does not close it; only a trial call does
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._open()
+            elif self.state == CLOSED:
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._open()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._failures = 0
+        self._transition(OPEN)
+
+    def _transition(self, state: str):
+        self.state = state
+        metrics.set_gauge("llm_circuit_state", STATE_VALUES[state], backend=self.name)
+        metrics.inc("llm_circuit_transitions_total", backend=self.name, state=state)
@@ -0,0 +1,87 @@
+import gzip
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Streams are sent event by event and must reach the client unbuffered
+EXCLUDED_CONTENT_TYPES = ("text/event-stream", "application/x-ndjson")
+
+
+def _accepted_encodings(accept_encoding: str) -> set[str]:
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = params.strip().removeprefix("q=")
+        try:
+            if params and float(quality) <= 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies of at least minimum_size bytes with brotli (when the brotli package is installed)
+    or gzip, whichever the client accepts. Only responses sent as a single body are compressed, i.e. regular JSON
+    responses; streamed responses such as SSE and NDJSON pass through untouched so they are not held back.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def _choose_encoding(self, scope: Scope) -> str | None:
+        accepted = _accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if brotli is not None and "br" in accepted:
+            return "br"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _compress(self, encoding: str, body: bytes) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        encoding = self._choose_encoding(scope) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Message | None = None
+
+        async def send_compressed(message: Message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Held back until the first body message shows whether the response is worth compressing
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            response_start, start = start, None
+            headers = MutableHeaders(raw=response_start["headers"])
+            body = message.get("body", b"")
+            if (message.get("more_body", False) or len(body) < self.minimum_size or "content-encoding" in headers
+                    or headers.get("content-type", "").startswith(EXCLUDED_CONTENT_TYPES)):
+                await send(response_start)
+                await send(message)
+                return
+            compressed = self._compress(encoding, body)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(response_start)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,19 +1,113 @@
+from typing import List, Literal
+
+from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+
+class LLMBackendSettings(BaseModel):
+    name: str = ""
+    base_url: str = ""
+    azure_endpoint: str = ""
+    api_key: str = ""
+    api_version: str = ""
+    # Overrides the requested model, e.g. for Azure deployments named differently per region
+    model: str = ""
+
+
 class Settings(BaseSettings):
     ENVIRONMENT: str = "development"
     DATABASE_URL: str = "sqlite:///./chat.db"
+    # Optional read replica: listings and history reads go to it, unless the request already wrote to the primary
+    DATABASE_REPLICA_URL: str = ""
+    # JSON responses of at least this many bytes are compressed (brotli if installed, else gzip); 0 disables it
+    COMPRESSION_MIN_BYTES: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4
+    # Sessions without activity for ARCHIVE_IDLE_AFTER_S are moved into compressed per-session blobs and restored
+    # on their next read; the archiver checks every ARCHIVE_INTERVAL_S seconds (0, the default, disables it). Usage
+    # reports over date ranges do not count archived sessions
+    ARCHIVE_INTERVAL_S: float = 0.0
+    ARCHIVE_IDLE_AFTER_S: float = 86400.0
+    ARCHIVE_BATCH_SIZE: int = 100
     DATABASE_USER_NAME: str = ""
     DATABASE_PASSWORD: str = ""
     DATABASE_HOST: str = ""
     DATABASE_PORT: str = ""
+    # Skip create_all at startup when the schema version stored in the database matches the models
+    DB_SKIP_DDL_IF_CURRENT: bool = True
+    # Import the OpenAI SDK on a background thread right after startup instead of on the first request
+    PREWARM_IMPORTS: bool = True
     LLM_MODEL: str = "gpt-4o-mini-2024-07-18"
+    # Model cascade: when set, short factual questions the knowledge base covers go to this model first and are
+    # escalated to LLM_MODEL when its answer fails or hedges
+    LLM_FAST_MODEL: str = ""
+    LLM_CASCADE_MAX_QUESTION_CHARS: int = 300
+    # Minimum share of a question's words found in the knowledge base for it to go to the fast model
+    LLM_CASCADE_MIN_KNOWLEDGE_COVERAGE: float = 0.5
     LLM_TEMPERATURE: float = 0.7
+    # Most recent messages of a session sent to the LLM as history, cut back to the start of a turn; 0 sends all
+    LLM_HISTORY_MAX_MESSAGES: int = 100
     OPENAI_API_KEY: str = ""
     AZURE_ENDPOINT: str = ""
     OPENAI_BASE_URL: str = "http://localhost:11434/v1/"
     OPENAI_API_VERSION: str = "2023-07-01-preview"
     KNOWLEDGE_BASE_DIR: str = "knowledge"
+    # Compiled knowledge base (see build_knowledge.py); when set, get_knowledge reads from it instead of the files
+    KNOWLEDGE_ARTIFACT_PATH: str = ""
+    # Upper bound of a get_knowledge tool result; larger files and sections are truncated
+    KNOWLEDGE_MAX_TOOL_OUTPUT_BYTES: int = 16384
+    # How often the knowledge source is checked for changes; 0 disables hot reload
+    KNOWLEDGE_WATCH_INTERVAL_S: float = 10.0
+    LLM_COALESCE_REQUESTS: bool = True
+    LLM_MAX_IN_FLIGHT: int = 16
+    LLM_MAX_QUEUE: int = 64
+    LLM_QUEUE_TIMEOUT_S: float = 30.0
+    # JSON list of LLMBackendSettings; when set, requests are load balanced across these backends
+    LLM_BACKENDS: List[LLMBackendSettings] = []
+    # Circuit breaker per backend: opens after this many consecutive failures, refuses calls for
+    # LLM_BACKEND_EJECT_SECONDS, then lets LLM_BACKEND_HALF_OPEN_PROBES trial calls through
+    LLM_BACKEND_EJECT_AFTER_FAILURES: int = 3
+    LLM_BACKEND_EJECT_SECONDS: float = 30.0
+    LLM_BACKEND_HALF_OPEN_PROBES: int = 1
+    # Attempts per LLM call (1 disables retries) for connection errors, timeouts, 429 and 5xx
+    LLM_RETRY_MAX_ATTEMPTS: int = 3
+    LLM_RETRY_BACKOFF_S: float = 0.25
+    LLM_RETRY_MAX_BACKOFF_S: float = 4.0
+    # Retries allowed per request, plus a floor per second, shared by all calls
+    LLM_RETRY_BUDGET_RATIO: float = 0.2
+    LLM_RETRY_BUDGET_MIN_PER_S: float = 1.0
+    # Ask for token usage on streamed completions (stream_options.include_usage); skipped for Azure backends on an
+    # API version older than 2024-09-01, which reject it
+    LLM_STREAM_USAGE: bool = True
+    BATCH_MAX_WORKERS: int = 8
+    BATCH_MAX_QUESTIONS: int = 500
+    SSE_COALESCE_WINDOW_MS: float = 20.0
+    SSE_COALESCE_MAX_BYTES: int = 256
+    SSE_HEARTBEAT_S: float = 15.0
+    SSE_RESUME_BUFFER_EVENTS: int = 4096
+    SSE_RESUME_TTL_S: float = 300.0
+    # How long a generation keeps going after its last client disconnected, waiting for one to resume it;
+    # after that it is cancelled and the partial answer is stored as interrupted. 0 cancels right away.
+    SSE_DISCONNECT_GRACE_S: float = 10.0
+    # How often an idle SSE stream asks the server whether its client is still connected
+    SSE_DISCONNECT_POLL_S: float = 1.0
+    GENERATION_WORKERS: int = 4
+    GENERATION_MAX_QUEUE: int = 256
+    GENERATION_MAX_ATTEMPTS: int = 3
+    GENERATION_RETRY_BACKOFF_S: float = 1.0
+    GENERATION_JOB_TTL_S: float = 600.0
+    # "sqlite" shares one on-disk cache between all worker processes of a host; "memory" is per process
+    CACHE_BACKEND: Literal["memory", "sqlite", "none"] = "memory"
+    CACHE_SQLITE_PATH: str = ".cache/qna-agent.sqlite3"
+    CACHE_MAX_ENTRIES: int = 10000
+    CACHE_KNOWLEDGE_TTL_S: float = 300.0
+    # Reuse answers to byte-identical prompts; off by default because answers are sampled at LLM_TEMPERATURE
+    CACHE_ANSWERS: bool = False
+    CACHE_ANSWER_TTL_S: float = 3600.0
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_AFTER_S: float = 2.0
+    # Model used for the hedge request; empty means the same model, typically served by another backend
+    LLM_HEDGE_MODEL: str = ""
     model_config = SettingsConfigDict(env_file='env/app.env')
 
 
@@ -1,14 +1,30 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import DeclarativeBase, sessionmaker
+import hashlib
+
+from sqlalchemy import create_engine, event, inspect, text, Column, MetaData, String, Table, delete, insert, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
 from app.core.config import settings
 
 engine = create_engine(settings.DATABASE_URL, echo=True)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+replica_engine = create_engine(settings.DATABASE_REPLICA_URL, echo=True) if settings.DATABASE_REPLICA_URL else None
+
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine else None
+
+# Session.info key set once a session has written; its reads then stay on the primary (read-your-writes)
+WROTE_PRIMARY = "wrote_primary"
+
 class Base(DeclarativeBase):
     pass
 
+# Kept out of Base.metadata so it is not part of the schema it describes
+_schema_metadata = MetaData()
+schema_version_table = Table("schema_version", _schema_metadata, Column("version", String, primary_key=True))
+
 def get_db():
     db = SessionLocal()
     try:
@@ -16,12 +32,110 @@ def get_db():
     finally:
         db.close()
 
-def init_db():
+def get_read_db():
+    """A session on the read replica, or None when no replica is configured."""
+    if ReplicaSessionLocal is None:
+        yield None
+        return
+    db = ReplicaSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+@event.listens_for(Session, "after_flush")
+def _mark_written(session: Session, flush_context):
+    session.info[WROTE_PRIMARY] = True
+
+def read_session(db: Session, read_db: Session | None) -> Session:
+    """
+    The session to read through: the replica, unless there is none or db has already written, in which case the
+    replica may not have caught up with those writes yet.
+    """
+    if read_db is None or db.info.get(WROTE_PRIMARY):
+        return db
+    return read_db
+
+def schema_version(bind: Engine) -> str:
+    """Fingerprint of the DDL of every table and index declared on Base, as the bind's dialect renders it."""
+    ddl = []
+    for table in Base.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(bind)))
+        ddl.extend(sorted(str(CreateIndex(index).compile(bind)) for index in table.indexes))
+    return hashlib.sha256("\n".join(ddl).encode("utf-8")).hexdigest()[:16]
+
+def _stored_schema_version(bind: Engine) -> str | None:
+    try:
+        with bind.connect() as connection:
+            return connection.execute(select(schema_version_table.c.version)).scalar()
+    except DBAPIError:
+        # No schema_version table yet
+        return None
+
+def migrate_schema(bind: Engine):
+    """
+    Brings tables created by an earlier version up to the declared models by adding the columns and indexes they
+    lack. create_all only creates missing tables; every schema change so far only added nullable (or server
+    defaulted) columns and indexes, which this covers without a migration tool.
+    """
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            columns = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    column_ddl = CreateColumn(column).compile(dialect=bind.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}"))
+                    print(f"Added column {table.name}.{column.name}.")
+            indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    connection.execute(CreateIndex(index))
+                    print(f"Added index {index.name}.")
+
+def schema_drift(bind: Engine) -> list[str]:
+    """Differences between the reflected database and the declared models that migrate_schema cannot fix."""
+    inspector = inspect(bind)
+    drift = []
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            drift.append(f"missing table {table.name}")
+            continue
+        columns = {column["name"]: column for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                drift.append(f"missing column {table.name}.{column.name}")
+            elif not column.primary_key and columns[column.name]["nullable"] != column.nullable:
+                drift.append(f"nullability of {table.name}.{column.name}")
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        drift.extend(f"missing index {index.name}" for index in table.indexes if index.name not in indexes)
+    return drift
+
+def init_db(bind: Engine = engine):
     """
         Creates all tables and the associated database view.
-        TODO use migration tools to manage schema changes
+        When the schema version recorded by the last run matches the declared schema, the DDL is skipped
+        (DB_SKIP_DDL_IF_CURRENT), which saves a round trip per table on every boot.
+        Tables that already exist are migrated by migrate_schema. The version is only recorded once the reflected
+        schema matches the models, so a database that still differs gets the DDL and the check again on every boot.
     """
+    version = schema_version(bind)
+    if settings.DB_SKIP_DDL_IF_CURRENT and _stored_schema_version(bind) == version:
+        print(f"Database schema is current (version {version}), skipping DDL.")
+        return
     # SQLAlchemy will trigger the DDL for the view automatically
     # because of the event listener defined in orm_models.py
-    Base.metadata.create_all(engine)
-    print("Database schema created (including view).")
\ No newline at end of file
+    Base.metadata.create_all(bind)
+    migrate_schema(bind)
+    _schema_metadata.create_all(bind)
+    drift = schema_drift(bind)
+    with bind.begin() as connection:
+        connection.execute(delete(schema_version_table))
+        if not drift:
+            connection.execute(insert(schema_version_table).values(version=version))
+    if drift:
+        print(f"Database schema differs from the models ({', '.join(drift)}), not recording version {version}.")
+        return
+    print(f"Database schema created (including view), version {version}.")
@@ -0,0 +1,23 @@
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(value) -> bytes:
+    """
+    Compact UTF-8 JSON of plain data (dicts, lists, strings, numbers, datetimes), with orjson when it is installed.
+    Datetimes are rendered as ISO 8601 like Pydantic renders them, so both paths produce the same documents.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
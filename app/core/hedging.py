@@ -0,0 +1,158 @@
+import itertools
+import queue
+import threading
+from typing import Any, Callable, Generic, Iterator, List, TypeVar
+
+from app.core.metrics import metrics
+
+T = TypeVar("T")
+
+PRIMARY = "primary"
+HEDGE = "hedge"
+
+
+class _Attempt(threading.Thread):
+    """Runs one request on its own thread and reports (attempt, result, error) once it has an answer."""
+
+    def __init__(self, label: str, start: Callable[[], Any], results: "queue.Queue[_Attempt]",
+                 discard: Callable[[Any], None]):
+        super().__init__(name=f"hedge-{label}", daemon=True)
+        self.label = label
+        self._start = start
+        self._results = results
+        self._discard = discard
+        self._lock = threading.Lock()
+        self.abandoned = False
+        self.result = None
+        self.error: BaseException | None = None
+
+    def run(self):
+        result, error = None, None
+        try:
+            result = self._start()
+        except BaseException as e:
+            error = e
+        with self._lock:
+            self.result, self.error = result, error
+            if self.abandoned:
+                if error is None:
+                    self._discard(result)
+                return
+        self._results.put(self)
+
+    def abandon(self):
+        with self._lock:
+            self.abandoned = True
+            result = self.result
+        if result is not None:
+            self._discard(result)
+
+
+def _race(primary: Callable[[], T], hedge: Callable[[], T], hedge_after: float, discard: Callable[[T], None],
+          name: str) -> T:
+    results: "queue.Queue[_Attempt]" = queue.Queue()
+    attempts = [_Attempt(PRIMARY, primary, results, discard)]
+    attempts[0].start()
+    metrics.inc("hedge_eligible_total", operation=name)
+    try:
+        finished = results.get(timeout=hedge_after)
+    except queue.Empty:
+        metrics.inc("hedge_fired_total", operation=name)
+        attempts.append(_Attempt(HEDGE, hedge, results, discard))
+        attempts[1].start()
+        finished = results.get()
+
+    # If the first attempt to finish failed, give the other one (if any) a chance
+    if finished.error is not None and len(attempts) == 2:
+        finished = results.get()
+    if finished.error is not None:
+        raise finished.error
+
+    for attempt in attempts:
+        if attempt is not finished:
+            attempt.abandon()
+    if len(attempts) == 2:
+        metrics.inc("hedge_wins_total", operation=name, winner=finished.label)
+    return finished.result
+
+
+def hedged_call(primary: Callable[[], T], hedge: Callable[[], T], hedge_after: float, name: str = "llm") -> T:
+    """
+    Start the primary request; if it has not answered within hedge_after seconds, also start the hedge.
+    Whichever answers first wins. A losing request cannot be interrupted, so its late result is dropped.
+    """
+    return _race(primary, hedge, hedge_after, discard=lambda _: None, name=name)
+
+
+def hedged_stream(primary: Callable[[], Iterator[T]], hedge: Callable[[], Iterator[T]], hedge_after: float,
+                  name: str = "llm") -> "HedgedStream[T]":
+    """
+    Streaming variant of hedged_call where answering means producing the first item.
+    The losing stream is closed as soon as the winner is known, or when it eventually connects.
+    """
+    return HedgedStream(primary, hedge, hedge_after, name)
+
+
+class HedgedStream(Generic[T]):
+    """
+    Iterates the winning stream of a hedged race, which starts on the first next().
+    Unlike a generator it may be closed from another thread while a read is blocked (e.g. on cancellation):
+    close() closes the stream of every attempt, including one that is still connecting.
+    """
+
+    def __init__(self, primary: Callable[[], Iterator[T]], hedge: Callable[[], Iterator[T]], hedge_after: float,
+                 name: str = "llm"):
+        self._primary = primary
+        self._hedge = hedge
+        self._hedge_after = hedge_after
+        self._name = name
+        self._lock = threading.Lock()
+        self._streams: List[Any] = []
+        self._closed = False
+        self._items: Iterator[T] | None = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> T:
+        if self._items is None:
+            _, head, iterator = _race(self._first_item(self._primary), self._first_item(self._hedge),
+                                      self._hedge_after, discard=lambda result: _close(result[0]), name=self._name)
+            self._items = itertools.chain(head, iterator)
+        try:
+            return next(self._items)
+        except StopIteration:
+            self.close()
+            raise
+
+    def _first_item(self, start: Callable[[], Iterator[T]]):
+        def run():
+            stream = self._opened(start())
+            iterator = iter(stream)
+            try:
+                return stream, [next(iterator)], iterator
+            except StopIteration:
+                return stream, [], iterator
+        return run
+
+    def _opened(self, stream):
+        """Remember a stream an attempt connected, or close it right away when the hedged stream is closed."""
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._streams.append(stream)
+        if closed:
+            _close(stream)
+        return stream
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            streams, self._streams = self._streams, []
+        for stream in streams:
+            _close(stream)
+
+
+def _close(stream):
+    if hasattr(stream, "close"):
+        stream.close()
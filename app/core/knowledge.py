@@ -0,0 +1,110 @@
+import os
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from app.core.config import settings
+from app.core.knowledge_index import KnowledgeSnapshot, knowledge_index
+from app.core.knowledge_sections import Section, find_section, index_sections
+
+# Number of section titles listed when output is truncated or a section is not found
+MAX_LISTED_SECTIONS = 50
+
+
+class KnowledgeError(Exception):
+    """A knowledge read that failed; the message is returned to the model as the tool output."""
+
+
+_section_lock = threading.Lock()
+# Section indexes of loose files, keyed by path and valid while the file's (mtime, size) is unchanged
+_section_indexes: Dict[str, Tuple[Tuple[int, int], List[Section]]] = {}
+
+
+def _loose_file_sections(path: str) -> List[Section]:
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _section_lock:
+        cached = _section_indexes.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with open(path, "rb") as f:
+        # Iterating the file indexes it line by line without holding all of it in memory
+        sections = index_sections(f)
+    with _section_lock:
+        _section_indexes[path] = (signature, sections)
+    return sections
+
+
+def _open_source(snapshot: KnowledgeSnapshot,
+                 file_name: str) -> Tuple[int, List[Section], Callable[[int, int], bytes]]:
+    """Size, section index and a (offset, length) -> bytes reader of a knowledge file."""
+    artifact = snapshot.artifact
+    if artifact is not None:
+        if file_name not in artifact.files:
+            raise KnowledgeError(f"Error: File '{file_name}' not found in the knowledge base.")
+        return (artifact.files[file_name]["length"], artifact.sections(file_name),
+                lambda offset, length: artifact.read_bytes(file_name, offset, length))
+
+    file_path = os.path.join(knowledge_index.directory, file_name)
+    if not os.path.exists(file_path):
+        raise KnowledgeError(f"Error: File '{file_name}' not found in the knowledge base.")
+    if os.path.isdir(file_path):
+        raise KnowledgeError(f"Error: '{file_name}' is a directory, not a file.")
+
+    def read(offset: int, length: int) -> bytes:
+        with open(file_path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    try:
+        stat = os.stat(file_path)
+        indexed = snapshot.files.get(file_name)
+        if indexed is not None and (indexed.mtime_ns, indexed.size) == (stat.st_mtime_ns, stat.st_size):
+            return stat.st_size, indexed.sections, read
+        # Changed since the last reload (or not watched): index it now
+        return stat.st_size, _loose_file_sections(file_path), read
+    except OSError as e:
+        raise KnowledgeError(f"Error reading file '{file_name}': {e}")
+
+
+def _section_list(sections: List[Section]) -> str:
+    titles = [section.title for section in sections[:MAX_LISTED_SECTIONS]]
+    if len(sections) > MAX_LISTED_SECTIONS:
+        titles.append(f"... ({len(sections) - MAX_LISTED_SECTIONS} more)")
+    return "; ".join(titles)
+
+
+def read_knowledge(file_name: str, section: str | None = None, max_bytes: int | None = None) -> str:
+    """
+    Read a knowledge file, or one of its sections, bounded to max_bytes (KNOWLEDGE_MAX_TOOL_OUTPUT_BYTES).
+    Only the bytes that are returned are read. Oversized content is cut at the last line break before the
+    limit (or at the limit when there is none nearby) and followed by a note listing the file's sections,
+    so the same request always gets the same output and the model can ask for the part it needs.
+    """
+    max_bytes = settings.KNOWLEDGE_MAX_TOOL_OUTPUT_BYTES if max_bytes is None else max_bytes
+    size, sections, read = _open_source(knowledge_index.current, file_name)
+
+    offset, length = 0, size
+    if section:
+        match = find_section(sections, section)
+        if match is None:
+            available = _section_list(sections) if sections else "none, read the whole file"
+            raise KnowledgeError(f"Error: Section '{section}' not found in '{file_name}'. "
+                                 f"Available sections: {available}")
+        offset, length = match.offset, match.length
+
+    try:
+        data = read(offset, min(length, max_bytes))
+    except OSError as e:
+        raise KnowledgeError(f"Error reading file '{file_name}': {e}")
+    if length <= max_bytes:
+        return data.decode("utf-8")
+
+    line_break = data.rfind(b"\n")
+    if line_break >= max_bytes * 3 // 4:
+        data = data[:line_break]
+    # A multi-byte character cut at the limit is dropped
+    content = data.decode("utf-8", errors="ignore")
+    note = f"\n\n[Truncated: showed {len(data)} of {length} bytes"
+    if sections and not section:
+        note += f". Read one section at a time with the section parameter. Sections: {_section_list(sections)}"
+    return content + note + "]"
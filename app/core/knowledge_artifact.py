@@ -0,0 +1,188 @@
+"""
+Compiled knowledge base: every file of KNOWLEDGE_BASE_DIR packed into one read-only binary artifact.
+
+Layout (all integers little-endian uint64):
+    header      magic, manifest offset/length, offsets table offset, passage count, text offset/length,
+                term index offset/length
+    manifest    JSON: format, version id, and per file its name, sha256, text offset/length, passage range and
+                section index (title, offset, length)
+    offsets     one (offset, length) pair per passage, relative to the text section
+    text        the UTF-8 contents of all files, back to back
+    term index  optional JSON object mapping each lowercased term to the ids of the passages containing it
+
+The artifact is mmap-ed, so all worker processes share the same physical pages and reading a file or a
+passage is a slice of the mapping. The version id is derived from the content hashes, so it changes exactly
+when the knowledge changes and can be used in cache keys.
+"""
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+from typing import Dict, Iterator, List, Tuple
+
+from app.core.knowledge_sections import Section, index_sections
+
+MAGIC = b"QNAKB\x00\x00\x01"
+FORMAT = 1
+_HEADER = struct.Struct("<8s8Q")
+_OFFSET = struct.Struct("<QQ")
+_TERM = re.compile(r"[a-z0-9]{2,}")
+# Passages are paragraphs: blocks separated by blank lines
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+def terms(text: str) -> List[str]:
+    return _TERM.findall(text.lower())
+
+
+def split_passages(text: str) -> List[Tuple[int, int]]:
+    """Character (start, end) spans of the paragraphs of a text, without surrounding whitespace."""
+    spans, start = [], 0
+    for end in [match.start() for match in _PARAGRAPH_BREAK.finditer(text)] + [len(text)]:
+        paragraph = text[start:end]
+        if paragraph.strip():
+            leading = len(paragraph) - len(paragraph.lstrip())
+            spans.append((start + leading, start + len(paragraph.rstrip())))
+        start = end
+    return spans
+
+
+def knowledge_version_id(hashes: Dict[str, str]) -> str:
+    """Version id of a set of knowledge files, from their names and content hashes."""
+    return hashlib.sha256(
+        "\n".join(f"{name}:{sha256}" for name, sha256 in sorted(hashes.items())).encode("utf-8")).hexdigest()[:16]
+
+
+def build_artifact(directory: str, output: str, with_index: bool = True) -> str:
+    """Compile the files of a knowledge directory into an artifact; returns its version id."""
+    files, offsets, text = [], [], bytearray()
+    index: Dict[str, List[int]] = {}
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            raw = f.read()
+        content = raw.decode("utf-8")
+        first_passage = len(offsets)
+        # Spans are stored in bytes so a passage is a plain slice of the mapping; they are ascending, so the byte
+        # offset is advanced from the end of the previous passage rather than re-encoding the file up to each one
+        position, byte_position = 0, len(text)
+        for start, end in split_passages(content):
+            passage = content[start:end]
+            byte_start = byte_position + len(content[position:start].encode("utf-8"))
+            byte_length = len(passage.encode("utf-8"))
+            offsets.append((byte_start, byte_length))
+            position, byte_position = end, byte_start + byte_length
+            if with_index:
+                for term in set(terms(passage)):
+                    index.setdefault(term, []).append(len(offsets) - 1)
+        files.append({
+            "name": name,
+            "sha256": hashlib.sha256(raw).hexdigest(),
+            "offset": len(text),
+            "length": len(raw),
+            "first_passage": first_passage,
+            "passage_count": len(offsets) - first_passage,
+            "sections": [list(section) for section in index_sections(raw.splitlines(keepends=True))],
+        })
+        text += raw
+
+    version_id = knowledge_version_id({file["name"]: file["sha256"] for file in files})
+    manifest = json.dumps({"format": FORMAT, "version_id": version_id, "files": files}).encode("utf-8")
+    table = b"".join(_OFFSET.pack(offset, length) for offset, length in offsets)
+    term_index = json.dumps(index, sort_keys=True).encode("utf-8") if with_index else b""
+
+    manifest_offset = _HEADER.size
+    table_offset = manifest_offset + len(manifest)
+    text_offset = table_offset + len(table)
+    index_offset = text_offset + len(text)
+    header = _HEADER.pack(MAGIC, manifest_offset, len(manifest), table_offset, len(offsets),
+                          text_offset, len(text), index_offset, len(term_index))
+
+    # Written next to the target and renamed, so a running app never maps a half-written file
+    temporary = f"{output}.tmp"
+    with open(temporary, "wb") as f:
+        for section in (header, manifest, table, text, term_index):
+            f.write(section)
+    os.replace(temporary, output)
+    return version_id
+
+
+class KnowledgeArtifact:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, manifest_offset, manifest_length, self._table_offset, self.passage_count,
+         self._text_offset, self._text_length, index_offset, index_length) = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a knowledge artifact")
+        manifest = json.loads(self._map[manifest_offset:manifest_offset + manifest_length])
+        if manifest["format"] != FORMAT:
+            raise ValueError(f"{path} has unsupported format {manifest['format']}")
+        self.version_id: str = manifest["version_id"]
+        self.files: Dict[str, dict] = {file["name"]: file for file in manifest["files"]}
+        self._index_span = (index_offset, index_length)
+        self._index: Dict[str, List[int]] | None = None
+
+    def close(self):
+        self._map.close()
+
+    def read(self, name: str) -> str | None:
+        file = self.files.get(name)
+        if file is None:
+            return None
+        start = self._text_offset + file["offset"]
+        return self._map[start:start + file["length"]].decode("utf-8")
+
+    def read_bytes(self, name: str, offset: int = 0, length: int | None = None) -> bytes:
+        """Raw bytes of a file, or of a range of it; only the range is copied out of the mapping."""
+        file = self.files[name]
+        length = file["length"] - offset if length is None else min(length, file["length"] - offset)
+        start = self._text_offset + file["offset"] + offset
+        return self._map[start:start + length]
+
+    def sections(self, name: str) -> List[Section]:
+        return [Section(*section) for section in self.files[name]["sections"]]
+
+    def passage(self, passage_id: int) -> str:
+        offset, length = _OFFSET.unpack_from(self._map, self._table_offset + passage_id * _OFFSET.size)
+        start = self._text_offset + offset
+        return self._map[start:start + length].decode("utf-8")
+
+    def passages(self, name: str) -> Iterator[str]:
+        file = self.files[name]
+        for passage_id in range(file["first_passage"], file["first_passage"] + file["passage_count"]):
+            yield self.passage(passage_id)
+
+    def file_of(self, passage_id: int) -> str:
+        for name, file in self.files.items():
+            if file["first_passage"] <= passage_id < file["first_passage"] + file["passage_count"]:
+                return name
+        raise IndexError(passage_id)
+
+    @property
+    def has_index(self) -> bool:
+        return self._index_span[1] > 0
+
+    def lookup(self, term: str) -> List[int]:
+        """Ids of the passages containing a term; empty when the artifact was built without an index."""
+        if self._index is None:
+            offset, length = self._index_span
+            # Parsed on first use so loading the artifact stays a constant-time mmap
+            self._index = json.loads(self._map[offset:offset + length]) if length else {}
+        return self._index.get(term.lower(), [])
+
+    def is_current(self, directory: str) -> bool:
+        """Whether the artifact was built from the files currently in a directory."""
+        names = sorted(name for name in os.listdir(directory) if os.path.isfile(os.path.join(directory, name)))
+        if names != sorted(self.files):
+            return False
+        for name in names:
+            with open(os.path.join(directory, name), "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() != self.files[name]["sha256"]:
+                    return False
+        return True
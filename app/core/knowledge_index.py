@@ -0,0 +1,188 @@
+import hashlib
+import logging
+import os
+import threading
+from typing import Dict, FrozenSet, List, NamedTuple, Set
+
+from app.core.cache import get_cache
+from app.core.config import settings
+from app.core.knowledge_artifact import KnowledgeArtifact, knowledge_version_id, terms
+from app.core.knowledge_sections import Section, index_sections
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class IndexedFile(NamedTuple):
+    name: str
+    sha256: str
+    size: int
+    # Stat signature the entry was indexed at; unchanged files are recognised without being read
+    mtime_ns: int
+    sections: List[Section]
+    terms: FrozenSet[str]
+
+
+def index_file(path: str, name: str) -> IndexedFile:
+    digest, file_terms = hashlib.sha256(), set()
+    with open(path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        for line in f:
+            digest.update(line)
+            file_terms.update(terms(line.decode("utf-8", errors="replace")))
+        f.seek(0)
+        sections = index_sections(f)
+    return IndexedFile(name, digest.hexdigest(), stat.st_size, stat.st_mtime_ns, sections, frozenset(file_terms))
+
+
+class KnowledgeSnapshot:
+    """
+    An immutable view of the knowledge base: the files with their content hashes, section index and terms,
+    and the compiled artifact when the knowledge is served from one. Readers keep the snapshot they started
+    with, so a reload never changes the knowledge under an in-flight request.
+    """
+
+    def __init__(self, files: Dict[str, IndexedFile], artifact: KnowledgeArtifact | None = None,
+                 source_signature: tuple | None = None):
+        self.files = files
+        self.artifact = artifact
+        self.source_signature = source_signature
+        self.hashes: Dict[str, str] = {name: file.sha256 for name, file in files.items()}
+        self.version_id = artifact.version_id if artifact is not None else knowledge_version_id(self.hashes)
+        self._vocabulary: Set[str] | None = None
+
+    def has_term(self, term: str) -> bool:
+        if self.artifact is not None:
+            return bool(self.artifact.lookup(term))
+        if self._vocabulary is None:
+            self._vocabulary = set().union(*(file.terms for file in self.files.values()))
+        return term.lower() in self._vocabulary
+
+    def changed_files(self, previous: "KnowledgeSnapshot | None") -> List[str]:
+        """Files added, changed or removed since a previous snapshot."""
+        old = previous.hashes if previous is not None else {}
+        return sorted(name for name in set(old) | set(self.hashes) if old.get(name) != self.hashes.get(name))
+
+
+def scan_directory(directory: str, previous: KnowledgeSnapshot | None = None) -> KnowledgeSnapshot:
+    """Snapshot of a directory, re-indexing only the files whose content changed since the previous snapshot."""
+    reused = previous.files if previous is not None and previous.artifact is None else {}
+    files = {}
+    for name in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path):
+            continue
+        stat = os.stat(path)
+        known = reused.get(name)
+        if known is not None and (known.mtime_ns, known.size) == (stat.st_mtime_ns, stat.st_size):
+            files[name] = known
+            continue
+        indexed = index_file(path, name)
+        if known is not None and known.sha256 == indexed.sha256:
+            # Touched but not changed
+            indexed = known._replace(mtime_ns=indexed.mtime_ns)
+        else:
+            metrics.inc("knowledge_files_indexed_total")
+        files[name] = indexed
+    return KnowledgeSnapshot(files)
+
+
+def _signature(path: str) -> tuple:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def load_artifact(path: str) -> KnowledgeSnapshot:
+    artifact = KnowledgeArtifact(path)
+    files = {
+        name: IndexedFile(name, file["sha256"], file["length"], 0, artifact.sections(name), frozenset())
+        for name, file in artifact.files.items()
+    }
+    return KnowledgeSnapshot(files, artifact, _signature(path))
+
+
+class KnowledgeIndex:
+    """
+    Holds the current knowledge snapshot and swaps in a new one when the knowledge changes.
+    The source is the compiled artifact when KNOWLEDGE_ARTIFACT_PATH is set (reloaded when the file is
+    replaced, e.g. by build_knowledge.py), otherwise the files of KNOWLEDGE_BASE_DIR. A watcher thread polls
+    the source; on a change only the affected files are re-indexed, the new snapshot replaces the old one in a
+    single reference assignment, and only the cache entries of the affected files are dropped.
+    """
+
+    def __init__(self, directory: str | None = None, artifact_path: str | None = None):
+        self._directory = directory
+        self._artifact_path = artifact_path
+        self._snapshot: KnowledgeSnapshot | None = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: threading.Thread | None = None
+
+    @property
+    def directory(self) -> str:
+        return self._directory if self._directory is not None else settings.KNOWLEDGE_BASE_DIR
+
+    @property
+    def artifact_path(self) -> str:
+        return self._artifact_path if self._artifact_path is not None else settings.KNOWLEDGE_ARTIFACT_PATH
+
+    @property
+    def current(self) -> KnowledgeSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.refresh()
+            snapshot = self._snapshot
+        return snapshot
+
+    def refresh(self) -> List[str]:
+        """Pick up changes of the source; returns the names of the files that changed."""
+        with self._refresh_lock:
+            previous = self._snapshot
+            if self.artifact_path:
+                if previous is not None and previous.source_signature == _signature(self.artifact_path):
+                    return []
+                snapshot = load_artifact(self.artifact_path)
+            else:
+                snapshot = scan_directory(self.directory, previous)
+            changed = snapshot.changed_files(previous)
+            if previous is not None and not changed and snapshot.artifact is None:
+                return []
+            # Old snapshots (and their mappings) are released once the last request using them is done
+            self._snapshot = snapshot
+        metrics.set_gauge("knowledge_files", len(snapshot.files))
+        if previous is not None and changed:
+            metrics.inc("knowledge_reloads_total")
+            self._invalidate(changed)
+        return changed
+
+    @staticmethod
+    def _invalidate(names: List[str]):
+        cache = get_cache()
+        for name in names:
+            cache.delete(f"knowledge:{name}")
+            cache.delete_prefix(f"knowledge:{name}#")
+
+    def start_watching(self, interval: float):
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="knowledge-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except Exception:
+                # A half-copied file or a missing directory must not kill the watcher; retry next round
+                metrics.inc("knowledge_reload_errors_total")
+                logger.exception("Knowledge reload failed")
+
+
+knowledge_index = KnowledgeIndex()
@@ -0,0 +1,51 @@
+import re
+from typing import Iterable, List, NamedTuple
+
+# A heading starts a section: a markdown heading, a bold title line ("1.  **Basic Plan:**", "*   **Sales:**"),
+# an FAQ question ("Q: ...") or a short label line ending with a colon ("QnA-Agent Pricing Plans:")
+_HEADING = re.compile(
+    r"^(?:#{1,6}\s+(?P<markdown>.+?)\s*#*"
+    r"|\s*(?:\d+\.\s+|[*-]\s+)?\*\*(?P<bold>[^*]+?):?\*\*:?"
+    r"|Q:\s*(?P<question>.+?)"
+    r"|(?P<label>[^\s*#>|-][^:]{0,78}):)\s*$"
+)
+
+
+class Section(NamedTuple):
+    title: str
+    # Byte offset and length within the file
+    offset: int
+    length: int
+
+
+def heading(line: str) -> str | None:
+    match = _HEADING.match(line)
+    if match is None:
+        return None
+    return next(title for title in match.groups() if title is not None).strip()
+
+
+def index_sections(lines: Iterable[bytes]) -> List[Section]:
+    """Sections of a file given as its lines (with line endings), so large files can be indexed as a stream."""
+    sections: List[Section] = []
+    title, start, offset = None, 0, 0
+    for line in lines:
+        line_title = heading(line.decode("utf-8", errors="replace").rstrip("\r\n"))
+        if line_title is not None:
+            if title is not None:
+                sections.append(Section(title, start, offset - start))
+            title, start = line_title, offset
+        offset += len(line)
+    if title is not None:
+        sections.append(Section(title, start, offset - start))
+    return sections
+
+
+def find_section(sections: List[Section], name: str) -> Section | None:
+    """The section titled name (case-insensitive), else the only section whose title contains it."""
+    wanted = name.strip().rstrip(":").lower()
+    for section in sections:
+        if section.title.lower() == wanted:
+            return section
+    matches = [section for section in sections if wanted in section.title.lower()]
+    return matches[0] if len(matches) == 1 else None
@@ -0,0 +1,272 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import List, TYPE_CHECKING
+
+from app.core.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.core.config import settings, LLMBackendSettings
+from app.core.metrics import metrics
+from app.core.retry_budget import RetryBudget
+
+if TYPE_CHECKING:
+    import openai
+
+
+def is_backend_failure(error: BaseException) -> bool:
+    """Errors that say something about the backend's health rather than about the request."""
+    import openai
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (openai.APIConnectionError, openai.APITimeoutError))
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Errors worth another attempt: backend failures and request timeouts."""
+    import openai
+    if isinstance(error, openai.APIStatusError) and error.status_code == 408:
+        return True
+    return is_backend_failure(error)
+
+
+def supports_stream_usage(azure_endpoint: str, api_version: str) -> bool:
+    """Azure API versions before 2024-09-01 reject stream_options; other OpenAI compatible endpoints accept it."""
+    return not azure_endpoint or api_version[:10] >= "2024-09-01"
+
+
+def _retry_after_header(error: BaseException) -> float | None:
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        # An HTTP date; fall back to the computed backoff
+        return None
+
+
+class LLMBackend:
+    def __init__(self, name: str, client: openai.OpenAI | openai.AzureOpenAI, model: str = "",
+                 breaker: CircuitBreaker | None = None, stream_usage: bool = True):
+        self.name = name
+        self.client = client
+        self.model = model
+        # Whether the backend accepts stream_options; when not, usage of streamed calls goes unaccounted
+        self.stream_usage = stream_usage
+        self.in_flight = 0
+        # Smoothed time to first token (streaming) or to full response (non-streaming), in seconds
+        self.latency: float | None = None
+        self.breaker = breaker
+
+
+class _TrackedStream:
+    """Wraps an upstream stream to measure time to first chunk and release the backend when done."""
+
+    def __init__(self, router: "LLMRouter", backend: LLMBackend, stream, started: float):
+        self._router = router
+        self._backend = backend
+        self._stream = stream
+        self._iterator = iter(stream)
+        self._started = started
+        self._first_chunk = True
+        self._finished = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            chunk = next(self._iterator)
+        except StopIteration:
+            self._finish(None)
+            raise
+        except Exception as e:
+            self._finish(e)
+            raise
+        if self._first_chunk:
+            self._first_chunk = False
+            self._router._record_latency(self._backend, time.monotonic() - self._started)
+        return chunk
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._finish(None)
+
+    def __del__(self):
+        # An abandoned stream must not count as outstanding forever; unread, it tells nothing about the backend
+        if not self._finished:
+            self._finished = True
+            self._router._abandon(self._backend)
+
+    def _finish(self, error: BaseException | None):
+        if not self._finished:
+            self._finished = True
+            self._router._release(self._backend, error)
+
+
+class LLMRouter:
+    """
+    Spreads chat completions over a pool of OpenAI-compatible backends.
+    Exposes the same chat.completions.create() surface as an OpenAI client, so services do not need to know
+    whether they talk to one endpoint or many. Each call goes to the backend with the lowest expected wait,
+    i.e. smoothed latency weighted by the number of outstanding requests, among the backends whose circuit
+    breaker lets calls through; when none does, the call fails fast with CircuitOpenError. Retryable errors are
+    retried up to max_attempts with jittered exponential backoff, as long as the shared retry budget allows.
+    """
+
+    def __init__(self, backends: List[LLMBackend], eject_after_failures: int = 3, eject_seconds: float = 30.0,
+                 latency_alpha: float = 0.3, half_open_probes: int = 1, max_attempts: int = 1,
+                 backoff: float = 0.25, max_backoff: float = 4.0, retry_budget: RetryBudget | None = None):
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        for backend in backends:
+            if backend.breaker is None:
+                backend.breaker = CircuitBreaker(backend.name, eject_after_failures, eject_seconds, half_open_probes)
+        self.backends = backends
+        self.latency_alpha = latency_alpha
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_budget = retry_budget
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _score(self, backend: LLMBackend, default_latency: float) -> float:
+        latency = backend.latency if backend.latency is not None else default_latency
+        return (backend.in_flight + 1) * latency
+
+    def acquire(self) -> LLMBackend:
+        """Pick a backend and count the request as outstanding on it."""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [b for b in self.backends if b.breaker.available(now)]
+            known = [b.latency for b in candidates if b.latency is not None]
+            default_latency = sum(known) / len(known) if known else 1.0
+            # A half-open breaker may have given away its trial calls; fall through to the next best backend
+            backend = next((b for b in sorted(candidates, key=lambda b: self._score(b, default_latency))
+                            if b.breaker.acquire(now)), None)
+            if backend is None:
+                metrics.inc("llm_circuit_rejections_total")
+                raise CircuitOpenError("All LLM backends are unavailable",
+                                       min(b.breaker.retry_after(now) for b in self.backends))
+            backend.in_flight += 1
+        metrics.set_gauge("llm_backend_in_flight", backend.in_flight, backend=backend.name)
+        return backend
+
+    def _record_latency(self, backend: LLMBackend, latency: float):
+        with self._lock:
+            if backend.latency is None:
+                backend.latency = latency
+            else:
+                backend.latency += self.latency_alpha * (latency - backend.latency)
+        metrics.observe("llm_backend_latency_seconds", latency, backend=backend.name)
+
+    def _release(self, backend: LLMBackend, error: BaseException | None):
+        with self._lock:
+            backend.in_flight -= 1
+        # Any answer, even a rejected request, shows the backend is up
+        if error is not None and is_backend_failure(error):
+            backend.breaker.record_failure()
+        else:
+            backend.breaker.record_success()
+        metrics.set_gauge("llm_backend_in_flight", backend.in_flight, backend=backend.name)
+        metrics.inc("llm_backend_requests_total", backend=backend.name,
+                    outcome="ok" if error is None else "error")
+
+    def _abandon(self, backend: LLMBackend):
+        """Release a request that ended without an outcome, returning its trial call to the breaker."""
+        with self._lock:
+            backend.in_flight -= 1
+        backend.breaker.release()
+        metrics.set_gauge("llm_backend_in_flight", backend.in_flight, backend=backend.name)
+        metrics.inc("llm_backend_requests_total", backend=backend.name, outcome="abandoned")
+
+    def create(self, **kwargs):
+        if self.retry_budget is not None:
+            self.retry_budget.record_request()
+        attempt = 1
+        while True:
+            try:
+                return self._create(dict(kwargs))
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+            metrics.inc("llm_retries_total")
+            time.sleep(delay)
+            attempt += 1
+
+    def _retry_delay(self, error: BaseException, attempt: int) -> float | None:
+        """Seconds to wait before retrying after a failed attempt, or None when it must not be retried."""
+        if attempt >= self.max_attempts or not is_retryable(error):
+            return None
+        # Full jitter: concurrent callers hit by the same incident spread their retries out
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        retry_after = _retry_after_header(error)
+        if retry_after is not None:
+            if retry_after > self.max_backoff:
+                # Not worth holding a worker for
+                return None
+            delay = max(delay, retry_after)
+        if self.retry_budget is not None and not self.retry_budget.try_spend():
+            return None
+        return delay
+
+    def _create(self, kwargs: dict):
+        backend = self.acquire()
+        if backend.model:
+            kwargs["model"] = backend.model
+        if not backend.stream_usage:
+            kwargs.pop("stream_options", None)
+        started = time.monotonic()
+        try:
+            response = backend.client.chat.completions.create(**kwargs)
+        except Exception as e:
+            self._release(backend, e)
+            raise
+        if kwargs.get("stream"):
+            return _TrackedStream(self, backend, response, started)
+        self._record_latency(backend, time.monotonic() - started)
+        self._release(backend, None)
+        return response
+
+
+def build_backend_client(config: LLMBackendSettings) -> openai.OpenAI | openai.AzureOpenAI:
+    import openai
+    # Retried by LLMRouter only, see create_client
+    api_key = config.api_key or settings.OPENAI_API_KEY
+    if config.azure_endpoint:
+        return openai.AzureOpenAI(
+            api_key=api_key,
+            api_version=config.api_version or settings.OPENAI_API_VERSION,
+            azure_endpoint=config.azure_endpoint,
+            max_retries=0
+        )
+    return openai.OpenAI(api_key=api_key, base_url=config.base_url or settings.OPENAI_BASE_URL, max_retries=0)
+
+
+def build_router(backends: List[LLMBackend]) -> LLMRouter:
+    return LLMRouter(
+        backends,
+        eject_after_failures=settings.LLM_BACKEND_EJECT_AFTER_FAILURES,
+        eject_seconds=settings.LLM_BACKEND_EJECT_SECONDS,
+        half_open_probes=settings.LLM_BACKEND_HALF_OPEN_PROBES,
+        max_attempts=settings.LLM_RETRY_MAX_ATTEMPTS,
+        backoff=settings.LLM_RETRY_BACKOFF_S,
+        max_backoff=settings.LLM_RETRY_MAX_BACKOFF_S,
+        retry_budget=RetryBudget(settings.LLM_RETRY_BUDGET_RATIO, settings.LLM_RETRY_BUDGET_MIN_PER_S),
+    )
+
+
+@lru_cache
+def get_llm_router() -> LLMRouter:
+    return build_router([
+        LLMBackend(name=config.name or f"backend-{index}", client=build_backend_client(config), model=config.model,
+                   stream_usage=supports_stream_usage(config.azure_endpoint,
+                                                      config.api_version or settings.OPENAI_API_VERSION))
+        for index, config in enumerate(settings.LLM_BACKENDS)
+    ])
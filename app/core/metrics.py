@@ -0,0 +1,88 @@
+import threading
+from collections import deque
+from typing import Dict
+
+
+def _key(name: str, labels: Dict[str, object]) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f'{label}="{value}"' for label, value in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+
+class _Summary:
+    def __init__(self, reservoir_size: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: deque[float] = deque(maxlen=reservoir_size)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self.samples)
+
+        def quantile(q: float) -> float:
+            return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "max": self.max,
+            "p50": quantile(0.5),
+            "p95": quantile(0.95),
+            "p99": quantile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics: counters, gauges and summaries over a window of recent samples.
+    Labels are folded into the metric key Prometheus-style, e.g. llm_requests{backend="azure-eu"}.
+    """
+
+    def __init__(self, reservoir_size: int = 1024):
+        self._lock = threading.Lock()
+        self._reservoir_size = reservoir_size
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._summaries: Dict[str, _Summary] = {}
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = _Summary(self._reservoir_size)
+            summary.observe(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": {key: summary.snapshot() for key, summary in self._summaries.items()},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,71 @@
+"""
+Model cascade: a cheap local classifier that decides whether a question can be answered by the fast model or
+needs the large one, and a check of the fast model's answer that escalates to the large model when it gave up.
+"""
+import re
+from typing import NamedTuple
+
+from app.core.knowledge_artifact import terms
+from app.core.knowledge_index import KnowledgeSnapshot
+
+FAST = "fast"
+LARGE = "large"
+
+# Requests for reasoning, comparison or several steps, which small models answer poorly
+_COMPLEX_MARKERS = re.compile(
+    r"\b(why|how come|compare|comparison|differences?|versus|vs|explain|analy[sz]e|step[- ]by[- ]step|"
+    r"pros and cons|trade-?offs?|recommend|should i|calculate|estimate)\b", re.IGNORECASE)
+# Openings of an answer in which the model gives up or hedges
+_UNCERTAIN_OPENINGS = re.compile(
+    r"^\W*(i'?m not sure|i am not sure|i don'?t know|i do not know|i don'?t have|i do not have|"
+    r"i can(not|'?t) (find|answer|help|determine)|i'?m unable|i am unable|unfortunately|sorry)", re.IGNORECASE)
+_STOPWORDS = frozenset(
+    "the and for are you your with what which who whom how can does did this that from have has was were will "
+    "about into there their them they our out get any all not but its is it of to in on at an as by or be do me my "
+    "we us if so".split())
+
+# Characters of a streamed fast answer held back until it is clear the answer does not need escalating
+PROBE_CHARS = 64
+
+
+class RoutingDecision(NamedTuple):
+    tier: str
+    reason: str
+
+
+def knowledge_coverage(question: str, snapshot: KnowledgeSnapshot) -> float | None:
+    """
+    Share of the question's content words found in the knowledge base, a proxy for how confidently a single
+    lookup answers it. None when the knowledge base cannot tell (empty, or an artifact without term index).
+    """
+    if not snapshot.files or (snapshot.artifact is not None and not snapshot.artifact.has_index):
+        return None
+    words = {word for word in terms(question) if word not in _STOPWORDS}
+    if not words:
+        return None
+    return sum(snapshot.has_term(word) for word in words) / len(words)
+
+
+def classify(question: str, snapshot: KnowledgeSnapshot, max_chars: int, min_coverage: float) -> RoutingDecision:
+    """Route short, single, factual questions the knowledge base covers to the fast tier, the rest to the large."""
+    if not question.strip():
+        return RoutingDecision(LARGE, "no_question")
+    if len(question) > max_chars:
+        return RoutingDecision(LARGE, "long")
+    if question.count("?") > 1:
+        return RoutingDecision(LARGE, "multiple_questions")
+    if _COMPLEX_MARKERS.search(question):
+        return RoutingDecision(LARGE, "complex")
+    coverage = knowledge_coverage(question, snapshot)
+    if coverage is not None and coverage < min_coverage:
+        return RoutingDecision(LARGE, "low_knowledge_coverage")
+    return RoutingDecision(FAST, "simple")
+
+
+def needs_escalation(answer: str | None) -> str | None:
+    """Why a fast answer should be redone by the large model, or None when it can be kept."""
+    if not answer or not answer.strip():
+        return "empty_answer"
+    if _UNCERTAIN_OPENINGS.search(answer[:PROBE_CHARS]):
+        return "uncertain_answer"
+    return None
@@ -1,15 +1,41 @@
-import openai
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
 from app.core.config import settings
+from app.core.llm_router import LLMBackend, LLMRouter, build_router, get_llm_router, supports_stream_usage
 
+if TYPE_CHECKING:
+    import openai
 
-def get_openai_client() -> openai.OpenAI | openai.AzureOpenAI:
+
+def create_client() -> openai.OpenAI | openai.AzureOpenAI:
+    # Imported here: the SDK is the slowest import of the app and is not needed until the first LLM call
+    import openai
+    # max_retries=0: LLMRouter retries within its budget, SDK retries underneath would multiply its attempts
     if settings.AZURE_ENDPOINT:
         return openai.AzureOpenAI(
             api_key=settings.OPENAI_API_KEY,
             api_version=settings.OPENAI_API_VERSION,
-            azure_endpoint=settings.AZURE_ENDPOINT
+            azure_endpoint=settings.AZURE_ENDPOINT,
+            max_retries=0
         )
     return openai.OpenAI(
         api_key=settings.OPENAI_API_KEY,
-        base_url=settings.OPENAI_BASE_URL
-    )
\ No newline at end of file
+        base_url=settings.OPENAI_BASE_URL,
+        max_retries=0
+    )
+
+
+@lru_cache
+def get_default_router() -> LLMRouter:
+    """A single endpoint is a one-backend router, so it gets the circuit breaker and retries too."""
+    stream_usage = supports_stream_usage(settings.AZURE_ENDPOINT, settings.OPENAI_API_VERSION)
+    return build_router([LLMBackend(name="default", client=create_client(), stream_usage=stream_usage)])
+
+
+def get_openai_client() -> LLMRouter:
+    if settings.LLM_BACKENDS:
+        return get_llm_router()
+    return get_default_router()
@@ -0,0 +1,40 @@
+import threading
+import time
+
+from app.core.metrics import metrics
+
+
+class RetryBudget:
+    """
+    Caps retries at a fraction of the request rate, so retrying cannot multiply the load on a provider that is
+    already struggling. Every request deposits ratio tokens and every retry spends one; min_per_second tokens
+    are added over time so that a quiet service can still retry now and then. Unspent tokens are capped at
+    max_tokens.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def record_request(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """Take one retry out of the budget; False when it is exhausted."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < 1:
+                metrics.inc("llm_retry_budget_exhausted_total")
+                return False
+            self._tokens -= 1
+            return True
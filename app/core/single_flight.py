@@ -0,0 +1,117 @@
+import hashlib
+import json
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, TypeVar
+
+from app.core.broadcast import Broadcast
+from app.core.cancellation import CancellationToken
+
+T = TypeVar("T")
+
+
+def fingerprint(payload: Any) -> str:
+    """Stable hash of a JSON-serializable request payload."""
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.finished = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+
+class _SharedStream:
+    def __init__(self):
+        self.broadcast: Broadcast | None = None
+        # Cancelled once every caller has stopped listening
+        self.cancellation = CancellationToken()
+        self.listeners = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key so only one of them reaches the underlying function.
+    Waiters that arrive while a call is in flight get the leader's result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _SharedStream] = {}
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.finished.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.finished.set()
+
+    def stream(self, key: str, fn: Callable[[CancellationToken], Iterable[T]],
+               cancellation: CancellationToken | None = None) -> Iterator[T]:
+        """
+        Share one upstream iterable between concurrent callers; every caller receives every item.
+        The upstream is handed a token that is cancelled once no caller is listening any more, i.e. every caller
+        was cancelled or stopped iterating; callers arriving after that start a new upstream.
+        """
+        with self._lock:
+            shared = self._streams.get(key)
+            if shared is None:
+                shared = self._streams[key] = _SharedStream()
+                shared.broadcast = Broadcast(lambda: self._forget_when_done(key, shared, fn(shared.cancellation)),
+                                             name=f"single-flight-{key[:8]}")
+                shared.broadcast.start()
+            shared.listeners += 1
+
+        released = []
+
+        def release():
+            with self._lock:
+                if released:
+                    return
+                released.append(True)
+                shared.listeners -= 1
+                abandoned = shared.listeners == 0 and not shared.broadcast.done
+                if abandoned and self._streams.get(key) is shared:
+                    del self._streams[key]
+            if abandoned:
+                shared.cancellation.cancel()
+
+        # A cancelled caller may be waiting for the next item; releasing it right away closes an upstream
+        # nobody else listens to
+        unregister = cancellation.on_cancel(release) if cancellation is not None else None
+        try:
+            for _, item in shared.broadcast.subscribe():
+                if cancellation is not None and cancellation.cancelled:
+                    break
+                yield item
+        finally:
+            if unregister is not None:
+                unregister()
+            release()
+
+    def _forget_when_done(self, key: str, shared: _SharedStream, items: Iterable[T]) -> Iterator[T]:
+        try:
+            yield from items
+        finally:
+            with self._lock:
+                if self._streams.get(key) is shared:
+                    del self._streams[key]
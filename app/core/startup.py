@@ -0,0 +1,134 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from importlib.abc import MetaPathFinder
+from typing import Dict, List
+
+# Read from the environment directly: the profiler has to be installed before app.core.config (and pydantic) load
+PROFILE_ENV_VAR = "STARTUP_PROFILE"
+
+
+class _TimedLoader:
+    """Proxies a module loader and times its exec_module, i.e. the execution of the module body."""
+
+    def __init__(self, loader, profiler: "StartupProfiler"):
+        self._loader = loader
+        self._profiler = profiler
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        # Hand the real loader back to the module so nothing else sees the proxy
+        module.__loader__ = self._loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self._loader
+        self._profiler._enter_import(module.__name__)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._profiler._exit_import(module.__name__)
+
+
+class _TimingFinder(MetaPathFinder):
+    def __init__(self, profiler: "StartupProfiler"):
+        self._profiler = profiler
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self._profiler)
+                return spec
+        return None
+
+
+class StartupProfiler:
+    """
+    Measures where startup time goes: the time spent executing each imported module (cumulative, and
+    self time excluding the modules it imported) and the duration of named startup phases such as init_db.
+    Import timing is only collected when the profiler is installed, which main does when STARTUP_PROFILE is set.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.enabled = False
+        self.phases: Dict[str, float] = {}
+        self.imports: Dict[str, float] = {}
+        self.import_self: Dict[str, float] = {}
+        self._stack: List[list] = []
+        self._thread_id: int | None = None
+        self._finder: _TimingFinder | None = None
+
+    def install(self) -> bool:
+        """Start timing imports if STARTUP_PROFILE is set; returns whether profiling is on."""
+        if os.environ.get(PROFILE_ENV_VAR, "").lower() not in ("1", "true", "yes"):
+            return False
+        self.enabled = True
+        self._thread_id = threading.get_ident()
+        self._finder = _TimingFinder(self)
+        sys.meta_path.insert(0, self._finder)
+        return True
+
+    def uninstall(self):
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+        self._finder = None
+
+    def _enter_import(self, name: str):
+        if threading.get_ident() == self._thread_id:
+            self._stack.append([name, time.perf_counter(), 0.0])
+
+    def _exit_import(self, name: str):
+        if threading.get_ident() != self._thread_id or not self._stack or self._stack[-1][0] != name:
+            return
+        _, started, children = self._stack.pop()
+        elapsed = time.perf_counter() - started
+        self.imports[name] = elapsed
+        self.import_self[name] = elapsed - children
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - started
+
+    def mark(self, name: str):
+        """Record the time from process start (profiler creation) to now as a phase."""
+        self.phases[name] = time.perf_counter() - self.started
+
+    def report(self, top: int = 25) -> dict:
+        slowest = sorted(self.import_self.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {
+            "enabled": self.enabled,
+            "phases_ms": {name: seconds * 1000 for name, seconds in self.phases.items()},
+            "modules_imported": len(self.imports),
+            "slowest_imports_ms": [
+                {"module": name, "self": seconds * 1000, "cumulative": self.imports[name] * 1000}
+                for name, seconds in slowest
+            ],
+        }
+
+    def print_report(self, top: int = 25):
+        report = self.report(top)
+        print("Startup profile:")
+        for name, ms in report["phases_ms"].items():
+            print(f"  {name:<40} {ms:10.1f} ms")
+        print(f"  {report['modules_imported']} modules imported, slowest by self time:")
+        for entry in report["slowest_imports_ms"]:
+            print(f"  {entry['module']:<40} {entry['self']:10.1f} ms self {entry['cumulative']:10.1f} ms cumulative")
+
+
+startup_profiler = StartupProfiler()
@@ -1,21 +1,63 @@
 import datetime
 
 from app.core.database import Base
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, JSON, LargeBinary, Boolean, and_, false, \
+    func, or_
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import deferred, relationship
 
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
     id = Column(Integer, primary_key=True, index=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Last time a message was written to (or restored into) the session; idle sessions are archived
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
     messages = relationship("Message", back_populates="session", cascade="all, delete-orphan")
+    archive = relationship("ArchivedSession", back_populates="session", uselist=False, cascade="all, delete-orphan")
 
 class Message(Base):
     __tablename__ = "messages"
     id = Column(Integer, primary_key=True, index=True)
-    session_id = Column(Integer, ForeignKey("chat_sessions.id"))
+    session_id = Column(Integer, ForeignKey("chat_sessions.id"), index=True)
     role = Column(String)
     content = Column(String)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Tool round-trips are stored as an assistant message listing its calls ({id, name, arguments}), followed by
+    # one "tool" message per call holding its output, so later turns can replay them instead of calling again
+    tool_calls = Column(JSON(none_as_null=True), nullable=True)
+    tool_call_id = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    # Cost and latency of generating an assistant message, summed over the LLM calls of the turn
+    model = Column(String, nullable=True)
+    llm_calls = Column(Integer, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    cached_tokens = Column(Integer, nullable=True)
+    ttft_ms = Column(Float, nullable=True)
+    duration_ms = Column(Float, nullable=True)
+    # Set on an assistant message whose generation was cancelled because the client disconnected
+    interrupted = Column(Boolean, nullable=False, default=False, server_default=false())
     session = relationship("ChatSession", back_populates="messages")
+
+    @hybrid_property
+    def internal(self) -> bool:
+        """Tool results and assistant messages that only carry tool calls: replayed to the LLM, not shown to clients."""
+        return self.role == "tool" or (self.tool_calls is not None and not self.content)
+
+    @internal.expression
+    def internal(cls):
+        return or_(cls.role == "tool", and_(cls.tool_calls.is_not(None), func.coalesce(cls.content, "") == ""))
+
+
+class ArchivedSession(Base):
+    """The messages of an idle session, moved out of the messages table into one compressed blob."""
+    __tablename__ = "archived_sessions"
+    session_id = Column(Integer, ForeignKey("chat_sessions.id"), primary_key=True)
+    codec = Column(String)
+    message_count = Column(Integer)
+    # Size of the serialised messages before compression
+    raw_bytes = Column(Integer)
+    # Only loaded when the session is rehydrated, so checking whether a session is archived stays cheap
+    data = deferred(Column(LargeBinary))
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
+    session = relationship("ChatSession", back_populates="archive")
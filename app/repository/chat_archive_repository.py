@@ -0,0 +1,126 @@
+import datetime
+import json
+from typing import Annotated, Dict, Iterable, List
+
+from fastapi import Depends
+from sqlalchemy import DateTime, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, undefer
+
+from app.core.blob_codec import compress, decompress
+from app.core.database import get_db, get_read_db, read_session
+from app.core.metrics import metrics
+from app.model.chat_models import ArchivedSession, ChatSession, Message
+
+# Every message column except the session it belongs to, which is the archive's key
+_ARCHIVED_COLUMNS = [column for column in Message.__table__.columns if column.name != "session_id"]
+
+
+def encode_messages(messages: Iterable[Message]) -> bytes:
+    rows = []
+    for message in messages:
+        row = {}
+        for column in _ARCHIVED_COLUMNS:
+            value = getattr(message, column.name)
+            row[column.name] = value.isoformat() if isinstance(value, datetime.datetime) else value
+        rows.append(row)
+    return json.dumps(rows, separators=(",", ":")).encode("utf-8")
+
+
+def decode_messages(data: bytes, session_id: int) -> List[Message]:
+    """Transient Message entities, with their original ids, from a blob written by encode_messages."""
+    messages = []
+    for row in json.loads(data):
+        for column in _ARCHIVED_COLUMNS:
+            if column.name not in row and column.default is not None and column.default.is_scalar:
+                # Archived before the column existed
+                row[column.name] = column.default.arg
+            if isinstance(column.type, DateTime) and row.get(column.name) is not None:
+                row[column.name] = datetime.datetime.fromisoformat(row[column.name])
+        messages.append(Message(session_id=session_id, **row))
+    return messages
+
+
+class ChatArchiveRepository:
+    """
+    Cold storage for idle sessions: their messages are moved out of the messages table into one compressed blob
+    per session (archived_sessions), and moved back when the session is read or written again.
+    """
+
+    def __init__(self, db: Session = Depends(get_db), read_db: Annotated[Session | None, Depends(get_read_db)] = None):
+        self._session = db
+        self._read_db = read_db
+
+    @property
+    def _reader(self) -> Session:
+        return read_session(self._session, self._read_db)
+
+    def get_idle_session_ids(self, idle_before: datetime.datetime, limit: int = 100) -> List[int]:
+        """Sessions with messages in the hot table and no activity since idle_before, least recently used first."""
+        last_active = func.coalesce(ChatSession.updated_at, ChatSession.created_at)
+        rows = self._session.query(ChatSession.id) \
+            .filter(last_active < idle_before, ChatSession.id.in_(select(Message.session_id))) \
+            .order_by(last_active).limit(limit).all()
+        return [row.id for row in rows]
+
+    def archive(self, session_id: int, idle_before: datetime.datetime) -> bool:
+        """
+        Move a session's messages into its archive blob, provided it is still idle; returns whether it was archived.
+        Messages written concurrently stay in the hot table, since only the messages read here are deleted.
+        """
+        last_active = func.coalesce(ChatSession.updated_at, ChatSession.created_at)
+        # Claims the session row (a row lock where the database has them) while it is still idle
+        claimed = self._session.query(ChatSession).filter(ChatSession.id == session_id, last_active < idle_before) \
+            .update({ChatSession.updated_at: last_active}, synchronize_session=False)
+        messages = self._session.query(Message).filter_by(session_id=session_id).order_by(Message.id).all()
+        if not claimed or not messages:
+            self._session.rollback()
+            return False
+
+        archive = self._session.get(ArchivedSession, session_id)
+        if archive is not None:
+            # Messages written while the session was archived without reading it first; merged into the blob
+            messages = decode_messages(decompress(archive.codec, archive.data), session_id) + messages
+        else:
+            archive = ArchivedSession(session_id=session_id)
+            self._session.add(archive)
+        raw = encode_messages(messages)
+        archive.codec, archive.data = compress(raw)
+        archive.message_count, archive.raw_bytes = len(messages), len(raw)
+        archive.archived_at = datetime.datetime.utcnow()
+        self._session.query(Message).filter(Message.id.in_([message.id for message in messages])) \
+            .delete(synchronize_session=False)
+        self._session.commit()
+        metrics.inc("sessions_archived_total")
+        metrics.inc("archive_raw_bytes_total", len(raw))
+        metrics.inc("archive_compressed_bytes_total", len(archive.data))
+        return True
+
+    def rehydrate(self, session_id: int) -> bool:
+        """Move an archived session's messages back into the messages table; returns whether it was archived."""
+        if self._reader.get(ArchivedSession, session_id) is None:
+            return False
+        archive = self._session.get(ArchivedSession, session_id)
+        if archive is None:
+            # Rehydrated by another request since the replica was read
+            return True
+        messages = decode_messages(decompress(archive.codec, archive.data), session_id)
+        self._session.add_all(messages)
+        self._session.delete(archive)
+        self._session.query(ChatSession).filter_by(id=session_id) \
+            .update({ChatSession.updated_at: datetime.datetime.utcnow()}, synchronize_session=False)
+        try:
+            self._session.commit()
+        except IntegrityError:
+            # A concurrent request restored the same messages first
+            self._session.rollback()
+            return True
+        metrics.inc("sessions_rehydrated_total")
+        return True
+
+    def get_archived_messages(self, session_ids: Iterable[int]) -> Dict[int, List[Message]]:
+        """Messages of the archived sessions among session_ids, decoded without restoring them."""
+        archives = self._reader.query(ArchivedSession).options(undefer(ArchivedSession.data)) \
+            .filter(ArchivedSession.session_id.in_(set(session_ids))).all()
+        return {archive.session_id: decode_messages(decompress(archive.codec, archive.data), archive.session_id)
+                for archive in archives}
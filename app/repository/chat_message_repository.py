@@ -1,26 +1,155 @@
-from typing import List, Type
+import datetime
+from contextlib import contextmanager
+from itertools import dropwhile
+from typing import Annotated, Iterable, Iterator, List, Set, Type
 
 from fastapi import Depends
+from sqlalchemy import Row, func, select
 from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.model.chat_models import Message
+from app.core.database import WROTE_PRIMARY, get_db, get_read_db, read_session
+from app.model.chat_models import ChatSession, Message
+from app.repository.chat_archive_repository import ChatArchiveRepository
+from app.repository.chat_session_repository import ChatSessionRepository
 
 
 class ChatMessageRepository:
-    def __init__(self, db: Session = Depends(get_db)):
+    def __init__(self, db: Session = Depends(get_db), read_db: Annotated[Session | None, Depends(get_read_db)] = None):
         self._session = db
+        self._read_db = read_db
+
+    @property
+    def _reader(self) -> Session:
+        return read_session(self._session, self._read_db)
+
+    @contextmanager
+    def detached(self):
+        """
+        A repository on new sessions against the same databases, for work that outlives the request. It reads
+        from the primary if this one has written, so the work sees what the request wrote.
+        """
+        db = Session(bind=self._session.get_bind(), autoflush=False,
+                     info={WROTE_PRIMARY: bool(self._session.info.get(WROTE_PRIMARY))})
+        read_db = Session(bind=self._read_db.get_bind(), autoflush=False) if self._read_db is not None else None
+        try:
+            yield ChatMessageRepository(db=db, read_db=read_db)
+        finally:
+            db.close()
+            if read_db is not None:
+                read_db.close()
+
+    def rehydrate(self, session_id: int) -> bool:
+        """Restore the session's messages if it was archived; call before reading or extending its conversation."""
+        return ChatArchiveRepository(db=self._session, read_db=self._read_db).rehydrate(session_id)
+
+    def get_session_version(self, session_id: int) -> tuple | None:
+        return ChatSessionRepository(db=self._session, read_db=self._read_db).get_version(session_id)
 
     def get_by_session_id(self, session_id: int, skip: int = 0, limit: int = 100) -> List[Type[Message]]:
-        return self._session.query(Message).filter_by(session_id = session_id).offset(skip).limit(limit).all()
+        """The messages of a session shown to clients, i.e. without the internal tool call ones."""
+        self.rehydrate(session_id)
+        return self._reader.query(Message).filter_by(session_id = session_id).filter(~Message.internal) \
+            .offset(skip).limit(limit).all()
+
+    def get_rows_by_session_id(self, session_id: int, columns: List[str], skip: int = 0,
+                               limit: int = 100) -> List[Row]:
+        """
+        The given columns of a session's messages shown to clients as plain rows, oldest first, for serializing them
+        directly.
+        """
+        self.rehydrate(session_id)
+        statement = select(*(getattr(Message, column) for column in columns)) \
+            .where(Message.session_id == session_id, ~Message.internal).order_by(Message.id).offset(skip).limit(limit)
+        return self._reader.execute(statement).all()
+
+    def iter_history(self, session_id: int, max_messages: int = 0, batch_size: int = 500) -> Iterator[Row]:
+        """
+        The conversation of a session for the LLM, oldest first, as read-only (role, content, tool_calls,
+        tool_call_id) rows: no entities, identity map or change tracking. Rows are fetched batch_size at a time
+        from a server-side cursor (yield_per implies stream_results), so huge sessions are never buffered whole.
+        With max_messages, only the most recent ones are read, starting at a user message so the window never
+        opens inside a turn (with tool results whose call was cut off); 0 reads the whole conversation.
+        """
+        statement = select(Message.role, Message.content, Message.tool_calls, Message.tool_call_id) \
+            .where(Message.session_id == session_id).order_by(Message.id).execution_options(yield_per=batch_size)
+        if not max_messages:
+            yield from self._reader.execute(statement)
+            return
+        window = select(Message.id).where(Message.session_id == session_id) \
+            .order_by(Message.id.desc()).limit(max_messages).subquery()
+        rows = self._reader.execute(statement.where(Message.id >= select(func.min(window.c.id)).scalar_subquery()))
+        yield from dropwhile(lambda row: row.role != "user", rows)
 
     def create(self, message: Message) -> Message:
         self._session.add(message)
+        self._touch([message])
         self._session.commit()
         self._session.refresh(message)
         return message
 
+    def create_all(self, messages: List[Message]) -> List[Message]:
+        """Persist many messages in a single transaction, without refreshing them one by one."""
+        self._session.add_all(messages)
+        self._touch(messages)
+        self._session.commit()
+        return messages
+
+    def create_turn(self, messages: List[Message]) -> Message:
+        """Persist the messages of one turn (tool calls, their results and the answer) in one transaction."""
+        self._session.add_all(messages)
+        self._touch(messages)
+        self._session.commit()
+        self._session.refresh(messages[-1])
+        return messages[-1]
+
+    def _touch(self, messages: List[Message]):
+        """Mark the sessions of written messages as active, so they are not archived while in use."""
+        self._session.query(ChatSession).filter(ChatSession.id.in_({message.session_id for message in messages})) \
+            .update({ChatSession.updated_at: datetime.datetime.utcnow()}, synchronize_session=False)
+
+    def get_existing_session_ids(self, session_ids: Iterable[int]) -> Set[int]:
+        rows = self._session.query(ChatSession.id).filter(ChatSession.id.in_(set(session_ids))).all()
+        return {row.id for row in rows}
+
     def update(self, message: Message) -> Message:
         self._session.add(message)
+        self._touch([message])
         self._session.commit()
         self._session.refresh(message)
         return message
+
+
+    def get_usage(self, session_id: int | None = None, start: datetime.datetime | None = None,
+                  end: datetime.datetime | None = None) -> dict:
+        """Aggregate usage of the assistant messages of a session and/or a created_at range [start, end)."""
+        row = self._usage_query(start, end, *self._usage_columns()) \
+            .filter(*([Message.session_id == session_id] if session_id is not None else [])).one()
+        return row._asdict()
+
+    def get_usage_by_session(self, start: datetime.datetime | None = None, end: datetime.datetime | None = None,
+                             limit: int = 10) -> List[dict]:
+        tokens = func.coalesce(func.sum(Message.prompt_tokens), 0) + func.coalesce(func.sum(Message.completion_tokens), 0)
+        rows = self._usage_query(start, end, Message.session_id, *self._usage_columns()) \
+            .group_by(Message.session_id).order_by(tokens.desc()).limit(limit).all()
+        return [row._asdict() for row in rows]
+
+    def _usage_query(self, start: datetime.datetime | None, end: datetime.datetime | None, *columns):
+        # Assistant messages that only carry tool calls are part of the turn their answer accounts for
+        query = self._reader.query(*columns).filter(Message.role == "assistant", Message.tool_calls.is_(None))
+        if start is not None:
+            query = query.filter(Message.created_at >= start)
+        if end is not None:
+            query = query.filter(Message.created_at < end)
+        return query
+
+    @staticmethod
+    def _usage_columns():
+        return (
+            func.count(Message.id).label("messages"),
+            func.coalesce(func.sum(Message.llm_calls), 0).label("llm_calls"),
+            func.coalesce(func.sum(Message.prompt_tokens), 0).label("prompt_tokens"),
+            func.coalesce(func.sum(Message.completion_tokens), 0).label("completion_tokens"),
+            func.coalesce(func.sum(Message.cached_tokens), 0).label("cached_tokens"),
+            func.avg(Message.ttft_ms).label("avg_ttft_ms"),
+            func.avg(Message.duration_ms).label("avg_duration_ms"),
+            func.max(Message.duration_ms).label("max_duration_ms"),
+        )
@@ -1,18 +1,40 @@
+from typing import Annotated, Dict, Iterable, List
+
 from fastapi import Depends, HTTPException
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.model.chat_models import ChatSession
+from app.core.database import get_db, get_read_db, read_session
+from app.model.chat_models import ChatSession, Message
+from app.repository.chat_archive_repository import ChatArchiveRepository
 
 
 class ChatSessionRepository:
-    def __init__(self, db: Session = Depends(get_db)):
+    def __init__(self, db: Session = Depends(get_db), read_db: Annotated[Session | None, Depends(get_read_db)] = None):
         self._session = db
+        self._read_db = read_db
+
+    @property
+    def _reader(self) -> Session:
+        return read_session(self._session, self._read_db)
 
     def get(self, skip: int = 0, limit: int = 100) -> list[type[ChatSession]]:
-        return self._session.query(ChatSession).offset(skip).limit(limit).all()
+        return self._reader.query(ChatSession).offset(skip).limit(limit).all()
+
+    def get_version(self, session_id: int) -> tuple | None:
+        """
+        (updated_at, id of the last message) of a session, without loading it or its messages; None if it does not
+        exist. Changes whenever a message of the session is written.
+        """
+        last_message_id = select(func.max(Message.id)).where(Message.session_id == session_id).scalar_subquery()
+        row = self._reader.query(ChatSession.updated_at, last_message_id).filter(ChatSession.id == session_id).first()
+        return tuple(row) if row is not None else None
+
+    def get_archived_messages(self, session_ids: Iterable[int]) -> Dict[int, List[Message]]:
+        return ChatArchiveRepository(db=self._session, read_db=self._read_db).get_archived_messages(session_ids)
 
     def get_by_id(self, session_id: int) -> type[ChatSession] | None:
-        chat_session = self._session.query(ChatSession).filter_by(id = session_id).first()
+        ChatArchiveRepository(db=self._session, read_db=self._read_db).rehydrate(session_id)
+        chat_session = self._reader.query(ChatSession).filter_by(id = session_id).first()
         if chat_session is None:
             raise HTTPException(status_code=404, detail="Chat session not found")
         return chat_session
@@ -1,5 +1,5 @@
 import datetime
-from typing import Literal, Union
+from typing import List, Literal, Optional, Union
 
 from pydantic import BaseModel, Field
 
@@ -13,10 +13,35 @@ class MessageCreate(MessageBase):
     pass
 
 
-class Message(MessageBase):
+class ToolCall(BaseModel):
+    id: str
+    name: str
+    # JSON-encoded arguments, as produced by the model
+    arguments: str
+
+
+class HistoryMessage(MessageBase):
+    """A message of the conversation as replayed to the LLM, including persisted tool calls and their results."""
+    # Set on assistant messages that called tools
+    tool_calls: Optional[List[ToolCall]] = None
+    # Set on tool messages: the call they answer
+    tool_call_id: Optional[str] = None
+
+
+class Message(HistoryMessage):
     id: int
     session_id: int
     created_at: datetime.datetime
+    # Set on assistant messages: what generating them cost and how long it took
+    model: Optional[str] = None
+    llm_calls: Optional[int] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    cached_tokens: Optional[int] = None
+    ttft_ms: Optional[float] = None
+    duration_ms: Optional[float] = None
+    # The answer was cut short because the client disconnected while it was generated
+    interrupted: bool = False
 
     class Config:
         from_attributes = True
@@ -39,3 +64,21 @@ class StreamToolEnd(BaseModel):
 
 
 StreamEvent = Union[StreamContent, StreamToolStart, StreamToolEnd]
+
+
+# Batch models
+class BatchQuestion(BaseModel):
+    content: str
+    # Questions bound to a session see its history and are persisted to it; unbound ones are answered statelessly
+    session_id: Optional[int] = None
+
+
+class BatchRequest(BaseModel):
+    questions: List[BatchQuestion] = Field(min_length=1)
+
+
+class BatchResult(BaseModel):
+    index: int
+    session_id: Optional[int] = None
+    content: Optional[str] = None
+    error: Optional[str] = None
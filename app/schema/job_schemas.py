@@ -0,0 +1,26 @@
+import datetime
+from typing import Literal, Optional
+
+from pydantic import BaseModel
+
+JobStatus = Literal["queued", "running", "retrying", "succeeded", "failed"]
+
+
+class StreamJobStatus(BaseModel):
+    """Job event sent whenever the job changes state. "retrying" means the content streamed so far is discarded."""
+    type: Literal["status"]
+    status: JobStatus
+    attempt: int
+    error: Optional[str] = None
+    message_id: Optional[int] = None
+
+
+class GenerationJob(BaseModel):
+    job_id: str
+    session_id: int
+    status: JobStatus
+    attempts: int
+    content: str
+    message_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: datetime.datetime
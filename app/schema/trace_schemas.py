@@ -0,0 +1,48 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class LLMCallTrace(BaseModel):
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    ttft_ms: Optional[float] = None
+    duration_ms: float = 0.0
+
+
+class ToolCallTrace(BaseModel):
+    name: str
+    arguments: str
+    id: Optional[str] = None
+    output: Optional[str] = None
+
+
+class TurnTrace(BaseModel):
+    """What it took to answer one turn: the LLM calls made, the tools called and the knowledge files read."""
+    calls: List[LLMCallTrace] = []
+    tool_calls: List[ToolCallTrace] = []
+    knowledge_files: List[str] = []
+    # True when the turn was served by another identical in-flight request, so no calls were made for it
+    coalesced: bool = False
+    # True when the answer came from the shared answer cache, so no calls were made for it
+    answer_cached: bool = False
+    # Model cascade: the tier that answered, why the turn was routed to its first tier, why it was escalated
+    # from the fast tier (if it was) and the time spent on each tier
+    tier: Optional[str] = None
+    routing_reason: Optional[str] = None
+    escalation_reason: Optional[str] = None
+    tier_ms: Dict[str, float] = {}
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(call.prompt_tokens for call in self.calls)
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(call.completion_tokens for call in self.calls)
+
+    @property
+    def cached_tokens(self) -> int:
+        return sum(call.cached_tokens for call in self.calls)
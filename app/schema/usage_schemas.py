@@ -0,0 +1,28 @@
+import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class UsageSummary(BaseModel):
+    """Token usage and latency summed (or averaged) over assistant messages."""
+    messages: int = 0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    avg_ttft_ms: Optional[float] = None
+    avg_duration_ms: Optional[float] = None
+    max_duration_ms: Optional[float] = None
+
+
+class SessionUsage(UsageSummary):
+    session_id: int
+
+
+class UsageReport(BaseModel):
+    start: Optional[datetime.datetime] = None
+    end: Optional[datetime.datetime] = None
+    total: UsageSummary
+    # The most expensive sessions of the range, by prompt + completion tokens
+    sessions: List[SessionUsage]
@@ -1,12 +1,28 @@
-from typing import Annotated, List, Type, Generator
+import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Annotated, Iterable, List, Type, Generator
 
-from fastapi import Depends
+from fastapi import Depends, HTTPException
 
-from app.schema.chat_message_schemas import MessageBase, StreamEvent, StreamContent, StreamToolStart, StreamToolEnd
+from app.core.admission import llm_admission
+from app.core.cancellation import CancellationToken
+from app.core import fast_json
+from app.core.config import settings
+from app.schema import chat_message_schemas
+from app.schema.chat_message_schemas import MessageBase, StreamEvent, StreamContent, \
+    StreamToolStart, StreamToolEnd, BatchQuestion, BatchResult
+from app.schema.trace_schemas import TurnTrace
+from app.schema.usage_schemas import SessionUsage, UsageReport, UsageSummary
+from app.service.generation_queue import generation_queue, Job
 from app.service.query_ai_service import QueryAIService
 from app.model.chat_models import Message
 from app.repository.chat_message_repository import ChatMessageRepository
 
+# Columns selected for the fast listing: exactly the fields of the response schema, in its order
+MESSAGE_FIELDS = list(chat_message_schemas.Message.model_fields)
+
 
 class ChatMessageService:
     def __init__(
@@ -17,40 +33,223 @@ class ChatMessageService:
         self.repository = repository
         self.query_ai_service = query_ai_service
 
+    @contextmanager
+    def detached(self):
+        """A copy of this service on its own database session, for work that may outlive the request."""
+        with self.repository.detached() as repository:
+            yield ChatMessageService(repository=repository, query_ai_service=self.query_ai_service)
+
     def get_chat_messages_by_session_id(self, chat_session_id: int, skip: int = 0,
                                         limit: int = 100) -> List[Type[Message]]:
         return self.repository.get_by_session_id(chat_session_id, skip, limit)
 
+    def get_chat_messages_json(self, chat_session_id: int, skip: int = 0, limit: int = 100) -> bytes:
+        """
+        The session's messages as a JSON array of chat_message_schemas.Message documents, built from projected rows
+        without ORM entities or Pydantic models in between.
+        """
+        rows = self.repository.get_rows_by_session_id(chat_session_id, MESSAGE_FIELDS, skip, limit)
+        return fast_json.dumps([dict(zip(MESSAGE_FIELDS, row)) for row in rows])
+
+    def _history(self, session_id: int) -> Iterable[MessageBase]:
+        """The recent conversation of a session as sent to the LLM, streamed from the database."""
+        return self.repository.iter_history(session_id, max_messages=settings.LLM_HISTORY_MAX_MESSAGES)
+
+    def get_session_version(self, session_id: int) -> tuple | None:
+        return self.repository.get_session_version(session_id)
+
     def create_chat_message(self, message: Message, session_id) -> Message:
+        # An archived session's history is restored before the turn extends it
+        self.repository.rehydrate(session_id)
         self.repository.create(message=message)
 
-        history = self.repository.get_by_session_id(session_id=session_id)
-        messages = [MessageBase(role=msg.role, content=msg.content) for msg in history]
+        messages = self._history(session_id)
 
-        ai_response_content, _ = self.query_ai_service.query_ai(messages)
+        trace, started = TurnTrace(), time.monotonic()
+        ai_response_content, _ = self.query_ai_service.query_ai(messages, trace=trace)
 
         ai_message = Message(role="assistant", content=ai_response_content, session_id=session_id)
-        return self.repository.create(message=ai_message)
+        record_usage(ai_message, trace, started)
+        return self._save_answer(ai_message, trace)
+
+    def create_chat_message_stream(self, message: Message, session_id: int,
+                                   cancellation: CancellationToken | None = None) -> Generator[StreamEvent, None, None]:
+        """
+        Stream an answer to a new user message. Once cancellation is cancelled (the client went away) the LLM
+        stream is closed, and the answer generated so far is persisted and marked as interrupted.
+        The LLM admission slot is held for as long as the generation runs, which may be longer than the request
+        that started it.
+        """
+        with llm_admission.slot(session_id):
+            self.repository.rehydrate(session_id)
+            self.repository.create(message=message)
+
+            # Read before the placeholder is inserted, so the empty assistant message is not part of the history
+            messages = list(self._history(session_id))
 
-    def create_chat_message_stream(self, message: Message, session_id: int) -> Generator[StreamEvent, None, None]:
+            # Create a placeholder for the assistant's message
+            ai_message = Message(role="assistant", content="", session_id=session_id)
+            self.repository.create(message=ai_message)
+
+            trace, started, first_token_at = TurnTrace(), time.monotonic(), None
+            response_stream = self.query_ai_service.query_ai_stream(messages, trace=trace, cancellation=cancellation)
+
+            ai_response_content = ""
+            try:
+                for chunk in response_stream:
+                    first_token_at = first_token_at or time.monotonic()
+                    ai_response_content += chunk
+                    yield StreamContent(type="content", delta=chunk)
+
+            finally:
+                exchange = tool_messages(trace, session_id)
+                if exchange:
+                    # The placeholder precedes the tool results, so it becomes the tool call and the answer follows them
+                    placeholder, ai_message = ai_message, Message(role="assistant", session_id=session_id)
+                    placeholder.tool_calls = exchange[0].tool_calls
+                    self.repository.create_all([placeholder] + exchange[1:])
+                # Update the placeholder with the final content
+                ai_message.content = ai_response_content
+                ai_message.interrupted = cancellation is not None and cancellation.cancelled
+                record_usage(ai_message, trace, started, first_token_at)
+                self.repository.update(message=ai_message)
+
+    def create_chat_message_job(self, message: Message, session_id: int) -> Job:
+        """Persist the user message and queue the answer; the job's worker persists the assistant message."""
+        self.repository.rehydrate(session_id)
         self.repository.create(message=message)
 
-        history = self.repository.get_by_session_id(session_id=session_id)
-        messages = [MessageBase(role=msg.role, content=msg.content) for msg in history]
+        def work() -> Generator[StreamEvent, None, Message]:
+            with self.detached() as service:
+                return (yield from service.answer_session(session_id))
 
-        # Create a placeholder for the assistant's message
-        ai_message = Message(role="assistant", content="", session_id=session_id)
-        self.repository.create(message=ai_message)
+        return generation_queue.submit(session_id, work)
 
-        response_stream = self.query_ai_service.query_ai_stream(messages)
+    def answer_session(self, session_id: int) -> Generator[StreamEvent, None, Message]:
+        """Stream an answer to the session's history and persist it once complete; returns the stored message."""
+        messages = self._history(session_id)
 
         ai_response_content = ""
-        try:
-            for chunk in response_stream:
+        trace, started, first_token_at = TurnTrace(), time.monotonic(), None
+        with llm_admission.slot(session_id):
+            for chunk in self.query_ai_service.query_ai_stream(messages, trace=trace):
+                first_token_at = first_token_at or time.monotonic()
                 ai_response_content += chunk
                 yield StreamContent(type="content", delta=chunk)
 
+        ai_message = Message(role="assistant", content=ai_response_content, session_id=session_id)
+        record_usage(ai_message, trace, started, first_token_at)
+        return self._save_answer(ai_message, trace)
+
+    def _save_answer(self, ai_message: Message, trace: TurnTrace) -> Message:
+        """Persist an answer, preceded by the tool calls and results it was based on."""
+        exchange = tool_messages(trace, ai_message.session_id)
+        if not exchange:
+            return self.repository.create(message=ai_message)
+        return self.repository.create_turn(exchange + [ai_message])
+
+    def answer_batch(self, questions: List[BatchQuestion]) -> Generator[BatchResult, None, None]:
+        """
+        Answer many questions concurrently and yield results in completion order.
+        Every question sees its session history as it was before the batch started; answers of session-bound
+        questions are persisted in one transaction once the batch is done (or abandoned).
+        """
+        if len(questions) > settings.BATCH_MAX_QUESTIONS:
+            raise HTTPException(status_code=413,
+                                detail=f"A batch may contain at most {settings.BATCH_MAX_QUESTIONS} questions")
+        return self._answer_batch(questions)
+
+    def _answer_batch(self, questions: List[BatchQuestion]) -> Generator[BatchResult, None, None]:
+        session_ids = {question.session_id for question in questions if question.session_id is not None}
+        existing_session_ids = self.repository.get_existing_session_ids(session_ids) if session_ids else set()
+        for session_id in existing_session_ids:
+            self.repository.rehydrate(session_id)
+        histories = {
+            # Shared by the worker threads, so fetched up front rather than streamed from the session
+            session_id: list(self._history(session_id))
+            for session_id in existing_session_ids
+        }
+
+        answered: List[Message] = []
+        executor = ThreadPoolExecutor(max_workers=settings.BATCH_MAX_WORKERS, thread_name_prefix="batch")
+        try:
+            futures = {}
+            for index, question in enumerate(questions):
+                if question.session_id is not None and question.session_id not in existing_session_ids:
+                    yield BatchResult(index=index, session_id=question.session_id, error="Chat session not found")
+                    continue
+                messages = histories.get(question.session_id, []) + [MessageBase(role="user", content=question.content)]
+                future = executor.submit(self._answer_batch_question, messages, question.session_id)
+                futures[future] = (index, question)
+
+            for future in as_completed(futures):
+                index, question = futures[future]
+                try:
+                    content, trace, duration = future.result()
+                except Exception as e:
+                    detail = e.detail if isinstance(e, HTTPException) else str(e)
+                    yield BatchResult(index=index, session_id=question.session_id, error=detail)
+                    continue
+                if question.session_id is not None:
+                    answered.append(Message(role="user", content=question.content, session_id=question.session_id))
+                    ai_message = Message(role="assistant", content=content, session_id=question.session_id)
+                    record_usage(ai_message, trace, duration=duration)
+                    answered.extend(tool_messages(trace, question.session_id) + [ai_message])
+                yield BatchResult(index=index, session_id=question.session_id, content=content)
         finally:
-            # Update the placeholder with the final content
-            ai_message.content = ai_response_content
-            self.repository.update(message=ai_message)
+            # Don't keep answering for a client that went away
+            executor.shutdown(wait=False, cancel_futures=True)
+            if answered:
+                self.repository.create_all(answered)
+
+    def _answer_batch_question(self, messages: List[MessageBase],
+                               session_id: int | None) -> tuple[str, TurnTrace, float]:
+        # Unbound questions share one admission queue so a bulk job cannot starve interactive sessions
+        with llm_admission.slot(session_id if session_id is not None else "batch"):
+            trace, started = TurnTrace(), time.monotonic()
+            content, _ = self.query_ai_service.query_ai(messages, trace=trace)
+        return content, trace, time.monotonic() - started
+
+    def get_session_usage(self, session_id: int) -> UsageSummary:
+        if not self.repository.get_existing_session_ids([session_id]):
+            raise HTTPException(status_code=404, detail="Chat session not found")
+        self.repository.rehydrate(session_id)
+        return UsageSummary(**self.repository.get_usage(session_id=session_id))
+
+    def get_usage_report(self, start: datetime.datetime | None = None, end: datetime.datetime | None = None,
+                         limit: int = 10) -> UsageReport:
+        return UsageReport(
+            start=start, end=end,
+            total=UsageSummary(**self.repository.get_usage(start=start, end=end)),
+            sessions=[SessionUsage(**row) for row in self.repository.get_usage_by_session(start, end, limit)],
+        )
+
+
+def tool_messages(trace: TurnTrace, session_id: int) -> List[Message]:
+    """
+    The tool round-trip of a turn as messages to persist before its answer: an assistant message with the calls,
+    then one tool message per call with its full output. Empty when no tools were called.
+    """
+    calls = [call for call in trace.tool_calls if call.id is not None and call.output is not None]
+    if not calls:
+        return []
+    return [
+        Message(role="assistant", content="", session_id=session_id,
+                tool_calls=[{"id": call.id, "name": call.name, "arguments": call.arguments} for call in calls]),
+        *(Message(role="tool", content=call.output, tool_call_id=call.id, session_id=session_id) for call in calls),
+    ]
+
+
+def record_usage(message: Message, trace: TurnTrace, started: float | None = None,
+                 first_token_at: float | None = None, duration: float | None = None):
+    """Store the turn's token usage and latency on its assistant message."""
+    message.model = trace.calls[-1].model if trace.calls else None
+    message.llm_calls = len(trace.calls)
+    message.prompt_tokens = trace.prompt_tokens
+    message.completion_tokens = trace.completion_tokens
+    message.cached_tokens = trace.cached_tokens
+    if first_token_at is not None and started is not None:
+        message.ttft_ms = (first_token_at - started) * 1000
+    if duration is None and started is not None:
+        duration = time.monotonic() - started
+    message.duration_ms = duration * 1000 if duration is not None else None
@@ -1,18 +1,27 @@
-from typing import Annotated
+from typing import Annotated, List
 from fastapi import Depends
-from app.model.chat_models import ChatSession
+from app.model.chat_models import ChatSession, Message
 from app.repository.chat_session_repository import ChatSessionRepository
+from app.schema import chat_session_schemas
 
 
 class ChatSessionService:
     def __init__(self, repository: Annotated[ChatSessionRepository, Depends(ChatSessionRepository)]):
         self.repository = repository
 
-    def get(self, skip: int = 0, limit: int = 100) -> list[type[ChatSession]]:
-        return self.repository.get(skip, limit)
+    def get(self, skip: int = 0, limit: int = 100) -> list[chat_session_schemas.ChatSession]:
+        sessions = self.repository.get(skip, limit)
+        # Archived sessions are listed with their decoded messages but stay archived
+        archived = self.repository.get_archived_messages([chat_session.id for chat_session in sessions])
+        return [_public_session(chat_session, archived.get(chat_session.id, chat_session.messages))
+                for chat_session in sessions]
 
-    def get_by_id(self, session_id: int) -> type[ChatSession] | None:
-        return self.repository.get_by_id(session_id)
+    def get_version(self, session_id: int) -> tuple | None:
+        return self.repository.get_version(session_id)
+
+    def get_by_id(self, session_id: int) -> chat_session_schemas.ChatSession:
+        chat_session = self.repository.get_by_id(session_id)
+        return _public_session(chat_session, chat_session.messages)
 
     def create(self) -> ChatSession:
         chat_session = ChatSession()
@@ -20,3 +29,11 @@ class ChatSessionService:
 
     def delete(self, session_id: int) -> type[ChatSession] | None:
         return self.repository.delete_chat_session(session_id)
+
+
+def _public_session(chat_session: ChatSession, messages: List[Message]) -> chat_session_schemas.ChatSession:
+    """The session as shown to clients: the internal tool call messages are left out."""
+    return chat_session_schemas.ChatSession.model_validate(
+        {"id": chat_session.id, "created_at": chat_session.created_at,
+         "messages": [message for message in messages if not message.internal]},
+        from_attributes=True)
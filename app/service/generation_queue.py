@@ -0,0 +1,178 @@
+import datetime
+import queue
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Generator, List
+
+from fastapi import HTTPException, status
+from sqlalchemy.exc import OperationalError
+
+from app.core import llm_router
+from app.core.broadcast import Broadcast
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.model.chat_models import Message
+from app.schema.chat_message_schemas import StreamContent, StreamEvent
+from app.schema.job_schemas import GenerationJob, JobStatus, StreamJobStatus
+
+# Produces the events of one attempt and returns the persisted assistant message
+JobWork = Callable[[], Generator[StreamEvent, None, Message]]
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Whether another attempt may succeed. Service errors wrap the LLM or database error that caused them, so
+    the decision is made on that cause: transient failures are retried, bad requests and bugs are not.
+    """
+    if isinstance(error, HTTPException):
+        # Only answers asking to come back later; other LLM failures have already been retried by the router
+        return error.status_code in (status.HTTP_429_TOO_MANY_REQUESTS, status.HTTP_503_SERVICE_UNAVAILABLE)
+    import openai
+    cause = error
+    while cause.__cause__ is not None:
+        cause = cause.__cause__
+    if isinstance(cause, openai.OpenAIError):
+        return llm_router.is_retryable(cause)
+    return isinstance(cause, (OperationalError, ConnectionError, TimeoutError))
+
+
+class Job:
+    def __init__(self, job_id: str, session_id: int, work: JobWork):
+        self.job_id = job_id
+        self.session_id = session_id
+        self.work = work
+        self.status: JobStatus = "queued"
+        self.attempts = 0
+        self.content = ""
+        self.message_id: int | None = None
+        self.error: str | None = None
+        self.created_at = datetime.datetime.now(datetime.timezone.utc)
+        self.enqueued_at = time.monotonic()
+        self.finished_at: float | None = None
+        self.events: Broadcast | None = None
+
+    def to_schema(self) -> GenerationJob:
+        return GenerationJob(job_id=self.job_id, session_id=self.session_id, status=self.status,
+                             attempts=self.attempts, content=self.content, message_id=self.message_id,
+                             error=self.error, created_at=self.created_at)
+
+
+class GenerationQueue:
+    """
+    Runs answer generation on a fixed pool of worker threads, independently of the HTTP request that asked for it.
+    Jobs wait in a bounded FIFO queue, failed attempts are retried with exponential backoff, and every job
+    publishes its events (status changes and content deltas) to a buffered broadcast that clients can poll
+    or subscribe to. Finished jobs stay addressable for a while and are then forgotten.
+    """
+
+    def __init__(self, workers: int, max_queue: int, max_attempts: int, retry_backoff: float, ttl: float,
+                 max_events: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.ttl = ttl
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._queue: "queue.Queue[Job]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, session_id: int, work: JobWork) -> Job:
+        job = Job(uuid.uuid4().hex, session_id, work)
+        job.events = Broadcast(lambda: self._execute(job), max_buffer=self.max_events,
+                               name=f"job-{job.job_id[:8]}")
+        with self._lock:
+            if self._queue.qsize() >= self.max_queue:
+                metrics.inc("generation_jobs_rejected_total")
+                raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                    detail="Too many queued generation jobs")
+            self._evict_expired()
+            self._jobs[job.job_id] = job
+            self._ensure_workers()
+            self._queue.put(job)
+            metrics.set_gauge("generation_queue_depth", self._queue.qsize())
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            self._evict_expired()
+            return self._jobs.get(job_id)
+
+    def _ensure_workers(self):
+        # Workers are started on first use so importing the module (and the test suite) spawns no threads
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"generation-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            metrics.set_gauge("generation_queue_depth", self._queue.qsize())
+            metrics.observe("generation_queue_wait_seconds", time.monotonic() - job.enqueued_at)
+            job.events.run()
+
+    def _execute(self, job: Job) -> Generator[StreamEvent | StreamJobStatus, None, None]:
+        started = time.monotonic()
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                job.attempts = attempt
+                job.content = ""
+                yield self._transition(job, "running")
+                try:
+                    message = yield from self._attempt(job)
+                except Exception as e:
+                    job.error = e.detail if isinstance(e, HTTPException) else str(e)
+                    if attempt == self.max_attempts or not is_retryable(e):
+                        yield self._transition(job, "failed")
+                        return
+                    yield self._transition(job, "retrying")
+                    time.sleep(self.retry_backoff * 2 ** (attempt - 1))
+                    continue
+                job.message_id = message.id
+                job.error = None
+                yield self._transition(job, "succeeded")
+                return
+        finally:
+            job.finished_at = time.monotonic()
+            metrics.observe("generation_job_seconds", job.finished_at - started)
+
+    def _attempt(self, job: Job) -> Generator[StreamEvent, None, Message]:
+        events = job.work()
+        while True:
+            try:
+                event = next(events)
+            except StopIteration as stop:
+                return stop.value
+            if isinstance(event, StreamContent):
+                job.content += event.delta
+            yield event
+
+    @staticmethod
+    def _transition(job: Job, new_status: JobStatus) -> StreamJobStatus:
+        job.status = new_status
+        if new_status in ("succeeded", "failed"):
+            metrics.inc("generation_jobs_total", status=new_status)
+        elif new_status == "retrying":
+            metrics.inc("generation_job_retries_total")
+        return StreamJobStatus(type="status", status=new_status, attempt=job.attempts, error=job.error,
+                               message_id=job.message_id)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+generation_queue = GenerationQueue(workers=settings.GENERATION_WORKERS, max_queue=settings.GENERATION_MAX_QUEUE,
+                                   max_attempts=settings.GENERATION_MAX_ATTEMPTS,
+                                   retry_backoff=settings.GENERATION_RETRY_BACKOFF_S,
+                                   ttl=settings.GENERATION_JOB_TTL_S, max_events=settings.SSE_RESUME_BUFFER_EVENTS)
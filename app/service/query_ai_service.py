@@ -1,24 +1,34 @@
+from __future__ import annotations
+
 import json
-import os
-from typing import List, Generator
+import math
+import time
+from typing import Dict, Iterable, List, Generator, Tuple, TYPE_CHECKING
 
-import openai
-from fastapi import Depends
-from openai.types.chat import ChatCompletionFunctionToolParam, ChatCompletionMessageParam, \
-    ChatCompletionToolMessageParam, ChatCompletionAssistantMessageParam, ChatCompletionUserMessageParam, \
-    ChatCompletionSystemMessageParam, ChatCompletionMessageFunctionToolCallParam
-from openai.types.chat.chat_completion_chunk import ChoiceDelta
-from openai.types.chat.chat_completion_message_function_tool_call_param import Function
+from fastapi import Depends, HTTPException
 
+from app.core.cache import get_cache
+from app.core.cancellation import CancellationToken
+from app.core.circuit_breaker import CircuitOpenError
 from app.core.config import settings
+from app.core.hedging import hedged_call, hedged_stream
+from app.core.knowledge import KnowledgeError, read_knowledge
+from app.core.knowledge_index import knowledge_index
+from app.core.llm_router import LLMRouter, is_retryable
+from app.core.metrics import metrics
+from app.core.model_cascade import FAST, LARGE, PROBE_CHARS, classify, needs_escalation
 from app.core.openai import get_openai_client
-from app.schema.chat_message_schemas import MessageBase
+from app.core.single_flight import SingleFlight, fingerprint
+from app.schema.chat_message_schemas import MessageBase, ToolCall
+from app.schema.trace_schemas import LLMCallTrace, ToolCallTrace, TurnTrace
+
+if TYPE_CHECKING:
+    # The SDK takes over a second to import, so it is only loaded once a client is created (app.core.openai).
+    # Its message params are TypedDicts, so plain dicts are built at runtime.
+    import openai
+    from openai.types.chat import ChatCompletionFunctionToolParam, ChatCompletionMessageParam
 
-MESSAGE_TYPES = {
-    "user": lambda role, content: ChatCompletionUserMessageParam(role=role, content=content),
-    "assistant": lambda role, content: ChatCompletionAssistantMessageParam(role=role, content=content),
-    "system": lambda role, content: ChatCompletionSystemMessageParam(role=role, content=content)
-}
+MESSAGE_ROLES = {"user", "assistant", "system"}
 
 SYSTEM_INSTRUCTION = """
 You are a helpful assistant that answers questions.
@@ -33,167 +43,537 @@ The available files are:
 
 Carefully consider the user's question to determine which file is most likely to contain the answer.
 Use file_name param of get_knowledge method to choose the corresponding file. 
+If the output of a large file is truncated, call get_knowledge again with one of the listed sections.
+If a get_knowledge result earlier in the conversation already answers the question, use it instead of calling the tool again.
 """
 
+# Kept as a module constant so every request carries a byte-identical tool schema, which keeps the
+# prompt prefix (system prompt + tools) cacheable by the provider
+KNOWLEDGE_TOOLS: List[ChatCompletionFunctionToolParam] = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_knowledge",
+            "description": "Get information from a file in the knowledge base.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "file_name": {
+                        "type": "string",
+                        "description": "The name of the file to read from the knowledge base.",
+                    },
+                    "section": {
+                        "type": "string",
+                        "description": "Optional title of a section within the file, such as a heading or a "
+                                       "question. Omit it to read the whole file; long output is truncated "
+                                       "and lists the file's sections.",
+                    },
+                },
+                "required": ["file_name"],
+            },
+        },
+    }
+]
+
+# Shared across requests so identical in-flight prompts from different sessions reach the LLM only once
+_in_flight = SingleFlight()
+
+
+def _tool_call_param(call: ToolCall | dict) -> dict:
+    # Calls are ToolCall models in schema messages and plain {id, name, arguments} dicts in projected rows
+    call = call if isinstance(call, dict) else call.model_dump()
+    return {"id": call["id"], "type": "function", "function": {"name": call["name"], "arguments": call["arguments"]}}
 
-def map_message_to_message_param(messages: List[MessageBase]) -> List[ChatCompletionMessageParam]:
-    return [MESSAGE_TYPES.get(msg.role, lambda role, content: ChatCompletionUserMessageParam(role=role, content=content))
-            (msg.role, msg.content) for msg in messages]
 
+def _tool_result_param(tool_call_id: str, content: str, seen: Dict[str, str]) -> ChatCompletionMessageParam:
+    """
+    A tool message; output identical to an earlier result in the context (the same file read again) is replaced
+    by a reference to that result. seen maps outputs already in the context to the id of their call.
+    """
+    earlier = seen.setdefault(content, tool_call_id)
+    if earlier != tool_call_id:
+        reference = f"Same content as the result of tool call {earlier} above."
+        if len(reference) < len(content):
+            content = reference
+    return {"role": "tool", "tool_call_id": tool_call_id, "content": content}
 
-def get_knowledge(file_name: str) -> str:
+
+def map_message_to_message_param(messages: Iterable[MessageBase]) -> List[ChatCompletionMessageParam]:
+    """
+    Map history messages to message params in a single pass, replaying persisted tool calls and their results.
+    Messages are anything with role and content attributes (and optionally tool_calls and tool_call_id): schema
+    messages, or the projected rows of ChatMessageRepository.iter_history, which are consumed as they are fetched.
+    Each tool output enters the context once: the earliest copy is kept, so the prompt prefix stays stable.
+    Calls without a result and results without their call (cut off by the history window) are dropped, as the
+    API rejects unmatched tool messages.
     """
-    Retrieves content from a file in the knowledge base.
+    message_params: List[ChatCompletionMessageParam] = []
+    seen: Dict[str, str] = {}
+    # The latest assistant tool-call message and the ids of its calls answered so far
+    pending: tuple[dict, set] | None = None
+
+    def settle():
+        param, answered = pending
+        param["tool_calls"] = [call for call in param["tool_calls"] if call["id"] in answered]
+        if not param["tool_calls"]:
+            del param["tool_calls"]
+            if not param["content"]:
+                # No result was appended after it, so it is still the last param
+                message_params.pop()
+
+    for msg in messages:
+        if msg.role == "tool":
+            tool_call_id = getattr(msg, "tool_call_id", None)
+            if pending is not None and any(call["id"] == tool_call_id for call in pending[0]["tool_calls"]):
+                pending[1].add(tool_call_id)
+                message_params.append(_tool_result_param(tool_call_id, msg.content, seen))
+            continue
+        if pending is not None:
+            settle()
+            pending = None
+        tool_calls = getattr(msg, "tool_calls", None)
+        if msg.role == "assistant" and tool_calls:
+            param = {"role": "assistant", "content": msg.content,
+                     "tool_calls": [_tool_call_param(call) for call in tool_calls]}
+            message_params.append(param)
+            pending = (param, set())
+        else:
+            message_params.append({"role": msg.role if msg.role in MESSAGE_ROLES else "user", "content": msg.content})
+    if pending is not None:
+        settle()
+    return message_params
+
+
+def merge_tool_call_deltas(deltas) -> List[ToolCall]:
     """
-    file_path = os.path.join(settings.KNOWLEDGE_BASE_DIR, file_name)
-    if not os.path.exists(file_path):
-        return f"Error: File '{file_name}' not found in the knowledge base."
-    if os.path.isdir(file_path):
-        return f"Error: '{file_name}' is a directory, not a file."
+    Assemble the tool calls of a streamed completion. A call arrives in several deltas sharing its index: the
+    first carries the id and name, the following ones further fragments of the JSON arguments.
+    """
+    merged: Dict[int, dict] = {}
+    for delta in deltas:
+        call = merged.setdefault(delta.index, {"id": "", "name": "", "arguments": ""})
+        if delta.id:
+            call["id"] = delta.id
+        if delta.function is not None:
+            call["name"] += delta.function.name or ""
+            call["arguments"] += delta.function.arguments or ""
+    return [ToolCall(**merged[index]) for index in sorted(merged)]
+
+
+def get_knowledge(file_name: str, section: str | None = None) -> str:
+    """
+    Retrieves content from a file in the knowledge base, or from one section of it, bounded in size.
+    """
+    if knowledge_index.current.artifact is not None:
+        # Already a slice of memory shared by all workers, so there is nothing to gain from caching it
+        try:
+            return read_knowledge(file_name, section)
+        except KnowledgeError as e:
+            return str(e)
+    cache_key = f"knowledge:{file_name}#{section}" if section else f"knowledge:{file_name}"
+    cached = get_cache().get(cache_key)
+    if cached is not None:
+        return cached
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
-    except Exception as e:
-        return f"Error reading file '{file_name}': {e}"
+        content = read_knowledge(file_name, section)
+    except KnowledgeError as e:
+        return str(e)
+    get_cache().set(cache_key, content, settings.CACHE_KNOWLEDGE_TTL_S)
+    return content
+
+
+def _is_cancelled(cancellation: CancellationToken | None) -> bool:
+    return cancellation is not None and cancellation.cancelled
+
+
+def _service_error(error: Exception) -> Exception:
+    import openai
+    if isinstance(error, CircuitOpenError):
+        # Fail fast while every backend is known to be down, rather than letting the caller wait for a timeout
+        return HTTPException(status_code=503, detail="The LLM service is temporarily unavailable",
+                             headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))})
+    if isinstance(error, openai.OpenAIError) and is_retryable(error):
+        # The router has already retried it as often as its attempts and retry budget allow
+        return HTTPException(status_code=502, detail="The LLM service failed after retrying")
+    if isinstance(error, openai.APIStatusError):
+        return RuntimeError(f"Service OpenAI returned an API error (Status Code: {error.status_code})")
+    return RuntimeError(f"An unexpected error occurred: {str(error)} (Error Type: {type(error).__name__})")
 
 
 class QueryAIService:
-    def __init__(self, client: openai.OpenAI | openai.AzureOpenAI = Depends(get_openai_client)):
+    def __init__(self, client: openai.OpenAI | openai.AzureOpenAI | LLMRouter = Depends(get_openai_client)):
         self.temperature = settings.LLM_TEMPERATURE
         self.client = client
-        self.tools: List[ChatCompletionFunctionToolParam] = [
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_knowledge",
-                    "description": "Get information from a file in the knowledge base.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "file_name": {
-                                "type": "string",
-                                "description": "The name of the file to read from the knowledge base.",
-                            },
-                        },
-                        "required": ["file_name"],
-                    },
-                },
-            }
-        ]
+        self.tools = KNOWLEDGE_TOOLS
 
     @staticmethod
-    def _prepare_message_params(messages: List[MessageBase]) -> List[ChatCompletionMessageParam]:
-        message_params = [ChatCompletionSystemMessageParam(role="system", content=SYSTEM_INSTRUCTION)]
+    def _prepare_message_params(messages: Iterable[MessageBase]) -> List[ChatCompletionMessageParam]:
+        message_params: List[ChatCompletionMessageParam] = [{"role": "system", "content": SYSTEM_INSTRUCTION}]
         message_params.extend(map_message_to_message_param(messages))
         return message_params
 
     @staticmethod
-    def _handle_tool_calls(message_params: List[ChatCompletionMessageParam], tool_calls, full_content: str):
-        """Handle tool calls and return the final response."""
-        message_params.append(ChatCompletionAssistantMessageParam(
-            role="assistant",
-            tool_calls=[
-                ChatCompletionMessageFunctionToolCallParam(
-                    id=tool_call.id,
-                    function=Function(name=tool_call.function.name, arguments=tool_call.function.arguments),
-                    type="function"
-                )
-                for tool_call in tool_calls
-            ],
-            content=full_content
-        ))
+    def _handle_tool_calls(message_params: List[ChatCompletionMessageParam], tool_calls: List[ToolCall],
+                           full_content: str, trace: TurnTrace | None = None):
+        """
+        Run the tool calls and append them with their results to the message params. The calls and their full
+        outputs are recorded on the trace, from which they are persisted for later turns.
+        """
+        message_params.append({
+            "role": "assistant",
+            "tool_calls": [_tool_call_param(tool_call) for tool_call in tool_calls],
+            "content": full_content,
+        })
+        seen = {param["content"]: param["tool_call_id"] for param in message_params if param["role"] == "tool"}
 
         available_functions = {"get_knowledge": get_knowledge}
         for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            function_response = available_functions[function_name](
-                file_name=json.loads(tool_call.function.arguments).get("file_name")
-            )
-            message_params.append(ChatCompletionToolMessageParam(
-                tool_call_id=tool_call.id,
-                role="tool",
-                content=function_response
-            ))
+            arguments = json.loads(tool_call.arguments or "{}")
+            file_name = arguments.get("file_name")
+            function_arguments = {"file_name": file_name}
+            if arguments.get("section"):
+                function_arguments["section"] = arguments["section"]
+            function_response = available_functions[tool_call.name](**function_arguments)
+            if trace is not None:
+                trace.tool_calls.append(ToolCallTrace(name=tool_call.name, arguments=tool_call.arguments,
+                                                      id=tool_call.id, output=function_response))
+                trace.knowledge_files.append(file_name)
+            message_params.append(_tool_result_param(tool_call.id, function_response, seen))
 
         return message_params
 
-    def query_ai_stream(self, messages: List[MessageBase], llm_model=settings.LLM_MODEL) -> Generator[str, None, None]:
-        """Streaming version of query_ai that yields response chunks."""
+    def _create_completion(self, **kwargs):
+        """Create a chat completion, hedging it with a duplicate request when the first token is slow."""
+        create = self.client.chat.completions.create
+        if not settings.LLM_HEDGE_ENABLED:
+            return create(**kwargs)
+        hedge_kwargs = {**kwargs, "model": settings.LLM_HEDGE_MODEL or kwargs["model"]}
+        if kwargs.get("stream"):
+            return hedged_stream(lambda: create(**kwargs), lambda: create(**hedge_kwargs), settings.LLM_HEDGE_AFTER_S)
+        return hedged_call(lambda: create(**kwargs), lambda: create(**hedge_kwargs), settings.LLM_HEDGE_AFTER_S)
+
+    def _completion_options(self, llm_model: str, stream: bool = False) -> dict:
+        """
+        Options shared by the first and the follow-up call of a turn. Keeping them identical means the
+        follow-up request only appends tool messages to an otherwise byte-identical prompt.
+        """
+        options = dict(model=llm_model, temperature=self.temperature, tools=self.tools, tool_choice="auto")
+        if stream:
+            options["stream"] = True
+            if settings.LLM_STREAM_USAGE:
+                options["stream_options"] = {"include_usage": True}
+        return options
+
+    @staticmethod
+    def _record_call(trace: TurnTrace | None, model: str, usage, started: float, first_token_at: float | None = None):
+        """
+        Account prompt, cached prompt and completion tokens of one call (cached/prompt is the prefix cache hit
+        rate) and add the call to the turn trace.
+        """
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+        if usage is not None:
+            metrics.inc("llm_prompt_tokens_total", usage.prompt_tokens)
+            metrics.inc("llm_cached_prompt_tokens_total", cached_tokens)
+            metrics.inc("llm_completion_tokens_total", usage.completion_tokens)
+            if usage.prompt_tokens:
+                metrics.observe("llm_prompt_cache_hit_ratio", cached_tokens / usage.prompt_tokens)
+        if trace is not None:
+            trace.calls.append(LLMCallTrace(
+                model=model,
+                prompt_tokens=usage.prompt_tokens if usage is not None else 0,
+                completion_tokens=usage.completion_tokens if usage is not None else 0,
+                cached_tokens=cached_tokens,
+                ttft_ms=(first_token_at - started) * 1000 if first_token_at is not None else None,
+                duration_ms=(time.monotonic() - started) * 1000,
+            ))
+
+    def _request_fingerprint(self, message_params: List[ChatCompletionMessageParam], llm_model: str) -> str:
+        return fingerprint({
+            "model": llm_model,
+            "temperature": self.temperature,
+            "messages": message_params,
+            "tools": self.tools,
+        })
+
+    def _route(self, message_params: List[ChatCompletionMessageParam], llm_model: str | None,
+               trace: TurnTrace) -> str | None:
+        """
+        The cascade tier a turn starts on, decided from its last user message. None when the caller asked for a
+        model or the cascade is off (no LLM_FAST_MODEL), in which case LLM_MODEL answers.
+        """
+        if llm_model is not None or not settings.LLM_FAST_MODEL:
+            return None
+        question = next((param["content"] for param in reversed(message_params) if param["role"] == "user"), "")
+        decision = classify(question or "", knowledge_index.current, settings.LLM_CASCADE_MAX_QUESTION_CHARS,
+                            settings.LLM_CASCADE_MIN_KNOWLEDGE_COVERAGE)
+        trace.tier, trace.routing_reason = decision
+        metrics.inc("llm_cascade_decisions_total", tier=decision.tier, reason=decision.reason)
+        return decision.tier
+
+    @staticmethod
+    def _record_tier(trace: TurnTrace, tier: str, started: float):
+        elapsed = time.monotonic() - started
+        metrics.observe("llm_tier_latency_seconds", elapsed, tier=tier)
+        trace.tier_ms[tier] = trace.tier_ms.get(tier, 0.0) + elapsed * 1000
+
+    @staticmethod
+    def _escalate(trace: TurnTrace, reason: str, checkpoint: Tuple[int, int]):
+        """Hand the turn to the large model. The fast attempt's LLM calls stay on the trace as spent cost."""
+        del trace.tool_calls[checkpoint[0]:]
+        del trace.knowledge_files[checkpoint[1]:]
+        trace.coalesced = trace.answer_cached = False
+        trace.tier, trace.escalation_reason = LARGE, reason
+        metrics.inc("llm_cascade_escalations_total", reason=reason)
+
+    def query_ai_stream(self, messages: Iterable[MessageBase], llm_model: str | None = None,
+                        trace: TurnTrace | None = None,
+                        cancellation: CancellationToken | None = None) -> Generator[str, None, None]:
+        """
+        Streaming version of query_ai that yields response chunks.
+        Once cancellation is cancelled the upstream stream is closed, no further LLM call is made and the
+        generator ends early; a partial answer is not cached.
+        With the cascade, the start of a fast answer is held back until it shows the fast model did not give up;
+        after that the answer is kept, so only a failed or hedging start escalates to the large model.
+        """
+        trace = trace if trace is not None else TurnTrace()
+        message_params = self._prepare_message_params(messages)
+        tier = self._route(message_params, llm_model, trace)
+        if tier != FAST:
+            started = time.monotonic()
+            yield from self._answer_stream(message_params, llm_model or settings.LLM_MODEL, trace, cancellation)
+            if tier is not None:
+                self._record_tier(trace, tier, started)
+            return
+
+        checkpoint = (len(trace.tool_calls), len(trace.knowledge_files))
+        started = time.monotonic()
+        held, released, reason = "", False, None
+        # A copy, since tool calls append to the params and the large model would start from the original
+        fast = self._answer_stream(list(message_params), settings.LLM_FAST_MODEL, trace, cancellation)
         try:
-            message_params = self._prepare_message_params(messages)
+            for chunk in fast:
+                if released:
+                    yield chunk
+                    continue
+                held += chunk
+                if len(held) >= PROBE_CHARS:
+                    reason = needs_escalation(held)
+                    if reason is not None:
+                        break
+                    released = True
+                    yield held
+        except Exception:
+            if released or _is_cancelled(cancellation):
+                raise
+            reason = "fast_model_error"
+        finally:
+            # An escalated (or abandoned) fast answer must not keep its upstream stream open until it is collected
+            fast.close()
+        self._record_tier(trace, FAST, started)
+        if released or _is_cancelled(cancellation):
+            return
+        reason = reason or needs_escalation(held)
+        if reason is None:
+            yield held
+            return
 
-            # Initial streaming request
-            stream = self.client.chat.completions.create(
-                model=llm_model,
-                messages=message_params,
-                temperature=self.temperature,
-                tools=self.tools,
-                tool_choice="auto",
-                stream=True,
-            )
-
-            # Collect full response from stream
-            full_content = ""
-            tool_calls = []
+        self._escalate(trace, reason, checkpoint)
+        started = time.monotonic()
+        yield from self._answer_stream(message_params, settings.LLM_MODEL, trace, cancellation)
+        self._record_tier(trace, LARGE, started)
+
+    def _answer_stream(self, message_params: List[ChatCompletionMessageParam], llm_model: str, trace: TurnTrace,
+                       cancellation: CancellationToken | None) -> Generator[str, None, None]:
+        request_fingerprint = self._request_fingerprint(message_params, llm_model)
+        cached = self._cached_answer(request_fingerprint, trace)
+        if cached is not None:
+            if cached[0]:
+                yield cached[0]
+            return
 
+        content = ""
+        if not settings.LLM_COALESCE_REQUESTS:
+            for chunk in self._query_ai_stream(message_params, llm_model, trace, cancellation):
+                content += chunk
+                yield chunk
+        else:
+            # Concurrent identical prompts share one upstream stream; every caller gets all chunks.
+            # The shared stream is only cancelled once all callers are.
+            led = []
+            for chunk in _in_flight.stream(request_fingerprint, lambda upstream: led.append(True) or
+                                           self._query_ai_stream(message_params, llm_model, trace, upstream),
+                                           cancellation):
+                content += chunk
+                yield chunk
+            trace.coalesced = not led
+        if _is_cancelled(cancellation):
+            return
+        self._cache_answer(request_fingerprint, content, None, trace)
+
+    @staticmethod
+    def _cached_answer(request_fingerprint: str, trace: TurnTrace) -> tuple | None:
+        """
+        A cached answer to the same prompt, as long as the knowledge files it was grounded in are unchanged.
+        Knowledge reloads therefore invalidate exactly the answers that read a changed file.
+        """
+        if not settings.CACHE_ANSWERS:
+            return None
+        key = f"answer:{request_fingerprint}"
+        cached = get_cache().get(key)
+        if cached is None:
+            return None
+        content, response_id, *grounding = json.loads(cached)
+        knowledge_hashes = grounding[0] if grounding else {}
+        current = knowledge_index.current.hashes
+        if any(current.get(name) != sha256 for name, sha256 in knowledge_hashes.items()):
+            get_cache().delete(key)
+            return None
+        trace.answer_cached = True
+        return content, response_id
+
+    @staticmethod
+    def _cache_answer(request_fingerprint: str, content: str | None, response_id: str | None, trace: TurnTrace):
+        # A coalesced follower did not see which files were read, so only the leader stores the answer
+        if not settings.CACHE_ANSWERS or not content or trace.coalesced:
+            return
+        current = knowledge_index.current.hashes
+        knowledge_hashes = {name: current.get(name) for name in trace.knowledge_files}
+        get_cache().set(f"answer:{request_fingerprint}", json.dumps([content, response_id, knowledge_hashes]),
+                        settings.CACHE_ANSWER_TTL_S)
+
+    def _stream_call(self, message_params: List[ChatCompletionMessageParam], llm_model: str,
+                     trace: TurnTrace | None, cancellation: CancellationToken | None = None):
+        """Run one streamed completion, yielding content deltas. Returns the full content and the tool calls."""
+        started = time.monotonic()
+        first_token_at = None
+        model, usage = llm_model, None
+        content = ""
+        tool_calls = []
+
+        stream = self._create_completion(messages=message_params, **self._completion_options(llm_model, True))
+        close = getattr(stream, "close", None)
+        # Closing the response from the cancelling thread ends a read that is waiting for the next chunk
+        unregister = cancellation.on_cancel(close) if cancellation is not None and close is not None else None
+        completed = False
+        try:
             for chunk in stream:
+                if _is_cancelled(cancellation):
+                    break
+                model = chunk.model or model
+                usage = chunk.usage or usage
+                if not chunk.choices:
+                    continue
                 delta = chunk.choices[0].delta
+                if first_token_at is None and (delta.content or delta.tool_calls):
+                    first_token_at = time.monotonic()
                 if delta.content:
-                    full_content += delta.content
+                    content += delta.content
                     yield delta.content
                 if delta.tool_calls:
                     tool_calls.extend(delta.tool_calls)
+            completed = True
+        finally:
+            if unregister is not None:
+                unregister()
+            # Left before the end (cancelled, failed, or closed by the consumer with GeneratorExit)
+            if close is not None and (not completed or _is_cancelled(cancellation)):
+                close()
+
+        self._record_call(trace, model, usage, started, first_token_at)
+        if _is_cancelled(cancellation):
+            metrics.inc("llm_streams_cancelled_total")
+            return content, []
+        return content, merge_tool_call_deltas(tool_calls)
+
+    def _query_ai_stream(self, message_params: List[ChatCompletionMessageParam], llm_model: str,
+                         trace: TurnTrace | None = None,
+                         cancellation: CancellationToken | None = None) -> Generator[str, None, None]:
+        try:
+            # Initial streaming request
+            full_content, tool_calls = yield from self._stream_call(message_params, llm_model, trace, cancellation)
 
             # Handle tool calls if present
             if tool_calls:
-                message_params = self._handle_tool_calls(message_params, tool_calls, full_content)
-
-                # Second request for final response
-                second_stream = self.client.chat.completions.create(
-                    model=llm_model,
-                    messages=message_params,
-                    tools=self.tools,
-                    stream=True,
-                )
-                for chunk in second_stream:
-                    if chunk.choices[0].delta.content:
-                        yield chunk.choices[0].delta.content
-
-        except openai.APIStatusError as e:
-            raise RuntimeError(f"Service OpenAI returned an API error (Status Code: {e.status_code})") from e
+                message_params = self._handle_tool_calls(message_params, tool_calls, full_content, trace)
+
+                # Second request for final response, unless nobody is waiting for it any more
+                if not _is_cancelled(cancellation):
+                    yield from self._stream_call(message_params, llm_model, trace, cancellation)
+
         except Exception as e:
-            error_type = type(e).__name__
-            error_message = f"An unexpected error occurred: {str(e)}"
-            raise RuntimeError(f"{error_message} (Error Type: {error_type})") from e
+            if _is_cancelled(cancellation):
+                # Reading from the upstream stream closed by the cancellation
+                return
+            raise _service_error(e) from e
 
-    def query_ai(self, messages: List[MessageBase], llm_model=settings.LLM_MODEL):
+    def query_ai(self, messages: Iterable[MessageBase], llm_model: str | None = None,
+                 trace: TurnTrace | None = None):
         # This method remains for non-streaming purposes
+        trace = trace if trace is not None else TurnTrace()
+        message_params = self._prepare_message_params(messages)
+        tier = self._route(message_params, llm_model, trace)
+        if tier != FAST:
+            started = time.monotonic()
+            result = self._answer(message_params, llm_model or settings.LLM_MODEL, trace)
+            if tier is not None:
+                self._record_tier(trace, tier, started)
+            return result
+
+        checkpoint = (len(trace.tool_calls), len(trace.knowledge_files))
+        started = time.monotonic()
+        try:
+            result = self._answer(list(message_params), settings.LLM_FAST_MODEL, trace)
+            reason = needs_escalation(result[0])
+        except Exception:
+            result, reason = None, "fast_model_error"
+        self._record_tier(trace, FAST, started)
+        if reason is None:
+            return result
+
+        self._escalate(trace, reason, checkpoint)
+        started = time.monotonic()
+        result = self._answer(message_params, settings.LLM_MODEL, trace)
+        self._record_tier(trace, LARGE, started)
+        return result
+
+    def _answer(self, message_params: List[ChatCompletionMessageParam], llm_model: str, trace: TurnTrace):
+        request_fingerprint = self._request_fingerprint(message_params, llm_model)
+        cached = self._cached_answer(request_fingerprint, trace)
+        if cached is not None:
+            return cached
+        if not settings.LLM_COALESCE_REQUESTS:
+            result = self._query_ai(message_params, llm_model, trace)
+        else:
+            led = []
+            result = _in_flight.do(request_fingerprint,
+                                   lambda: led.append(True) or self._query_ai(message_params, llm_model, trace))
+            trace.coalesced = not led
+        self._cache_answer(request_fingerprint, *result, trace)
+        return result
+
+    def _timed_call(self, message_params: List[ChatCompletionMessageParam], llm_model: str,
+                    trace: TurnTrace | None):
+        started = time.monotonic()
+        response = self._create_completion(messages=message_params, **self._completion_options(llm_model))
+        self._record_call(trace, response.model or llm_model, response.usage, started)
+        return response
+
+    def _query_ai(self, message_params: List[ChatCompletionMessageParam], llm_model: str,
+                  trace: TurnTrace | None = None):
         try:
-            message_params = self._prepare_message_params(messages)
-            response = self.client.chat.completions.create(
-                model=llm_model,
-                messages=message_params,
-                temperature=self.temperature,
-                tools=self.tools,
-                tool_choice="auto",
-            )
+            response = self._timed_call(message_params, llm_model, trace)
             response_message = response.choices[0].message
             tool_calls = response_message.tool_calls
 
             if tool_calls:
-                message_params = self._handle_tool_calls(message_params, tool_calls, response_message.content)
-                second_response = self.client.chat.completions.create(
-                    model=llm_model,
-                    messages=message_params,
-                    tools=self.tools,
-                )
+                tool_calls = [ToolCall(id=call.id, name=call.function.name, arguments=call.function.arguments)
+                              for call in tool_calls]
+                message_params = self._handle_tool_calls(message_params, tool_calls, response_message.content, trace)
+                second_response = self._timed_call(message_params, llm_model, trace)
                 return second_response.choices[0].message.content, response.id
 
             return response_message.content, response.id
 
-        except openai.APIStatusError as e:
-            raise RuntimeError(f"Service OpenAI returned an API error (Status Code: {e.status_code})") from e
         except Exception as e:
-            error_type = type(e).__name__
-            error_message = f"An unexpected error occurred: {str(e)}"
-            raise RuntimeError(f"{error_message} (Error Type: {error_type})") from e
+            raise _service_error(e) from e
@@ -0,0 +1,71 @@
+import datetime
+import logging
+import threading
+from typing import Callable
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.metrics import metrics
+from app.repository.chat_archive_repository import ChatArchiveRepository
+
+logger = logging.getLogger(__name__)
+
+
+class SessionArchiver:
+    """
+    Periodically moves the messages of sessions idle for longer than idle_after into compressed archive blobs,
+    so the messages table and its indexes only hold sessions that are still in use. Archived sessions are
+    restored transparently the next time they are read or written (see ChatArchiveRepository.rehydrate).
+    """
+
+    def __init__(self, idle_after: float, batch_size: int, session_factory: Callable[[], Session] = SessionLocal):
+        self.idle_after = idle_after
+        self.batch_size = batch_size
+        self._session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def run_once(self) -> int:
+        """Archive up to batch_size idle sessions; returns how many were archived."""
+        idle_before = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.idle_after)
+        archived = 0
+        db = self._session_factory()
+        try:
+            repository = ChatArchiveRepository(db=db)
+            for session_id in repository.get_idle_session_ids(idle_before, self.batch_size):
+                # One transaction per session, so a failure only skips that session
+                try:
+                    archived += repository.archive(session_id, idle_before)
+                except Exception:
+                    db.rollback()
+                    metrics.inc("archive_errors_total")
+                    logger.exception("Archiving session %s failed", session_id)
+        finally:
+            db.close()
+        return archived
+
+    def start(self, interval: float):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="session-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval: float):
+        while not self._stop.wait(interval):
+            try:
+                self.run_once()
+            except Exception:
+                metrics.inc("archive_errors_total")
+                logger.exception("Session archival failed")
+
+
+session_archiver = SessionArchiver(idle_after=settings.ARCHIVE_IDLE_AFTER_S, batch_size=settings.ARCHIVE_BATCH_SIZE)
@@ -0,0 +1,116 @@
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, Tuple
+
+from app.core.broadcast import Broadcast
+from app.core.cancellation import CancellationToken
+from app.core.config import settings
+from app.core.metrics import metrics
+from app.schema.chat_message_schemas import StreamEvent
+
+
+class RegisteredStream:
+    def __init__(self, stream_id: str, session_id: int, broadcast: Broadcast[StreamEvent],
+                 cancellation: CancellationToken, disconnect_grace: float = 0.0):
+        self.stream_id = stream_id
+        self.session_id = session_id
+        self.broadcast = broadcast
+        self.cancellation = cancellation
+        self.disconnect_grace = disconnect_grace
+        self.finished_at: float | None = None
+        self._lock = threading.Lock()
+        self._listeners = 0
+
+    def attach(self) -> Callable[[], None]:
+        """
+        Count a client as listening to the stream; returns the function to call once it has disconnected.
+        When the last client is gone and none attaches within disconnect_grace, the generation is cancelled.
+        """
+        with self._lock:
+            self._listeners += 1
+        released = []
+
+        def release():
+            with self._lock:
+                if released:
+                    return
+                released.append(True)
+                self._listeners -= 1
+                abandoned = self._listeners == 0
+            if not abandoned or self.finished_at is not None:
+                return
+            if self.disconnect_grace <= 0:
+                self._cancel_if_abandoned()
+            else:
+                timer = threading.Timer(self.disconnect_grace, self._cancel_if_abandoned)
+                timer.daemon = True
+                timer.start()
+
+        return release
+
+    def _cancel_if_abandoned(self):
+        with self._lock:
+            abandoned = self._listeners == 0 and self.finished_at is None
+        if abandoned and not self.cancellation.cancelled:
+            metrics.inc("streams_cancelled_total")
+            self.cancellation.cancel()
+
+
+class StreamRegistry:
+    """
+    Keeps generations that are streamed to clients addressable by id.
+    Events of each generation are buffered in a bounded ring, so a client that reconnects with Last-Event-ID
+    gets the events it missed and then the live events of the same generation, without a new LLM call.
+    Finished streams stay resumable for a while and are then forgotten. A generation nobody listens to any more
+    is cancelled once disconnect_grace has passed, unless a client resumed it in the meantime.
+    """
+
+    def __init__(self, max_events: int, ttl: float, disconnect_grace: float = 0.0):
+        self.max_events = max_events
+        self.ttl = ttl
+        self.disconnect_grace = disconnect_grace
+        self._lock = threading.Lock()
+        self._streams: Dict[str, RegisteredStream] = {}
+
+    def start(self, session_id: int, events: Callable[[], Iterable[StreamEvent]],
+              cancellation: CancellationToken | None = None) -> RegisteredStream:
+        """Start pumping a generation; cancellation is the token the generation stops on once abandoned."""
+        stream_id = uuid.uuid4().hex
+        stream = RegisteredStream(stream_id, session_id, None, cancellation or CancellationToken(),
+                                  self.disconnect_grace)
+
+        def tracked():
+            try:
+                yield from events()
+            finally:
+                stream.finished_at = time.monotonic()
+
+        stream.broadcast = Broadcast(tracked, max_buffer=self.max_events, name=f"stream-{stream_id[:8]}")
+        with self._lock:
+            self._evict_expired()
+            self._streams[stream_id] = stream
+        stream.broadcast.start()
+        return stream
+
+    def get(self, stream_id: str) -> RegisteredStream | None:
+        with self._lock:
+            self._evict_expired()
+            return self._streams.get(stream_id)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        expired = [stream_id for stream_id, stream in self._streams.items()
+                   if stream.finished_at is not None and now - stream.finished_at > self.ttl]
+        for stream_id in expired:
+            del self._streams[stream_id]
+
+
+def parse_last_event_id(last_event_id: str) -> Tuple[str, int]:
+    """Split a '<stream id>:<sequence>' event id."""
+    stream_id, _, seq = last_event_id.rpartition(":")
+    return stream_id, int(seq)
+
+
+stream_registry = StreamRegistry(max_events=settings.SSE_RESUME_BUFFER_EVENTS, ttl=settings.SSE_RESUME_TTL_S,
+                                 disconnect_grace=settings.SSE_DISCONNECT_GRACE_S)
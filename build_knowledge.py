@@ -0,0 +1,32 @@
+"""
+Compiles the knowledge base directory into a single memory-mappable artifact.
+
+Usage:
+    python build_knowledge.py                      # knowledge/ -> knowledge.qkb
+    python build_knowledge.py docs/ docs.qkb --no-index
+
+Point KNOWLEDGE_ARTIFACT_PATH at the output to serve get_knowledge from it.
+"""
+import argparse
+from typing import List
+
+from app.core.config import settings
+from app.core.knowledge_artifact import build_artifact, KnowledgeArtifact
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description="Compile the knowledge base into a memory-mappable artifact.")
+    parser.add_argument("directory", nargs="?", default=settings.KNOWLEDGE_BASE_DIR, help="knowledge directory")
+    parser.add_argument("output", nargs="?", default="knowledge.qkb", help="artifact to write")
+    parser.add_argument("--no-index", action="store_true", help="leave out the term index")
+    args = parser.parse_args(argv)
+
+    version_id = build_artifact(args.directory, args.output, with_index=not args.no_index)
+    artifact = KnowledgeArtifact(args.output)
+    print(f"Wrote {args.output}: version {version_id}, {len(artifact.files)} files, "
+          f"{artifact.passage_count} passages, term index {'included' if artifact.has_index else 'omitted'}")
+    artifact.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,61 @@
+# Installed first so that, with STARTUP_PROFILE set, every import below is timed
+from app.core.startup import startup_profiler
+startup_profiler.install()
+
+import importlib
+import threading
 from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI
 
+from app.api.v1 import ops_routes
 from app.api.v1 import routes as api_v1
+from app.core.compression import CompressionMiddleware
+from app.core.config import settings
 from app.core.database import init_db
+from app.core.knowledge_index import knowledge_index
+from app.service.session_archiver import session_archiver
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_db()
+    with startup_profiler.phase("init_db"):
+        init_db()
+    with startup_profiler.phase("load_knowledge"):
+        # Maps the prebuilt artifact, if configured; otherwise indexes the knowledge files
+        knowledge_index.refresh()
+    if settings.KNOWLEDGE_WATCH_INTERVAL_S > 0:
+        knowledge_index.start_watching(settings.KNOWLEDGE_WATCH_INTERVAL_S)
+    if settings.ARCHIVE_INTERVAL_S > 0:
+        session_archiver.start(settings.ARCHIVE_INTERVAL_S)
+    if settings.PREWARM_IMPORTS:
+        # Deferred so it doesn't delay startup, but done before it can delay the first LLM request
+        threading.Thread(target=importlib.import_module, args=("openai",), name="prewarm-imports",
+                         daemon=True).start()
+    startup_profiler.mark("ready")
+    if startup_profiler.enabled:
+        startup_profiler.uninstall()
+        startup_profiler.print_report()
     yield
+    knowledge_index.stop_watching()
+    session_archiver.stop()
 
 
 def create_app() -> FastAPI:
     application = FastAPI(title="QNA-Agent", lifespan=lifespan)
+    if settings.COMPRESSION_MIN_BYTES > 0:
+        application.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_BYTES,
+                                   gzip_level=settings.COMPRESSION_GZIP_LEVEL,
+                                   brotli_quality=settings.COMPRESSION_BROTLI_QUALITY)
 
     application.include_router(api_v1.router, prefix="/api/v1/chat")
+    application.include_router(ops_routes.router, prefix="/api/v1")
 
     return application
 
 
+startup_profiler.mark("imports")
 app = create_app()
 
 if __name__ == "__main__":
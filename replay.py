@@ -0,0 +1,164 @@
+"""
+Replays recorded conversations through QueryAIService and reports latency, throughput and token usage.
+
+Each line of the input file is a JSON conversation:
+    {"id": "ticket-42", "messages": [{"role": "user", "content": "How much is the Pro Plan?"}, ...]}
+Every user message is asked in order, with the answers generated during the replay as history, so the
+replay behaves like the application would. Conversations are replayed concurrently.
+
+Usage:
+    python replay.py conversations.jsonl --concurrency 8 --output report.json
+    python replay.py conversations.jsonl --model phi3:mini --stream --set LLM_COALESCE_REQUESTS=false
+"""
+import argparse
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app.core.config import settings, Settings
+from app.core.openai import get_openai_client
+from app.schema.chat_message_schemas import MessageBase
+from app.schema.trace_schemas import TurnTrace
+from app.service.query_ai_service import QueryAIService
+
+
+def apply_overrides(overrides: List[str]):
+    for override in overrides:
+        key, _, value = override.partition("=")
+        field = Settings.model_fields.get(key)
+        if field is None:
+            raise SystemExit(f"Unknown setting: {key}")
+        adapter = TypeAdapter(field.annotation)
+        parsed = adapter.validate_json(value) if value.startswith(("[", "{")) else adapter.validate_strings(value)
+        setattr(settings, key, parsed)
+
+
+def load_conversations(path: str) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        conversations = [json.loads(line) for line in f if line.strip()]
+    for index, conversation in enumerate(conversations):
+        conversation.setdefault("id", str(index))
+    return conversations
+
+
+def ask(service: QueryAIService, history: List[MessageBase], model: str | None,
+        stream: bool) -> tuple[str, TurnTrace, float]:
+    trace = TurnTrace()
+    started = time.monotonic()
+    if stream:
+        content = "".join(service.query_ai_stream(history, llm_model=model, trace=trace))
+    else:
+        content, _ = service.query_ai(history, llm_model=model, trace=trace)
+    return content, trace, (time.monotonic() - started) * 1000
+
+
+def replay_conversation(conversation: dict, model: str | None, stream: bool) -> List[dict]:
+    service = QueryAIService(client=get_openai_client())
+    history: List[MessageBase] = []
+    records = []
+    for turn, message in enumerate(conversation["messages"]):
+        if message["role"] != "user":
+            continue
+        history.append(MessageBase(role="user", content=message["content"]))
+        record = {"conversation": conversation["id"], "turn": turn, "question": message["content"]}
+        try:
+            content, trace, latency_ms = ask(service, history, model, stream)
+        except Exception as e:
+            records.append({**record, "error": str(e)})
+            break
+        history.append(MessageBase(role="assistant", content=content or ""))
+        records.append({
+            **record,
+            "latency_ms": latency_ms,
+            "ttft_ms": next((call.ttft_ms for call in trace.calls if call.ttft_ms is not None), None),
+            "llm_calls": len(trace.calls),
+            "prompt_tokens": trace.prompt_tokens,
+            "completion_tokens": trace.completion_tokens,
+            "cached_tokens": trace.cached_tokens,
+            "tool_calls": [call.name for call in trace.tool_calls],
+            "knowledge_files": trace.knowledge_files,
+            "coalesced": trace.coalesced,
+            "answer_cached": trace.answer_cached,
+            "tier": trace.tier,
+            "routing_reason": trace.routing_reason,
+            "escalation_reason": trace.escalation_reason,
+            "tier_ms": trace.tier_ms,
+            "answer": content,
+        })
+    return records
+
+
+def percentile(values: List[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def summarize(records: List[dict], elapsed: float, config: dict) -> dict:
+    answered = [record for record in records if "error" not in record]
+    latencies = [record["latency_ms"] for record in answered]
+    ttfts = [record["ttft_ms"] for record in answered if record["ttft_ms"] is not None]
+    prompt_tokens = sum(record["prompt_tokens"] for record in answered)
+    files: dict = {}
+    for record in answered:
+        for file_name in record["knowledge_files"]:
+            files[file_name] = files.get(file_name, 0) + 1
+    return {
+        "config": config,
+        "questions": len(records),
+        "errors": len(records) - len(answered),
+        "elapsed_s": elapsed,
+        "throughput_qps": len(answered) / elapsed if elapsed else 0.0,
+        "latency_ms": {q: percentile(latencies, p) for q, p in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+        "ttft_ms": {q: percentile(ttfts, p) for q, p in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))},
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": sum(record["completion_tokens"] for record in answered),
+        "cached_tokens": sum(record["cached_tokens"] for record in answered),
+        "prompt_cache_hit_ratio": (sum(record["cached_tokens"] for record in answered) / prompt_tokens
+                                   if prompt_tokens else 0.0),
+        "tool_calls_per_question": (sum(len(record["tool_calls"]) for record in answered) / len(answered)
+                                    if answered else 0.0),
+        "knowledge_files": files,
+    }
+
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description="Replay conversations through QueryAIService and report latency.")
+    parser.add_argument("input", help="JSONL file with one conversation per line")
+    parser.add_argument("--concurrency", type=int, default=4, help="conversations replayed in parallel")
+    parser.add_argument("--model", help="model to query for every question; by default the model cascade routes "
+                                        "each question (LLM_MODEL answers when LLM_FAST_MODEL is unset)")
+    parser.add_argument("--stream", action="store_true", help="use the streaming path (reports time to first token)")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="override a setting, e.g. --set LLM_COALESCE_REQUESTS=false")
+    parser.add_argument("--output", help="write the summary and per-question records to this JSON file")
+    args = parser.parse_args(argv)
+
+    apply_overrides(args.overrides)
+    # None leaves the choice to the service, which runs the model cascade when it is configured
+    model = args.model
+    conversations = load_conversations(args.input)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = executor.map(lambda c: replay_conversation(c, model, args.stream), conversations)
+        records = [record for conversation_records in results for record in conversation_records]
+    elapsed = time.monotonic() - started
+
+    config = {"model": model, "stream": args.stream, "concurrency": args.concurrency,
+              "overrides": args.overrides}
+    summary = summarize(records, elapsed, config)
+    json.dump(summary, sys.stdout, indent=2)
+    print()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"summary": summary, "records": records}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,9 @@ from fastapi.testclient import TestClient
 from unittest.mock import MagicMock
 from main import app
 from app.service.chat_message_service import ChatMessageService
-from app.schema.chat_message_schemas import Message, StreamContent, StreamToolStart
+from app.service.generation_queue import generation_queue
+from app.schema.chat_message_schemas import BatchResult, Message, StreamContent, StreamToolStart
+from app.schema.usage_schemas import UsageReport, UsageSummary, SessionUsage
 from app.model.chat_models import Message as MessageModel
 
 # Mock the service dependency
@@ -16,6 +18,9 @@ def override_chat_message_service():
 
 # Apply the dependency override to the app
 app.dependency_overrides[ChatMessageService] = override_chat_message_service
+# Streams run on a detached copy of the service; hand back the same mock
+mock_chat_message_service.detached.return_value.__enter__.return_value = mock_chat_message_service
+mock_chat_message_service.get_session_version.return_value = None
 
 client = TestClient(app)
 
@@ -77,18 +82,20 @@ def test_create_message_for_session_stream():
     assert response.headers["content-type"] == "text/event-stream; charset=utf-8"
     
     # Manually parse the Server-Sent Events (SSE) response
-    lines = response.text.split('\n\n')
-    # Filter out any empty strings from the split
-    sse_events = [line for line in lines if line]
+    frames = [frame for frame in response.text.split('\n\n') if frame and not frame.startswith(":")]
+    sse_events = [dict(line.split(": ", 1) for line in frame.split("\n")) for frame in frames]
     
     assert len(sse_events) == 2
+    stream_id = response.headers["x-stream-id"]
     
     # Verify first event
-    event1_data = json.loads(sse_events[0].replace("data: ", ""))
+    assert sse_events[0]["id"] == f"{stream_id}:0"
+    event1_data = json.loads(sse_events[0]["data"])
     assert event1_data == {"type": "tool_start", "name": "get_knowledge"}
     
     # Verify second event
-    event2_data = json.loads(sse_events[1].replace("data: ", ""))
+    assert sse_events[1]["id"] == f"{stream_id}:1"
+    event2_data = json.loads(sse_events[1]["data"])
     assert event2_data == {"type": "content", "delta": "The price is $10."}
     
     # Verify that the service was called correctly
@@ -97,3 +104,122 @@ def test_create_message_for_session_stream():
     assert isinstance(call_args.kwargs['message'], MessageModel)
     assert call_args.kwargs['message'].content == "What is the price?"
     assert call_args.kwargs['session_id'] == session_id
+
+def test_create_messages_batch():
+    # Arrange
+    request_data = {"questions": [{"content": "Price?", "session_id": 1}, {"content": "Email?"}]}
+    mock_chat_message_service.answer_batch.return_value = iter([
+        BatchResult(index=1, content="sales@qna-agent.com"),
+        BatchResult(index=0, session_id=1, content="$10"),
+    ])
+
+    # Act
+    response = client.post("/api/v1/chat/batch/messages", json=request_data)
+
+    # Assert
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["index"] for line in lines] == [1, 0]
+    assert lines[1] == {"index": 0, "session_id": 1, "content": "$10", "error": None}
+    questions = mock_chat_message_service.answer_batch.call_args.args[0]
+    assert [q.content for q in questions] == ["Price?", "Email?"]
+
+
+def test_resume_message_stream_replays_missed_events():
+    # Arrange
+    session_id = 1
+    mock_chat_message_service.create_chat_message_stream.return_value = iter([
+        StreamToolStart(type="tool_start", name="get_knowledge"),
+        StreamContent(type="content", delta="The price is $10."),
+    ])
+    first = client.post(f"/api/v1/chat/sessions/{session_id}/messages/stream", json={"role": "user", "content": "Hi"})
+    stream_id = first.headers["x-stream-id"]
+
+    # Act: reconnect after having seen only the first event
+    response = client.get(f"/api/v1/chat/sessions/{session_id}/messages/stream/{stream_id}",
+                          headers={"Last-Event-ID": f"{stream_id}:0"})
+
+    # Assert
+    assert response.status_code == 200
+    frames = [frame for frame in response.text.split("\n\n") if frame and not frame.startswith(":")]
+    assert len(frames) == 1
+    assert frames[0].startswith(f"id: {stream_id}:1\n")
+    assert json.loads(frames[0].split("data: ", 1)[1]) == {"type": "content", "delta": "The price is $10."}
+    # The generation was not started again
+    mock_chat_message_service.create_chat_message_stream.assert_called_once()
+
+
+def test_resume_unknown_stream():
+    response = client.get("/api/v1/chat/sessions/1/messages/stream/unknown")
+
+    assert response.status_code == 404
+
+
+def test_create_message_job_and_poll():
+    # Arrange
+    def work():
+        yield StreamContent(type="content", delta="The price is $10.")
+        return MessageModel(id=5, role="assistant", content="The price is $10.", session_id=1)
+
+    mock_chat_message_service.create_chat_message_job.side_effect = \
+        lambda message, session_id: generation_queue.submit(session_id, work)
+
+    # Act
+    response = client.post("/api/v1/chat/sessions/1/jobs", json={"role": "user", "content": "Price?"})
+    job_id = response.json()["job_id"]
+    events = client.get(f"/api/v1/chat/jobs/{job_id}/events")
+    polled = client.get(f"/api/v1/chat/jobs/{job_id}")
+
+    # Assert
+    assert response.status_code == 202
+    assert response.json()["session_id"] == 1
+    assert f"id: {job_id}:2\ndata: " in events.text
+    assert polled.json()["status"] == "succeeded"
+    assert polled.json()["content"] == "The price is $10."
+    assert polled.json()["message_id"] == 5
+
+
+def test_read_unknown_job():
+    response = client.get("/api/v1/chat/jobs/unknown")
+
+    assert response.status_code == 404
+
+
+def test_read_usage():
+    # Arrange
+    mock_chat_message_service.get_usage_report.return_value = UsageReport(
+        total=UsageSummary(messages=2, prompt_tokens=400),
+        sessions=[SessionUsage(session_id=1, messages=2, prompt_tokens=400)],
+    )
+
+    # Act
+    response = client.get("/api/v1/chat/usage", params={"start": "2026-01-01T00:00:00", "limit": 5})
+
+    # Assert
+    assert response.status_code == 200
+    assert response.json()["total"]["prompt_tokens"] == 400
+    assert response.json()["sessions"][0]["session_id"] == 1
+    kwargs = mock_chat_message_service.get_usage_report.call_args.kwargs
+    assert kwargs["start"] == datetime.datetime(2026, 1, 1)
+    assert kwargs["end"] is None
+    assert kwargs["limit"] == 5
+
+
+def test_read_messages_revalidates_with_etag():
+    # Arrange
+    updated_at = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+    mock_chat_message_service.get_session_version.return_value = (updated_at, 7)
+    mock_chat_message_service.get_chat_messages_json.return_value = b"[]"
+
+    # Act
+    unchanged = client.get("/api/v1/chat/sessions/1/messages/", headers={"If-None-Match": 'W/"1-1767225600000000-7"'})
+    changed = client.get("/api/v1/chat/sessions/1/messages/", headers={"If-None-Match": 'W/"1-1767225600000000-6"'})
+
+    # Assert
+    mock_chat_message_service.get_session_version.return_value = None
+    assert unchanged.status_code == 304
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] == 'W/"1-1767225600000000-7"'
+    assert changed.json() == []
+    mock_chat_message_service.get_chat_messages_json.assert_called_once()
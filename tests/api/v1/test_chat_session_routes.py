@@ -15,6 +15,8 @@ def override_chat_session_service():
 
 # Apply the dependency override to the app
 app.dependency_overrides[ChatSessionService] = override_chat_session_service
+# Sessions have no version (no ETag) unless a test sets one
+mock_chat_session_service.get_version.return_value = None
 
 client = TestClient(app)
 
@@ -80,3 +82,23 @@ def test_delete_chat_session():
     assert response.status_code == 200
     assert response.json() == {"id": session_id, "created_at": created_at.isoformat(), "messages": []}
     mock_chat_session_service.delete.assert_called_once_with(session_id=session_id)
+
+
+def test_read_chat_session_not_modified():
+    # Arrange
+    updated_at = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+    mock_chat_session_service.get_version.return_value = (updated_at, 7)
+    mock_chat_session_service.get_by_id.return_value = ChatSession(id=1, created_at=updated_at)
+
+    # Act
+    first = client.get("/api/v1/chat/sessions/1")
+    second = client.get("/api/v1/chat/sessions/1", headers={"If-None-Match": first.headers["ETag"]})
+
+    # Assert
+    mock_chat_session_service.get_version.return_value = None
+    assert first.status_code == 200
+    assert first.headers["ETag"] == 'W/"1-1767225600000000-7"'
+    assert second.status_code == 304
+    assert second.content == b""
+    # The session itself is only loaded for the first request
+    mock_chat_session_service.get_by_id.assert_called_once_with(session_id=1)
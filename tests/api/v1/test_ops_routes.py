@@ -0,0 +1,22 @@
+from fastapi.testclient import TestClient
+
+from app.core.metrics import metrics
+from main import app
+
+client = TestClient(app)
+
+
+def test_read_metrics():
+    # Arrange
+    metrics.reset()
+    metrics.set_gauge("admission_queue_depth", 3, controller="llm")
+    metrics.observe("admission_wait_seconds", 0.5, controller="llm")
+
+    # Act
+    response = client.get("/api/v1/metrics")
+
+    # Assert
+    assert response.status_code == 200
+    data = response.json()
+    assert data["gauges"]['admission_queue_depth{controller="llm"}'] == 3
+    assert data["summaries"]['admission_wait_seconds{controller="llm"}']["count"] == 1
@@ -0,0 +1,87 @@
+import asyncio
+import json
+import threading
+import time
+
+from app.api.v1 import sse
+from app.api.v1.sse import sse_stream, encode_event, HEARTBEAT
+from app.schema.chat_message_schemas import StreamContent, StreamToolStart
+
+
+def collect(events, **kwargs):
+    async def run():
+        return [frame async for frame in sse_stream(events, **kwargs)]
+    return asyncio.run(run())
+
+
+def parse(frame: bytes) -> dict:
+    return dict(line.split(": ", 1) for line in frame.decode("utf-8").strip().split("\n"))
+
+
+def test_encode_event_matches_pydantic_serialization():
+    for event in [StreamContent(type="content", delta='Prix: 10 € "net"\n'),
+                  StreamToolStart(type="tool_start", name="get_knowledge")]:
+        assert json.loads(encode_event(event)) == json.loads(event.model_dump_json())
+
+
+def test_content_deltas_are_coalesced_into_one_frame():
+    events = enumerate([StreamContent(type="content", delta=token) for token in ["The", " price", " is", " $10."]])
+
+    frames = collect(events, window=1.0, max_bytes=1024, heartbeat=10)
+
+    assert len(frames) == 1
+    frame = parse(frames[0])
+    assert frame["id"] == "3"
+    assert json.loads(frame["data"]) == {"type": "content", "delta": "The price is $10."}
+
+
+def test_frames_flush_at_size_limit_and_around_other_events():
+    events = enumerate([
+        StreamContent(type="content", delta="aaaa"),
+        StreamContent(type="content", delta="bbbb"),
+        StreamContent(type="content", delta="cc"),
+        StreamToolStart(type="tool_start", name="get_knowledge"),
+        StreamContent(type="content", delta="dd"),
+    ])
+
+    frames = [parse(frame) for frame in collect(events, window=1.0, max_bytes=8, heartbeat=10)]
+
+    assert [(frame["id"], json.loads(frame["data"])) for frame in frames] == [
+        ("1", {"type": "content", "delta": "aaaabbbb"}),
+        ("2", {"type": "content", "delta": "cc"}),
+        ("3", {"type": "tool_start", "name": "get_knowledge"}),
+        ("4", {"type": "content", "delta": "dd"}),
+    ]
+
+
+def test_heartbeat_is_sent_while_idle_and_errors_are_reported():
+    def slow_events():
+        time.sleep(0.15)
+        yield 0, StreamContent(type="content", delta="late")
+        raise RuntimeError("upstream failed")
+
+    frames = collect(slow_events(), window=0, max_bytes=1024, heartbeat=0.05)
+
+    assert frames[0] == HEARTBEAT
+    assert json.loads(parse(frames[-2])["data"]) == {"type": "content", "delta": "late"}
+    assert json.loads(parse(frames[-1])["data"]) == {"error": "upstream failed"}
+
+
+def test_stream_ends_when_the_client_disconnects(monkeypatch):
+    monkeypatch.setattr(sse.settings, "SSE_DISCONNECT_POLL_S", 0.01)
+    finished = threading.Event()
+
+    def pending_events():
+        finished.wait(timeout=5)
+        yield from ()
+
+    async def disconnected():
+        return True
+
+    closed = []
+
+    frames = collect(pending_events(), heartbeat=10, is_disconnected=disconnected, on_close=lambda: closed.append(1))
+    finished.set()
+
+    assert frames == []
+    assert closed == [1]
@@ -1,6 +1,6 @@
 import pytest
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from testcontainers.postgres import PostgresContainer
 
 from app.core.database import get_db
@@ -59,3 +59,26 @@ def openai_client():
     """
     return get_openai_client()
 
+
+@pytest.fixture
+def sqlite_db():
+    """
+    A session on a fresh in-memory SQLite database with the app's tables, for queries whose result only a real
+    database can tell (aggregates, projections, windows).
+    """
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    db = Session(bind=engine)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def primary_and_replica(tmp_path):
+    """Sessions on two independent SQLite databases, standing in for a primary and a (lagging) read replica."""
+    sessions = tuple(Session(bind=create_engine(f"sqlite:///{tmp_path / name}.db")) for name in ("primary", "replica"))
+    for db in sessions:
+        Base.metadata.create_all(db.get_bind())
+    yield sessions
+    for db in sessions:
+        db.close()
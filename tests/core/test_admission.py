@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.admission import AdmissionController
+
+
+def test_acquire_within_limit_does_not_queue():
+    controller = AdmissionController(max_in_flight=2, max_queue=2, queue_timeout=1)
+
+    first = controller.acquire("a")
+    second = controller.acquire("b")
+
+    assert controller.in_flight == 2
+    assert controller.queued == 0
+    controller.release(first)
+    controller.release(second)
+    assert controller.in_flight == 0
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    controller = AdmissionController(max_in_flight=1, max_queue=0, queue_timeout=1)
+    controller.acquire("a")
+
+    with pytest.raises(HTTPException) as exc_info:
+        controller.acquire("b")
+
+    assert exc_info.value.status_code == 429
+    assert int(exc_info.value.headers["Retry-After"]) >= 1
+
+
+def test_queue_timeout_returns_503():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=0.05)
+    controller.acquire("a")
+
+    with pytest.raises(HTTPException) as exc_info:
+        controller.acquire("b")
+
+    assert exc_info.value.status_code == 503
+    assert "Retry-After" in exc_info.value.headers
+    assert controller.queued == 0
+
+
+def test_waiters_are_served_round_robin_across_keys():
+    controller = AdmissionController(max_in_flight=1, max_queue=10, queue_timeout=5)
+    held = controller.acquire("busy")
+    order = []
+
+    def wait_for_slot(key):
+        admitted_at = controller.acquire(key)
+        order.append(key)
+        controller.release(admitted_at)
+
+    threads = []
+    # The chatty session queues three requests before the quiet one arrives
+    for key in ["chatty", "chatty", "chatty", "quiet"]:
+        thread = threading.Thread(target=wait_for_slot, args=(key,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.05)
+
+    controller.release(held)
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert order[:2] == ["chatty", "quiet"]
+    assert controller.in_flight == 0
+
+
+def test_cancelled_async_waiter_does_not_leak_its_slot():
+    controller = AdmissionController(max_in_flight=1, max_queue=10, queue_timeout=5)
+
+    async def run():
+        held = controller.acquire("a")
+        waiting = asyncio.create_task(controller.acquire_async("b"))
+        await asyncio.sleep(0.01)
+        assert controller.queued == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        controller.release(held)
+
+    asyncio.run(run())
+
+    assert controller.queued == 0
+    assert controller.in_flight == 0
@@ -0,0 +1,24 @@
+import zlib
+
+import pytest
+
+from app.core.blob_codec import CODEC, compress, decompress
+
+
+def test_round_trip():
+    data = b'{"role":"user","content":"How much is the Pro Plan?"}' * 100
+
+    codec, compressed = compress(data)
+
+    assert codec == CODEC
+    assert len(compressed) < len(data)
+    assert decompress(codec, compressed) == data
+
+
+def test_reads_zlib_blobs_whatever_the_current_codec():
+    assert decompress("zlib", zlib.compress(b"archived")) == b"archived"
+
+
+def test_rejects_unknown_codec():
+    with pytest.raises(ValueError):
+        decompress("lz4", b"")
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+from app.core.cache import MemoryCache, SQLiteCache
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        return MemoryCache(max_entries=2)
+    return SQLiteCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+
+
+def test_get_returns_what_was_set(cache):
+    cache.set("knowledge:faq.txt", "FAQ content", ttl=60)
+
+    assert cache.get("knowledge:faq.txt") == "FAQ content"
+    assert cache.get("knowledge:pricing.txt") is None
+
+
+def test_expired_entries_are_misses(cache):
+    cache.set("answer:abc", "Hi", ttl=0.01)
+    time.sleep(0.02)
+
+    assert cache.get("answer:abc") is None
+
+
+def test_least_recently_used_entry_is_evicted(cache):
+    # Arrange
+    cache.set("a:1", "one", ttl=60)
+    time.sleep(0.01)
+    cache.set("a:2", "two", ttl=60)
+
+    # Act
+    cache.set("a:3", "three", ttl=60)
+
+    # Assert
+    assert cache.get("a:1") is None
+    assert cache.get("a:2") == "two"
+    assert cache.get("a:3") == "three"
+
+
+def test_delete_and_delete_prefix(cache):
+    cache.set("knowledge:faq.txt", "FAQ", ttl=60)
+    cache.set("answer:abc", "Hi", ttl=60)
+
+    cache.delete_prefix("knowledge:")
+    assert cache.get("knowledge:faq.txt") is None
+    cache.delete("answer:abc")
+    assert cache.get("answer:abc") is None
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    # Arrange: two instances on one file stand in for two worker processes
+    path = str(tmp_path / "shared.sqlite3")
+    first, second = SQLiteCache(path, max_entries=10), SQLiteCache(path, max_entries=10)
+
+    # Act
+    first.set("knowledge:faq.txt", "FAQ content", ttl=60)
+
+    # Assert
+    assert second.get("knowledge:faq.txt") == "FAQ content"
+
+
+def test_sqlite_cache_only_evicts_when_a_new_key_is_stored(tmp_path):
+    # Arrange
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.set("answer:abc", "Hi", ttl=60)
+    statements = []
+    cache._connection().set_trace_callback(statements.append)
+
+    # Act
+    cache.set("answer:abc", "Hello", ttl=60)
+
+    # Assert
+    assert cache.get("answer:abc") == "Hello"
+    assert not [statement for statement in statements if statement.startswith("DELETE")]
@@ -0,0 +1,36 @@
+from app.core.cancellation import CancellationToken
+
+
+def test_callbacks_run_once_on_cancel():
+    token = CancellationToken()
+    calls = []
+    token.on_cancel(lambda: calls.append("close"))
+    unregister = token.on_cancel(lambda: calls.append("unregistered"))
+
+    unregister()
+    token.cancel()
+    token.cancel()
+
+    assert token.cancelled
+    assert calls == ["close"]
+
+
+def test_callback_registered_after_cancel_runs_right_away():
+    token = CancellationToken()
+    token.cancel()
+    calls = []
+
+    token.on_cancel(lambda: calls.append("close"))
+
+    assert calls == ["close"]
+
+
+def test_failing_callback_does_not_stop_the_others():
+    token = CancellationToken()
+    calls = []
+    token.on_cancel(lambda: 1 / 0)
+    token.on_cancel(lambda: calls.append("close"))
+
+    token.cancel()
+
+    assert calls == ["close"]
@@ -0,0 +1,35 @@
+from app.core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from app.core.metrics import metrics
+
+
+def test_opens_after_consecutive_failures_and_refuses_calls():
+    breaker = CircuitBreaker("test", failure_threshold=2, open_seconds=60)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert not breaker.available()
+    assert not breaker.acquire()
+    assert 0 < breaker.retry_after() <= 60
+    assert metrics.snapshot()["gauges"]['llm_circuit_state{backend="test"}'] == 2
+
+
+def test_half_open_probe_closes_or_reopens_the_circuit():
+    breaker = CircuitBreaker("probe", failure_threshold=1, open_seconds=0, half_open_probes=1)
+    breaker.record_failure()
+
+    assert breaker.acquire()
+    assert breaker.state == HALF_OPEN
+    # Only one trial call at a time
+    assert not breaker.acquire()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    assert breaker.acquire()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.acquire()
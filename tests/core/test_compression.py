@@ -0,0 +1,61 @@
+import gzip
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.compression import CompressionMiddleware
+
+app = FastAPI()
+app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+
+@app.get("/large")
+def large():
+    return {"content": "x" * 1000}
+
+
+@app.get("/small")
+def small():
+    return {"content": "x"}
+
+
+@app.get("/events")
+def events():
+    return StreamingResponse(iter([b"data: " + b"x" * 1000 + b"\n\n"]), media_type="text/event-stream")
+
+
+client = TestClient(app)
+
+
+def test_compresses_large_responses_with_gzip():
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert int(response.headers["Content-Length"]) < 1000
+    assert response.json() == {"content": "x" * 1000}
+
+
+def test_leaves_small_streamed_and_unaccepted_responses_alone():
+    small_response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    events_response = client.get("/events", headers={"Accept-Encoding": "gzip"})
+    refused = client.get("/large", headers={"Accept-Encoding": "gzip;q=0, identity"})
+
+    assert "Content-Encoding" not in small_response.headers
+    assert "Content-Encoding" not in events_response.headers
+    assert "Content-Encoding" not in refused.headers
+
+
+def test_prefers_brotli_when_available():
+    # Arrange: a stand-in for the optional brotli package
+    fake_brotli = SimpleNamespace(compress=lambda body, quality: gzip.compress(body))
+
+    with patch("app.core.compression.brotli", fake_brotli):
+        # Act
+        response = client.get("/large", headers={"Accept-Encoding": "gzip, br"})
+
+    # Assert
+    assert response.headers["Content-Encoding"] == "br"
@@ -0,0 +1,80 @@
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, inspect, text
+
+from app.core.database import Base, init_db, schema_drift, schema_version
+import app.model.chat_models  # noqa: F401  (registers the tables on Base)
+
+
+def test_init_db_skips_ddl_when_schema_is_current(tmp_path):
+    # Arrange
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}")
+    init_db(engine)
+
+    # Act
+    with patch.object(Base.metadata, "create_all") as create_all:
+        init_db(engine)
+
+    # Assert
+    create_all.assert_not_called()
+    assert {"chat_sessions", "messages", "schema_version"} <= set(inspect(engine).get_table_names())
+
+
+def test_init_db_runs_ddl_when_schema_changed(tmp_path):
+    # Arrange
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}")
+    init_db(engine)
+
+    # Act
+    with patch("app.core.database.schema_version", return_value="changed"), \
+            patch.object(Base.metadata, "create_all") as create_all:
+        init_db(engine)
+
+    # Assert
+    create_all.assert_called_once_with(engine)
+
+
+def test_init_db_adds_missing_columns_and_indexes(tmp_path):
+    # Arrange: tables as created before the usage, tool call and interrupted columns existed
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE chat_sessions (id INTEGER PRIMARY KEY, created_at DATETIME)"))
+        connection.execute(text("CREATE TABLE messages (id INTEGER PRIMARY KEY, session_id INTEGER, role VARCHAR, "
+                                "content VARCHAR, created_at DATETIME)"))
+        connection.execute(text("INSERT INTO chat_sessions (id) VALUES (1)"))
+        connection.execute(text("INSERT INTO messages (id, session_id, role, content) VALUES (1, 1, 'user', 'Hi')"))
+
+    # Act
+    init_db(engine)
+
+    # Assert
+    inspector = inspect(engine)
+    columns = {column["name"] for column in inspector.get_columns("messages")}
+    assert {"tool_calls", "tool_call_id", "prompt_tokens", "ttft_ms", "interrupted"} <= columns
+    assert "updated_at" in {column["name"] for column in inspector.get_columns("chat_sessions")}
+    indexes = {index["name"] for index in inspector.get_indexes("messages")}
+    assert {"ix_messages_session_id", "ix_messages_created_at"} <= indexes
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT interrupted FROM messages WHERE id = 1")).scalar() == 0
+
+
+def test_init_db_does_not_record_version_while_schema_differs(tmp_path):
+    # Arrange: a column that should be NOT NULL but was added as nullable, which ADD COLUMN cannot change
+    engine = create_engine(f"sqlite:///{tmp_path / 'chat.db'}")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE messages (id INTEGER PRIMARY KEY, session_id INTEGER, role VARCHAR, "
+                                "content VARCHAR, created_at DATETIME, interrupted BOOLEAN)"))
+
+    # Act
+    init_db(engine)
+
+    # Assert
+    assert schema_drift(engine) == ["nullability of messages.interrupted"]
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM schema_version")).scalar() == 0
+
+
+def test_schema_version_is_stable():
+    engine = create_engine("sqlite://")
+
+    assert schema_version(engine) == schema_version(engine)
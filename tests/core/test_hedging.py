@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from app.core.hedging import hedged_call, hedged_stream
+from app.core.metrics import metrics
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+
+
+def test_fast_primary_does_not_fire_hedge():
+    hedge_calls = []
+
+    result = hedged_call(lambda: "primary", lambda: hedge_calls.append(1) or "hedge", hedge_after=1)
+
+    assert result == "primary"
+    assert hedge_calls == []
+    assert "hedge_fired_total{operation=\"llm\"}" not in metrics.snapshot()["counters"]
+
+
+def test_slow_primary_loses_to_hedge():
+    release = threading.Event()
+
+    def slow_primary():
+        release.wait(timeout=5)
+        return "primary"
+
+    result = hedged_call(slow_primary, lambda: "hedge", hedge_after=0.05)
+    release.set()
+
+    assert result == "hedge"
+    counters = metrics.snapshot()["counters"]
+    assert counters['hedge_fired_total{operation="llm"}'] == 1
+    assert counters['hedge_wins_total{operation="llm",winner="hedge"}'] == 1
+
+
+def test_failed_attempt_falls_back_to_the_other():
+    def slow_failing_primary():
+        time.sleep(0.1)
+        raise RuntimeError("primary failed")
+
+    def hedge():
+        time.sleep(0.2)
+        return "hedge"
+
+    assert hedged_call(slow_failing_primary, hedge, hedge_after=0.05) == "hedge"
+
+
+class FakeStream:
+    def __init__(self, items, delay=0.0):
+        self.items = items
+        self.delay = delay
+        self.closed = False
+
+    def __iter__(self):
+        time.sleep(self.delay)
+        for item in self.items:
+            if self.closed:
+                return
+            yield item
+
+    def close(self):
+        self.closed = True
+
+
+def test_hedged_stream_uses_first_stream_to_produce_and_closes_loser():
+    slow = FakeStream(["slow"], delay=0.3)
+    fast = FakeStream(["fast", " answer"])
+
+    result = list(hedged_stream(lambda: slow, lambda: fast, hedge_after=0.05))
+    time.sleep(0.4)
+
+    assert result == ["fast", " answer"]
+    assert slow.closed
+    assert fast.closed
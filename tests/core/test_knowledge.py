@@ -0,0 +1,80 @@
+from unittest.mock import patch
+
+import pytest
+
+from app.core.knowledge import KnowledgeError, read_knowledge
+from app.core.knowledge_artifact import build_artifact
+from app.core.knowledge_index import KnowledgeIndex
+from app.core.knowledge_sections import find_section, index_sections
+
+PRICING = (
+    "QnA-Agent Pricing Plans:\n"
+    "\n"
+    "1.  **Basic Plan:**\n"
+    "    *   Price: $10/month\n"
+    "\n"
+    "2.  **Pro Plan:**\n"
+    "    *   Price: $50/month\n"
+)
+
+
+@pytest.fixture
+def knowledge_dir(tmp_path, monkeypatch):
+    (tmp_path / "pricing.txt").write_text(PRICING, encoding="utf-8")
+    (tmp_path / "large.txt").write_text("".join(f"# Part {i}\n{'x' * 60}\n" for i in range(100)), encoding="utf-8")
+    monkeypatch.setattr("app.core.knowledge.knowledge_index", KnowledgeIndex(directory=str(tmp_path)))
+    return tmp_path
+
+
+def test_index_sections():
+    sections = index_sections(PRICING.encode("utf-8").splitlines(keepends=True))
+
+    assert [section.title for section in sections] == ["QnA-Agent Pricing Plans", "Basic Plan", "Pro Plan"]
+    assert PRICING.encode("utf-8")[sections[1].offset:sections[1].offset + sections[1].length] == \
+        b"1.  **Basic Plan:**\n    *   Price: $10/month\n\n"
+    assert find_section(sections, "pro plan") is sections[2]
+    assert find_section(sections, "Plan") is None  # ambiguous
+
+
+def test_reads_section_of_loose_file(knowledge_dir):
+    assert read_knowledge("pricing.txt", "Pro Plan") == "2.  **Pro Plan:**\n    *   Price: $50/month\n"
+    assert read_knowledge("pricing.txt") == PRICING
+
+
+def test_unknown_section_lists_available_ones(knowledge_dir):
+    with pytest.raises(KnowledgeError) as error:
+        read_knowledge("pricing.txt", "Free Plan")
+
+    assert "Available sections: QnA-Agent Pricing Plans; Basic Plan; Pro Plan" in str(error.value)
+
+
+def test_oversized_output_is_truncated_deterministically(knowledge_dir):
+    # Act
+    first = read_knowledge("large.txt", max_bytes=495)
+    second = read_knowledge("large.txt", max_bytes=495)
+
+    # Assert
+    content, note = first.split("\n\n[Truncated: ")
+    assert first == second
+    assert len(content.encode("utf-8")) <= 495
+    assert content.endswith("x" * 60)  # cut at a line break
+    assert "Sections: Part 0; Part 1; Part 2" in note
+
+
+def test_missing_file(knowledge_dir):
+    with pytest.raises(KnowledgeError) as error:
+        read_knowledge("missing.txt")
+
+    assert str(error.value) == "Error: File 'missing.txt' not found in the knowledge base."
+
+
+def test_reads_sections_from_artifact(knowledge_dir, tmp_path_factory):
+    # Arrange
+    path = str(tmp_path_factory.mktemp("artifact") / "knowledge.qkb")
+    build_artifact(str(knowledge_dir), path)
+    from_files = read_knowledge("large.txt", max_bytes=495)
+
+    with patch("app.core.knowledge.knowledge_index", KnowledgeIndex(artifact_path=path)):
+        # Act / Assert
+        assert read_knowledge("pricing.txt", "basic plan") == "1.  **Basic Plan:**\n    *   Price: $10/month\n\n"
+        assert read_knowledge("large.txt", max_bytes=495) == from_files
@@ -0,0 +1,70 @@
+import pytest
+
+from app.core.knowledge_artifact import KnowledgeArtifact, build_artifact, split_passages
+
+
+@pytest.fixture
+def knowledge_dir(tmp_path):
+    directory = tmp_path / "knowledge"
+    directory.mkdir()
+    (directory / "faq.txt").write_text("Q: Price?\nA: 10 €\n\n\nQ: Support?\nA: Email support@qna-agent.com\n",
+                                       encoding="utf-8")
+    (directory / "pricing.txt").write_text("Basic Plan: $10/month", encoding="utf-8")
+    return directory
+
+
+def test_split_passages():
+    text = "first\nparagraph\n\n  \nsecond\n\n"
+
+    assert [text[start:end] for start, end in split_passages(text)] == ["first\nparagraph", "second"]
+
+
+def test_artifact_serves_files_passages_and_terms(knowledge_dir, tmp_path):
+    # Arrange
+    path = str(tmp_path / "knowledge.qkb")
+    version_id = build_artifact(str(knowledge_dir), path)
+
+    # Act
+    artifact = KnowledgeArtifact(path)
+
+    # Assert
+    assert artifact.version_id == version_id
+    assert artifact.read("faq.txt") == (knowledge_dir / "faq.txt").read_text(encoding="utf-8")
+    assert artifact.read("missing.txt") is None
+    assert list(artifact.passages("faq.txt")) == ["Q: Price?\nA: 10 €", "Q: Support?\nA: Email support@qna-agent.com"]
+    assert [artifact.passage(i) for i in artifact.lookup("Support")] == ["Q: Support?\nA: Email support@qna-agent.com"]
+    assert artifact.file_of(artifact.lookup("plan")[0]) == "pricing.txt"
+    assert artifact.is_current(str(knowledge_dir))
+    artifact.close()
+
+
+def test_version_follows_content(knowledge_dir, tmp_path):
+    # Arrange
+    first = build_artifact(str(knowledge_dir), str(tmp_path / "first.qkb"))
+    (knowledge_dir / "pricing.txt").write_text("Basic Plan: $12/month", encoding="utf-8")
+
+    # Act
+    second = build_artifact(str(knowledge_dir), str(tmp_path / "second.qkb"))
+
+    # Assert
+    assert first != second
+    assert not KnowledgeArtifact(str(tmp_path / "first.qkb")).is_current(str(knowledge_dir))
+
+
+def test_artifact_without_index(knowledge_dir, tmp_path):
+    path = str(tmp_path / "knowledge.qkb")
+    build_artifact(str(knowledge_dir), path, with_index=False)
+
+    artifact = KnowledgeArtifact(path)
+
+    assert not artifact.has_index
+    assert artifact.lookup("support") == []
+    assert artifact.read("pricing.txt") == "Basic Plan: $10/month"
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not-an-artifact"
+    path.write_bytes(b"\0" * 128)
+
+    with pytest.raises(ValueError):
+        KnowledgeArtifact(str(path))
@@ -0,0 +1,114 @@
+import os
+import time
+from unittest.mock import patch
+
+from app.core.cache import MemoryCache
+from app.core.knowledge_artifact import build_artifact
+from app.core.knowledge_index import KnowledgeIndex
+from app.core.metrics import metrics
+
+
+def _touch(path, content):
+    # Bump mtime explicitly so the change is visible on filesystems with coarse timestamps
+    stat = path.stat() if path.exists() else None
+    path.write_text(content, encoding="utf-8")
+    if stat is not None:
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_refresh_reindexes_only_changed_files(tmp_path):
+    # Arrange
+    _touch(tmp_path / "a.txt", "# Alpha\nalpha content\n")
+    _touch(tmp_path / "b.txt", "# Beta\nbeta content\n")
+    index = KnowledgeIndex(directory=str(tmp_path))
+    metrics.reset()
+    first = index.current
+
+    # Act
+    _touch(tmp_path / "b.txt", "# Beta\nbeta content, revised\n")
+    _touch(tmp_path / "c.txt", "gamma\n")
+    changed = index.refresh()
+
+    # Assert
+    assert metrics.snapshot()["counters"]["knowledge_files_indexed_total"] == 4
+    assert changed == ["b.txt", "c.txt"]
+    assert index.current.files["a.txt"] is first.files["a.txt"]
+    assert index.current.has_term("revised") and not first.has_term("revised")
+    assert index.current.version_id != first.version_id
+
+
+def test_refresh_without_changes_keeps_snapshot(tmp_path):
+    _touch(tmp_path / "a.txt", "alpha\n")
+    index = KnowledgeIndex(directory=str(tmp_path))
+    first = index.current
+
+    # A touched but unchanged file is re-hashed, not reported
+    _touch(tmp_path / "a.txt", "alpha\n")
+
+    assert index.refresh() == []
+    assert index.current is first
+
+
+def test_refresh_invalidates_cache_of_changed_files(tmp_path):
+    # Arrange
+    _touch(tmp_path / "a.txt", "alpha\n")
+    _touch(tmp_path / "b.txt", "beta\n")
+    cache = MemoryCache(max_entries=10)
+    for key in ("knowledge:a.txt", "knowledge:a.txt#Intro", "knowledge:b.txt", "answer:x"):
+        cache.set(key, "cached", 60)
+    index = KnowledgeIndex(directory=str(tmp_path))
+    index.current
+
+    # Act
+    (tmp_path / "a.txt").unlink()
+    with patch("app.core.knowledge_index.get_cache", return_value=cache):
+        changed = index.refresh()
+
+    # Assert
+    assert changed == ["a.txt"]
+    assert cache.get("knowledge:a.txt") is None
+    assert cache.get("knowledge:a.txt#Intro") is None
+    assert cache.get("knowledge:b.txt") == "cached"
+    assert cache.get("answer:x") == "cached"
+
+
+def test_reloads_rebuilt_artifact(tmp_path):
+    # Arrange
+    source, artifact = tmp_path / "src", str(tmp_path / "knowledge.qkb")
+    source.mkdir()
+    _touch(source / "a.txt", "alpha\n")
+    build_artifact(str(source), artifact)
+    index = KnowledgeIndex(artifact_path=artifact)
+    first = index.current
+
+    # Act
+    unchanged = index.refresh()
+    _touch(source / "a.txt", "alpha, revised\n")
+    build_artifact(str(source), artifact)
+    changed = index.refresh()
+
+    # Assert
+    assert unchanged == []
+    assert changed == ["a.txt"]
+    assert index.current.artifact.read("a.txt") == "alpha, revised\n"
+    assert index.current.version_id != first.version_id
+    # The previous mapping stays readable for requests that still hold it
+    assert first.artifact.read("a.txt") == "alpha\n"
+
+
+def test_watcher_picks_up_changes(tmp_path):
+    _touch(tmp_path / "a.txt", "alpha\n")
+    index = KnowledgeIndex(directory=str(tmp_path))
+    index.current
+    _touch(tmp_path / "a.txt", "alpha, revised\n")
+
+    index.start_watching(0.01)
+    try:
+        for _ in range(200):
+            if index.current.has_term("revised"):
+                break
+            time.sleep(0.01)
+    finally:
+        index.stop_watching()
+
+    assert index.current.has_term("revised")
@@ -0,0 +1,177 @@
+import gc
+from unittest.mock import MagicMock
+
+import httpx
+import openai
+import pytest
+
+from app.core.circuit_breaker import HALF_OPEN, CircuitBreaker, CircuitOpenError
+from app.core.config import LLMBackendSettings
+from app.core.llm_router import LLMBackend, LLMRouter, build_backend_client, supports_stream_usage
+from app.core.retry_budget import RetryBudget
+
+
+def make_backend(name, model=""):
+    return LLMBackend(name=name, client=MagicMock(), model=model)
+
+
+def server_error():
+    request = httpx.Request("POST", "http://llm/v1/chat/completions")
+    return openai.InternalServerError("boom", response=httpx.Response(500, request=request), body=None)
+
+
+def bad_request():
+    request = httpx.Request("POST", "http://llm/v1/chat/completions")
+    return openai.BadRequestError("bad", response=httpx.Response(400, request=request), body=None)
+
+
+def test_prefers_backend_with_lower_latency():
+    fast, slow = make_backend("fast"), make_backend("slow")
+    fast.latency, slow.latency = 0.1, 1.0
+    router = LLMRouter([slow, fast])
+
+    router.chat.completions.create(model="m", messages=[])
+
+    fast.client.chat.completions.create.assert_called_once()
+    slow.client.chat.completions.create.assert_not_called()
+
+
+def test_balances_on_outstanding_requests():
+    first, second = make_backend("first"), make_backend("second")
+    first.latency, second.latency = 0.1, 0.15
+    first.in_flight = 3
+    router = LLMRouter([first, second])
+
+    assert router.acquire() is second
+
+
+def test_applies_backend_model_override():
+    backend = make_backend("azure-eu", model="gpt-4o-eu")
+    router = LLMRouter([backend])
+
+    router.chat.completions.create(model="gpt-4o", messages=[])
+
+    assert backend.client.chat.completions.create.call_args.kwargs["model"] == "gpt-4o-eu"
+
+
+def test_drops_stream_options_for_backends_rejecting_them():
+    backend = LLMBackend(name="azure", client=MagicMock(),
+                         stream_usage=supports_stream_usage("https://x.openai.azure.com", "2023-07-01-preview"))
+    router = LLMRouter([backend])
+
+    router.chat.completions.create(model="m", messages=[], stream=True, stream_options={"include_usage": True})
+
+    assert "stream_options" not in backend.client.chat.completions.create.call_args.kwargs
+    assert supports_stream_usage("https://x.openai.azure.com", "2024-10-21")
+    assert supports_stream_usage("", "2023-07-01-preview")
+
+
+def test_ejects_backend_after_repeated_failures():
+    broken, healthy = make_backend("broken"), make_backend("healthy")
+    broken.latency, healthy.latency = 0.1, 5.0
+    broken.client.chat.completions.create.side_effect = server_error()
+    router = LLMRouter([broken, healthy], eject_after_failures=2, eject_seconds=60)
+
+    for _ in range(2):
+        with pytest.raises(openai.InternalServerError):
+            router.chat.completions.create(model="m", messages=[])
+    router.chat.completions.create(model="m", messages=[])
+
+    assert broken.client.chat.completions.create.call_count == 2
+    healthy.client.chat.completions.create.assert_called_once()
+    assert broken.in_flight == 0
+
+
+def test_stream_tracks_time_to_first_chunk_and_releases():
+    backend = make_backend("local")
+    backend.client.chat.completions.create.return_value = iter(["a", "b"])
+    router = LLMRouter([backend])
+
+    stream = router.chat.completions.create(model="m", messages=[], stream=True)
+    assert backend.in_flight == 1
+    assert list(stream) == ["a", "b"]
+
+    assert backend.in_flight == 0
+    assert backend.latency is not None
+
+
+def test_fails_fast_when_every_circuit_is_open():
+    backend = make_backend("only")
+    backend.client.chat.completions.create.side_effect = server_error()
+    router = LLMRouter([backend], eject_after_failures=1, eject_seconds=60)
+
+    with pytest.raises(openai.InternalServerError):
+        router.chat.completions.create(model="m", messages=[])
+    with pytest.raises(CircuitOpenError) as raised:
+        router.chat.completions.create(model="m", messages=[])
+
+    assert backend.client.chat.completions.create.call_count == 1
+    assert raised.value.retry_after > 0
+
+
+def test_skips_backends_whose_breaker_refuses_the_call():
+    # Arrange: the preferred backend's breaker has given its trial call to another request in the meantime
+    refusing, other = make_backend("refusing"), make_backend("other")
+    refusing.latency, other.latency = 0.1, 1.0
+    refusing.breaker = MagicMock(**{"available.return_value": True, "acquire.return_value": False,
+                                    "retry_after.return_value": 5.0})
+    router = LLMRouter([refusing, other])
+
+    # Act / Assert
+    assert router.acquire() is other
+    assert refusing.in_flight == 0
+    other.breaker = refusing.breaker
+    with pytest.raises(CircuitOpenError):
+        router.acquire()
+
+
+def test_abandoned_stream_neither_succeeds_nor_fails_its_trial_call():
+    # Arrange: a half-open backend whose only trial call is a stream nobody reads
+    backend = make_backend("recovering")
+    backend.breaker = CircuitBreaker("recovering", failure_threshold=1, open_seconds=0)
+    backend.breaker.record_failure()
+    router = LLMRouter([backend])
+    stream = router.chat.completions.create(model="m", messages=[], stream=True)
+
+    # Act
+    del stream
+    gc.collect()
+
+    # Assert: still half-open, with the trial call available again
+    assert backend.in_flight == 0
+    assert backend.breaker.state == HALF_OPEN
+    assert router.acquire() is backend
+
+
+def test_retries_retryable_errors_within_budget():
+    backend = make_backend("flaky")
+    backend.client.chat.completions.create.side_effect = [server_error(), server_error(), "response"]
+    router = LLMRouter([backend], eject_after_failures=5, max_attempts=3, backoff=0.001,
+                       retry_budget=RetryBudget(ratio=0, min_per_second=0, max_tokens=2))
+
+    assert router.chat.completions.create(model="m", messages=[]) == "response"
+    assert backend.client.chat.completions.create.call_count == 3
+
+
+def test_does_not_retry_client_errors_or_past_the_budget():
+    rejecting, failing = make_backend("rejecting"), make_backend("failing")
+    rejecting.client.chat.completions.create.side_effect = bad_request()
+    failing.client.chat.completions.create.side_effect = server_error()
+    budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=1)
+
+    with pytest.raises(openai.BadRequestError):
+        LLMRouter([rejecting], max_attempts=3, backoff=0.001, retry_budget=budget) \
+            .chat.completions.create(model="m", messages=[])
+    with pytest.raises(openai.InternalServerError):
+        LLMRouter([failing], eject_after_failures=5, max_attempts=5, backoff=0.001, retry_budget=budget) \
+            .chat.completions.create(model="m", messages=[])
+
+    rejecting.client.chat.completions.create.assert_called_once()
+    # One retry was left in the budget
+    assert failing.client.chat.completions.create.call_count == 2
+
+
+def test_backend_clients_leave_retries_to_the_router():
+    assert build_backend_client(LLMBackendSettings(base_url="http://llm/v1/", api_key="k")).max_retries == 0
+    assert build_backend_client(LLMBackendSettings(azure_endpoint="https://x.openai.azure.com", api_key="k",
+                                                   api_version="2024-10-21")).max_retries == 0
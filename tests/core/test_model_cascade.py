@@ -0,0 +1,37 @@
+from app.core.knowledge_index import scan_directory
+from app.core.model_cascade import FAST, LARGE, classify, knowledge_coverage, needs_escalation
+
+
+def make_snapshot(tmp_path):
+    (tmp_path / "pricing.txt").write_text("The Pro plan costs $50 per month and includes priority support.")
+    return scan_directory(str(tmp_path))
+
+
+def test_routes_short_covered_questions_to_the_fast_tier(tmp_path):
+    snapshot = make_snapshot(tmp_path)
+
+    decision = classify("What does the Pro plan cost per month?", snapshot, max_chars=300, min_coverage=0.5)
+
+    assert decision == (FAST, "simple")
+
+
+def test_escalates_long_complex_or_uncovered_questions(tmp_path):
+    snapshot = make_snapshot(tmp_path)
+
+    def tier(question):
+        return classify(question, snapshot, max_chars=60, min_coverage=0.5)
+
+    assert tier("Pro plan cost? " * 5) == (LARGE, "long")
+    assert tier("Pro plan cost? Support?") == (LARGE, "multiple_questions")
+    assert tier("Compare the Pro plan support") == (LARGE, "complex")
+    assert tier("Is there an on-premise deployment?") == (LARGE, "low_knowledge_coverage")
+
+
+def test_coverage_is_unknown_without_knowledge(tmp_path):
+    assert knowledge_coverage("What does the Pro plan cost?", scan_directory(str(tmp_path / "missing"))) is None
+
+
+def test_needs_escalation_for_empty_or_hedging_answers():
+    assert needs_escalation("") == "empty_answer"
+    assert needs_escalation("I'm not sure which plan you mean.") == "uncertain_answer"
+    assert needs_escalation("The Pro plan costs $50 per month.") is None
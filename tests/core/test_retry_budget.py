@@ -0,0 +1,12 @@
+from app.core.retry_budget import RetryBudget
+
+
+def test_retries_are_limited_to_a_share_of_requests():
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    budget.record_request()
+    assert not budget.try_spend()
+    budget.record_request()
+    assert budget.try_spend()
@@ -0,0 +1,110 @@
+import threading
+import time
+
+import pytest
+
+from app.core.cancellation import CancellationToken
+from app.core.single_flight import SingleFlight, fingerprint
+
+
+def test_fingerprint_is_order_independent():
+    assert fingerprint({"a": 1, "b": [1, 2]}) == fingerprint({"b": [1, 2], "a": 1})
+    assert fingerprint({"a": 1}) != fingerprint({"a": 2})
+
+
+def test_do_coalesces_concurrent_calls():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        release.wait(timeout=5)
+        return "answer"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(single_flight.do("key", slow_call))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == ["answer"] * 5
+    assert len(calls) == 1
+
+
+def test_do_propagates_errors_and_forgets_key():
+    single_flight = SingleFlight()
+
+    def failing_call():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        single_flight.do("key", failing_call)
+    # A finished call is not reused
+    assert single_flight.do("key", lambda: "fresh") == "fresh"
+
+
+def test_stream_fans_out_one_upstream():
+    single_flight = SingleFlight()
+    release = threading.Event()
+    upstream_calls = []
+
+    def upstream(cancellation):
+        upstream_calls.append(1)
+        release.wait(timeout=5)
+        yield "Hello"
+        yield " there"
+
+    results = [[] for _ in range(3)]
+
+    def consume(index):
+        results[index].extend(single_flight.stream("key", upstream))
+
+    threads = [threading.Thread(target=consume, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == [["Hello", " there"]] * 3
+    assert len(upstream_calls) == 1
+
+
+def test_stream_propagates_upstream_errors():
+    single_flight = SingleFlight()
+
+    def upstream(cancellation):
+        yield "partial"
+        raise RuntimeError("upstream failed")
+
+    received = []
+    with pytest.raises(RuntimeError):
+        for chunk in single_flight.stream("key", upstream):
+            received.append(chunk)
+    assert received == ["partial"]
+
+
+def test_stream_cancels_upstream_once_every_caller_is_cancelled():
+    single_flight = SingleFlight()
+    upstream_cancelled = threading.Event()
+    first, second = CancellationToken(), CancellationToken()
+
+    def upstream(cancellation):
+        cancellation.on_cancel(upstream_cancelled.set)
+        yield "Hello"
+        upstream_cancelled.wait(timeout=5)
+
+    streams = [single_flight.stream("key", upstream, first), single_flight.stream("key", upstream, second)]
+    assert [next(stream) for stream in streams] == ["Hello", "Hello"]
+
+    first.cancel()
+    assert not upstream_cancelled.is_set()
+    second.cancel()
+
+    assert upstream_cancelled.wait(timeout=5)
+    assert [list(stream) for stream in streams] == [[], []]
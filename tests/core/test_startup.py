@@ -0,0 +1,36 @@
+import sys
+
+from app.core.startup import StartupProfiler
+
+
+def test_profiler_is_off_without_env_var(monkeypatch):
+    monkeypatch.delenv("STARTUP_PROFILE", raising=False)
+    profiler = StartupProfiler()
+
+    assert not profiler.install()
+    assert profiler.report()["modules_imported"] == 0
+
+
+def test_profiler_times_imports_and_phases(monkeypatch, tmp_path):
+    # Arrange: two fresh modules, one importing the other
+    (tmp_path / "startup_probe_inner.py").write_text("import time\ntime.sleep(0.02)\n")
+    (tmp_path / "startup_probe_outer.py").write_text("import startup_probe_inner\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setenv("STARTUP_PROFILE", "1")
+    profiler = StartupProfiler()
+
+    # Act
+    assert profiler.install()
+    try:
+        with profiler.phase("import probe"):
+            import startup_probe_outer  # noqa: F401
+    finally:
+        profiler.uninstall()
+        sys.modules.pop("startup_probe_outer", None)
+        sys.modules.pop("startup_probe_inner", None)
+
+    # Assert
+    assert profiler.imports["startup_probe_outer"] >= profiler.imports["startup_probe_inner"] >= 0.02
+    assert profiler.import_self["startup_probe_outer"] < 0.02
+    assert profiler.phases["import probe"] >= 0.02
+    assert profiler.report()["slowest_imports_ms"][0]["module"] == "startup_probe_inner"
@@ -119,7 +119,9 @@ def test_create_message_for_session(db_session):
     assert "month" in final_answer
 
     # Verify messages in DB
-    messages_in_db = db_session.query(Message).filter_by(session_id=session.id).order_by(Message.id).all()
+    # Tool calls and their results are persisted between the question and the answer
+    messages_in_db = db_session.query(Message).filter(Message.session_id == session.id, Message.role != "tool",
+                                                      Message.tool_calls.is_(None)).order_by(Message.id).all()
     assert len(messages_in_db) == 2
     assert messages_in_db[0].role == "user"
     assert messages_in_db[0].content == user_message_content
@@ -160,7 +162,9 @@ def test_create_message_for_session_stream(db_session):
     assert "sales@qna-agent.com" in full_response_content
 
     # Verify messages in DB
-    messages_in_db = db_session.query(Message).filter_by(session_id=session.id).order_by(Message.id).all()
+    # Tool calls and their results are persisted between the question and the answer
+    messages_in_db = db_session.query(Message).filter(Message.session_id == session.id, Message.role != "tool",
+                                                      Message.tool_calls.is_(None)).order_by(Message.id).all()
     assert len(messages_in_db) == 2
     assert messages_in_db[0].role == "user"
     assert messages_in_db[0].content == user_message_content
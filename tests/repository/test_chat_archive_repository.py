@@ -0,0 +1,107 @@
+import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.core.database import Base
+from app.model.chat_models import ArchivedSession, ChatSession, Message
+from app.repository.chat_archive_repository import ChatArchiveRepository
+from app.repository.chat_message_repository import ChatMessageRepository
+from app.repository.chat_session_repository import ChatSessionRepository
+from app.service.chat_session_service import ChatSessionService
+from app.service.session_archiver import SessionArchiver
+
+LONG_AGO = datetime.datetime(2026, 1, 1)
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add_all([ChatSession(id=1, created_at=LONG_AGO, updated_at=LONG_AGO),
+                ChatSession(id=2, created_at=LONG_AGO, updated_at=datetime.datetime.utcnow())])
+    db.add_all([
+        Message(id=1, session_id=1, role="user", content="Price?", created_at=LONG_AGO),
+        Message(id=2, session_id=1, role="assistant", content="",
+                tool_calls=[{"id": "call_1", "name": "get_knowledge", "arguments": "{}"}], created_at=LONG_AGO),
+        Message(id=3, session_id=1, role="tool", content="Pro Plan: $50/month", tool_call_id="call_1",
+                created_at=LONG_AGO),
+        Message(id=4, session_id=1, role="assistant", content="$50 per month.", created_at=LONG_AGO,
+                prompt_tokens=120, duration_ms=850.5),
+        Message(id=5, session_id=2, role="user", content="Recent", created_at=LONG_AGO),
+    ])
+    db.commit()
+    db.close()
+    return factory
+
+
+def test_archiver_moves_only_idle_sessions(session_factory):
+    # Act
+    archived = SessionArchiver(idle_after=3600, batch_size=10, session_factory=session_factory).run_once()
+
+    # Assert
+    db = session_factory()
+    assert archived == 1
+    assert [message.session_id for message in db.query(Message).all()] == [2]
+    archive = db.get(ArchivedSession, 1)
+    assert archive.message_count == 4
+    assert len(archive.data) < archive.raw_bytes
+
+
+def test_reads_rehydrate_archived_session(session_factory):
+    # Arrange
+    SessionArchiver(idle_after=3600, batch_size=10, session_factory=session_factory).run_once()
+    db = session_factory()
+
+    # Act
+    listed = ChatMessageRepository(db=db).get_by_session_id(1)
+
+    # Assert
+    assert [message.id for message in listed] == [1, 4]
+    messages = db.query(Message).filter_by(session_id=1).order_by(Message.id).all()
+    assert [(m.id, m.role, m.content, m.tool_call_id) for m in messages] == [
+        (1, "user", "Price?", None), (2, "assistant", "", None), (3, "tool", "Pro Plan: $50/month", "call_1"),
+        (4, "assistant", "$50 per month.", None),
+    ]
+    assert messages[1].tool_calls == [{"id": "call_1", "name": "get_knowledge", "arguments": "{}"}]
+    assert (messages[3].created_at, messages[3].prompt_tokens, messages[3].duration_ms) == (LONG_AGO, 120, 850.5)
+    assert db.get(ArchivedSession, 1) is None
+    # Restored sessions count as active again
+    assert ChatArchiveRepository(db=db).get_idle_session_ids(LONG_AGO + datetime.timedelta(days=1)) == []
+
+
+def test_session_lookup_rehydrates_and_listing_decodes(session_factory):
+    # Arrange
+    SessionArchiver(idle_after=3600, batch_size=10, session_factory=session_factory).run_once()
+    db = session_factory()
+
+    # Act
+    listed = ChatSessionService(repository=ChatSessionRepository(db=db)).get()
+    still_archived = db.get(ArchivedSession, 1) is not None
+    looked_up = ChatSessionRepository(db=db).get_by_id(1)
+
+    # Assert
+    assert [[message.id for message in chat_session.messages] for chat_session in listed] == [[1, 4], [5]]
+    assert still_archived
+    assert [message.id for message in looked_up.messages] == [1, 2, 3, 4]
+    assert db.get(ArchivedSession, 1) is None
+
+
+def test_archive_merges_messages_written_while_archived(session_factory):
+    # Arrange
+    SessionArchiver(idle_after=3600, batch_size=10, session_factory=session_factory).run_once()
+    db = session_factory()
+    db.add(Message(id=6, session_id=1, role="user", content="Late", created_at=LONG_AGO))
+    db.commit()
+
+    # Act
+    archived = ChatArchiveRepository(db=db).archive(1, datetime.datetime.utcnow())
+    ChatMessageRepository(db=db).rehydrate(1)
+
+    # Assert
+    assert archived
+    assert [row.id for row in db.query(Message.id).filter_by(session_id=1).order_by(Message.id)] == [1, 2, 3, 4, 6]
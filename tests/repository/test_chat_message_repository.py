@@ -1,11 +1,18 @@
+import datetime
+
 import pytest
 from unittest.mock import MagicMock
+from sqlalchemy.orm import Session
 from app.repository.chat_message_repository import ChatMessageRepository
-from app.model.chat_models import Message
+from app.model.chat_models import ChatSession, Message
+from app.service.query_ai_service import QueryAIService
 
 @pytest.fixture
 def mock_db_session():
-    return MagicMock()
+    db = MagicMock()
+    # No session is archived
+    db.get.return_value = None
+    return db
 
 @pytest.fixture
 def chat_message_repository(mock_db_session):
@@ -14,7 +21,7 @@ def chat_message_repository(mock_db_session):
 def test_get_by_session_id(chat_message_repository, mock_db_session):
     # Arrange
     session_id = 1
-    mock_db_session.query.return_value.filter_by.return_value.offset.return_value.limit.return_value.all.return_value = [Message(id=1, session_id=session_id)]
+    mock_db_session.query.return_value.filter_by.return_value.filter.return_value.offset.return_value.limit.return_value.all.return_value = [Message(id=1, session_id=session_id)]
     
     # Act
     result = chat_message_repository.get_by_session_id(session_id=session_id, skip=0, limit=100)
@@ -24,9 +31,9 @@ def test_get_by_session_id(chat_message_repository, mock_db_session):
     assert result[0].session_id == session_id
     mock_db_session.query.assert_called_once_with(Message)
     mock_db_session.query.return_value.filter_by.assert_called_once_with(session_id=session_id)
-    mock_db_session.query.return_value.filter_by.return_value.offset.assert_called_once_with(0)
-    mock_db_session.query.return_value.filter_by.return_value.offset.return_value.limit.assert_called_once_with(100)
-    mock_db_session.query.return_value.filter_by.return_value.offset.return_value.limit.return_value.all.assert_called_once()
+    mock_db_session.query.return_value.filter_by.return_value.filter.return_value.offset.assert_called_once_with(0)
+    mock_db_session.query.return_value.filter_by.return_value.filter.return_value.offset.return_value.limit.assert_called_once_with(100)
+    mock_db_session.query.return_value.filter_by.return_value.filter.return_value.offset.return_value.limit.return_value.all.assert_called_once()
 
 def test_create(chat_message_repository, mock_db_session):
     # Arrange
@@ -53,3 +60,131 @@ def test_update(chat_message_repository, mock_db_session):
     mock_db_session.add.assert_called_once_with(message)
     mock_db_session.commit.assert_called_once()
     mock_db_session.refresh.assert_called_once_with(message)
+
+
+def test_get_usage_aggregates_assistant_messages(sqlite_db):
+    # Arrange: aggregates are computed by the database, so run them against a real (in-memory) one
+    sqlite_db.add_all([ChatSession(id=1), ChatSession(id=2)])
+    day = datetime.datetime(2026, 1, 1)
+    sqlite_db.add_all([
+        Message(session_id=1, role="user", content="Hi", created_at=day),
+        Message(session_id=1, role="assistant", content="Hello", created_at=day, llm_calls=1,
+                prompt_tokens=100, completion_tokens=10, cached_tokens=50, ttft_ms=200, duration_ms=400),
+        Message(session_id=1, role="assistant", content="Bye", created_at=day + datetime.timedelta(days=1),
+                llm_calls=2, prompt_tokens=300, completion_tokens=30, cached_tokens=0, duration_ms=800),
+        Message(session_id=2, role="assistant", content="Hey", created_at=day, llm_calls=1,
+                prompt_tokens=10, completion_tokens=1, cached_tokens=0, ttft_ms=100, duration_ms=100),
+    ])
+    sqlite_db.commit()
+    repository = ChatMessageRepository(db=sqlite_db)
+
+    # Act
+    session_usage = repository.get_usage(session_id=1)
+    first_day = repository.get_usage(start=day, end=day + datetime.timedelta(days=1))
+    by_session = repository.get_usage_by_session(limit=10)
+
+    # Assert
+    assert session_usage["messages"] == 2
+    assert session_usage["llm_calls"] == 3
+    assert session_usage["prompt_tokens"] == 400
+    assert session_usage["avg_ttft_ms"] == 200
+    assert session_usage["max_duration_ms"] == 800
+    assert first_day["messages"] == 2
+    assert first_day["avg_duration_ms"] == 250
+    assert [row["session_id"] for row in by_session] == [1, 2]
+
+
+def test_iter_history_streams_projected_rows_in_order(sqlite_db):
+    # Arrange
+    sqlite_db.add_all([ChatSession(id=1), ChatSession(id=2)])
+    sqlite_db.add_all([
+        Message(session_id=1, role="user", content="Price?"),
+        Message(session_id=2, role="user", content="Other session"),
+        Message(session_id=1, role="assistant", content="",
+                tool_calls=[{"id": "call_1", "name": "get_knowledge", "arguments": '{"file_name": "pricing.txt"}'}]),
+        Message(session_id=1, role="tool", content="Pro Plan: $50/month", tool_call_id="call_1"),
+        Message(session_id=1, role="assistant", content="$50 per month."),
+    ])
+    sqlite_db.commit()
+    repository = ChatMessageRepository(db=sqlite_db)
+
+    # Act
+    rows = list(repository.iter_history(1, batch_size=2))
+    params = QueryAIService._prepare_message_params(repository.iter_history(1))
+
+    # Assert
+    assert [tuple(row) for row in rows] == [
+        ("user", "Price?", None, None),
+        ("assistant", "", [{"id": "call_1", "name": "get_knowledge", "arguments": '{"file_name": "pricing.txt"}'}], None),
+        ("tool", "Pro Plan: $50/month", None, "call_1"),
+        ("assistant", "$50 per month.", None, None),
+    ]
+    assert [param["role"] for param in params] == ["system", "user", "assistant", "tool", "assistant"]
+    assert params[2]["tool_calls"][0]["function"]["arguments"] == '{"file_name": "pricing.txt"}'
+
+
+def test_iter_history_window_starts_at_a_turn(sqlite_db):
+    # Arrange
+    sqlite_db.add(ChatSession(id=1))
+    sqlite_db.add_all([
+        Message(session_id=1, role="user", content="Price?"),
+        Message(session_id=1, role="assistant", content="",
+                tool_calls=[{"id": "call_1", "name": "get_knowledge", "arguments": "{}"}]),
+        Message(session_id=1, role="tool", content="Pro Plan: $50/month", tool_call_id="call_1"),
+        Message(session_id=1, role="assistant", content="$50 per month."),
+        Message(session_id=1, role="user", content="Annual?"),
+        Message(session_id=1, role="assistant", content="$500 per year."),
+    ])
+    sqlite_db.commit()
+    repository = ChatMessageRepository(db=sqlite_db)
+
+    # Act
+    cut = [row.content for row in repository.iter_history(1, max_messages=4)]
+    whole_turn = [row.content for row in repository.iter_history(1, max_messages=6)]
+
+    # Assert
+    # The last four messages open with the tool result, so the window starts at the next question
+    assert cut == ["Annual?", "$500 per year."]
+    assert whole_turn == [row.content for row in repository.iter_history(1)]
+    assert len(whole_turn) == 6
+
+
+def test_detached_repository_keeps_reading_own_writes(primary_and_replica):
+    # Arrange
+    primary, replica = primary_and_replica
+    for db in (primary, replica):
+        db.add(ChatSession(id=1))
+        db.commit()
+    # Setting up the primary counts as a write; a fresh session stands for a new request
+    primary = Session(bind=primary.get_bind())
+    repository = ChatMessageRepository(db=primary, read_db=replica)
+
+    # Act
+    with repository.detached() as detached:
+        before_write = list(detached.iter_history(1))
+    repository.create(Message(session_id=1, role="user", content="Hello"))
+    with repository.detached() as detached:
+        after_write = [tuple(row)[:2] for row in detached.iter_history(1)]
+
+    # Assert
+    assert before_write == []
+    assert after_write == [("user", "Hello")]
+
+
+def test_get_rows_by_session_id_projects_columns_in_order(sqlite_db):
+    # Arrange
+    sqlite_db.add_all([ChatSession(id=1), ChatSession(id=2)])
+    sqlite_db.add_all([
+        Message(session_id=1, role="user", content="First"),
+        Message(session_id=2, role="user", content="Other session"),
+        Message(session_id=1, role="assistant", content="Second"),
+        Message(session_id=1, role="user", content="Third"),
+    ])
+    sqlite_db.commit()
+    repository = ChatMessageRepository(db=sqlite_db)
+
+    # Act
+    rows = repository.get_rows_by_session_id(1, ["content", "role"], skip=1, limit=5)
+
+    # Assert
+    assert [tuple(row) for row in rows] == [("Second", "assistant"), ("Third", "user")]
@@ -6,7 +6,10 @@ from app.model.chat_models import ChatSession
 
 @pytest.fixture
 def mock_db_session():
-    return MagicMock()
+    db = MagicMock()
+    # No session is archived
+    db.get.return_value = None
+    return db
 
 @pytest.fixture
 def chat_session_repository(mock_db_session):
@@ -85,3 +88,29 @@ def test_delete_chat_session_not_found(chat_session_repository, mock_db_session)
         chat_session_repository.delete_chat_session(session_id=1)
     assert exc_info.value.status_code == 404
     assert exc_info.value.detail == "Chat session not found"
+
+
+def test_reads_go_to_replica_until_the_request_writes(primary_and_replica):
+    # Arrange
+    primary, replica = primary_and_replica
+    replica.add(ChatSession(id=1))
+    replica.commit()
+    repository = ChatSessionRepository(db=primary, read_db=replica)
+
+    # Act
+    before_write = [session.id for session in repository.get()]
+    created = repository.create(ChatSession(id=2))
+    after_write = [session.id for session in repository.get()]
+
+    # Assert
+    assert before_write == [1]
+    # The replica has not seen the new session, so reads stay on the primary from now on
+    assert after_write == [2]
+    assert repository.get_by_id(created.id).id == 2
+
+
+def test_reads_use_primary_without_replica(chat_session_repository, mock_db_session):
+    mock_db_session.query.return_value.offset.return_value.limit.return_value.all.return_value = []
+
+    assert chat_session_repository.get() == []
+    mock_db_session.query.assert_called_once_with(ChatSession)
@@ -1,8 +1,21 @@
+import datetime
+import json
+import threading
+import time
+from typing import List
+
 import pytest
-from unittest.mock import MagicMock, call
-from app.service.chat_message_service import ChatMessageService
-from app.model.chat_models import Message
-from app.schema.chat_message_schemas import MessageBase, StreamContent
+from unittest.mock import ANY, MagicMock, call, patch
+from pydantic import TypeAdapter
+from app.core.admission import AdmissionController
+from app.core.cancellation import CancellationToken
+from app.repository.chat_message_repository import ChatMessageRepository
+from app.service.chat_message_service import ChatMessageService, MESSAGE_FIELDS
+from app.service.stream_registry import StreamRegistry
+from app.model.chat_models import ChatSession, Message
+from app.schema import chat_message_schemas
+from app.schema.chat_message_schemas import BatchQuestion, MessageBase, StreamContent
+from app.schema.trace_schemas import LLMCallTrace, ToolCallTrace
 
 @pytest.fixture
 def mock_chat_message_repository():
@@ -31,13 +44,35 @@ def test_get_chat_messages_by_session_id(chat_message_service, mock_chat_message
     assert len(result) == 1
     mock_chat_message_repository.get_by_session_id.assert_called_once_with(session_id, 0, 100)
 
+def test_get_chat_messages_json_matches_schema_serialization(chat_message_service, mock_chat_message_repository):
+    # Arrange
+    messages = [
+        Message(id=1, session_id=1, role="user", content="Price of \u00fcber?", created_at=datetime.datetime(2026, 1, 1),
+                interrupted=False),
+        Message(id=2, session_id=1, role="assistant", content="", created_at=datetime.datetime(2026, 1, 1, 0, 0, 1, 500),
+                tool_calls=[{"id": "call_1", "name": "get_knowledge", "arguments": "{}"}], ttft_ms=12.5,
+                interrupted=True),
+    ]
+    mock_chat_message_repository.get_rows_by_session_id.return_value = [
+        tuple(getattr(message, field) for field in MESSAGE_FIELDS) for message in messages]
+
+    # Act
+    result = chat_message_service.get_chat_messages_json(1, 0, 100)
+
+    # Assert
+    expected = TypeAdapter(List[chat_message_schemas.Message]).dump_json(
+        TypeAdapter(List[chat_message_schemas.Message]).validate_python(messages, from_attributes=True))
+    assert json.loads(result) == json.loads(expected)
+    mock_chat_message_repository.get_rows_by_session_id.assert_called_once_with(1, MESSAGE_FIELDS, 0, 100)
+
 def test_create_chat_message(chat_message_service, mock_chat_message_repository, mock_query_ai_service):
     # Arrange
     session_id = 1
     user_message = Message(role="user", content="Hello", session_id=session_id)
     ai_message = Message(role="assistant", content="AI response", session_id=session_id)
 
-    mock_chat_message_repository.get_by_session_id.return_value = [user_message]
+    history = [MessageBase(role="user", content="Hello")]
+    mock_chat_message_repository.iter_history.return_value = history
     mock_query_ai_service.query_ai.return_value = ("AI response", "response_id")
     mock_chat_message_repository.create.side_effect = [user_message, ai_message]
     
@@ -54,8 +89,8 @@ def test_create_chat_message(chat_message_service, mock_chat_message_repository,
     assert second_call_args['message'].role == "assistant"
     assert second_call_args['message'].content == "AI response"
 
-    mock_chat_message_repository.get_by_session_id.assert_called_once_with(session_id=session_id)
-    mock_query_ai_service.query_ai.assert_called_once_with([MessageBase(role="user", content="Hello")])
+    mock_chat_message_repository.iter_history.assert_called_once_with(session_id, max_messages=100)
+    mock_query_ai_service.query_ai.assert_called_once_with(history, trace=ANY)
     assert result.role == "assistant"
     assert result.content == "AI response"
 
@@ -64,11 +99,9 @@ def test_create_chat_message_stream(chat_message_service, mock_chat_message_repo
     session_id = 1
     user_message = Message(role="user", content="Hello", session_id=session_id)
     
-    mock_chat_message_repository.get_by_session_id.return_value = [user_message]
-    mock_query_ai_service.query_ai_stream.return_value = iter([
-        {"type": "content", "delta": "AI "},
-        {"type": "content", "delta": "response"}
-    ])
+    history = [MessageBase(role="user", content="Hello")]
+    mock_chat_message_repository.iter_history.return_value = history
+    mock_query_ai_service.query_ai_stream.return_value = iter(["AI ", "response"])
     
     # Act
     result = list(chat_message_service.create_chat_message_stream(user_message, session_id))
@@ -96,5 +129,191 @@ def test_create_chat_message_stream(chat_message_service, mock_chat_message_repo
     assert updated_message.content == "AI response"
 
     # 5. Verify other service calls.
-    mock_chat_message_repository.get_by_session_id.assert_called_once_with(session_id=session_id)
-    mock_query_ai_service.query_ai_stream.assert_called_once_with([MessageBase(role="user", content="Hello")])
+    mock_chat_message_repository.iter_history.assert_called_once_with(session_id, max_messages=100)
+    mock_query_ai_service.query_ai_stream.assert_called_once_with(history, trace=ANY, cancellation=None)
+
+def test_create_chat_message_stream_sends_history_without_placeholder(sqlite_db, mock_query_ai_service):
+    # Arrange
+    sqlite_db.add(ChatSession(id=1))
+    sqlite_db.add_all([Message(session_id=1, role="user", content="Price?"),
+                       Message(session_id=1, role="assistant", content="$50 per month.")])
+    sqlite_db.commit()
+    sent = []
+
+    def query_ai_stream(messages, trace, cancellation):
+        # The history is consumed once the stream starts, after the placeholder has been stored
+        sent.extend((message.role, message.content) for message in messages)
+        yield "Yes"
+
+    mock_query_ai_service.query_ai_stream.side_effect = query_ai_stream
+    service = ChatMessageService(repository=ChatMessageRepository(db=sqlite_db),
+                                 query_ai_service=mock_query_ai_service)
+
+    # Act
+    list(service.create_chat_message_stream(Message(role="user", content="Annual?", session_id=1), 1))
+
+    # Assert
+    assert sent == [("user", "Price?"), ("assistant", "$50 per month."), ("user", "Annual?")]
+
+def test_answer_batch(chat_message_service, mock_chat_message_repository, mock_query_ai_service):
+    # Arrange
+    mock_chat_message_repository.get_existing_session_ids.return_value = {1}
+    mock_chat_message_repository.iter_history.return_value = iter([MessageBase(role="user", content="Earlier")])
+    mock_query_ai_service.query_ai.side_effect = lambda messages, trace: (f"Answer to {messages[-1].content}", "id")
+    questions = [
+        BatchQuestion(content="Bound", session_id=1),
+        BatchQuestion(content="Unbound"),
+        BatchQuestion(content="Unknown session", session_id=99),
+    ]
+
+    # Act
+    results = sorted(chat_message_service.answer_batch(questions), key=lambda result: result.index)
+
+    # Assert
+    assert [result.content for result in results] == ["Answer to Bound", "Answer to Unbound", None]
+    assert results[2].error == "Chat session not found"
+    bound_call = [c for c in mock_query_ai_service.query_ai.call_args_list if c.args[0][-1].content == "Bound"][0]
+    assert bound_call.args[0] == [MessageBase(role="user", content="Earlier"), MessageBase(role="user", content="Bound")]
+
+    # Only the session-bound question is persisted, in a single bulk insert
+    mock_chat_message_repository.create_all.assert_called_once()
+    persisted = mock_chat_message_repository.create_all.call_args.args[0]
+    assert [(m.role, m.content, m.session_id) for m in persisted] == [
+        ("user", "Bound", 1), ("assistant", "Answer to Bound", 1)
+    ]
+
+
+def test_answer_batch_reports_failures_per_question(chat_message_service, mock_chat_message_repository,
+                                                     mock_query_ai_service):
+    # Arrange
+    mock_query_ai_service.query_ai.side_effect = RuntimeError("LLM unavailable")
+
+    # Act
+    results = list(chat_message_service.answer_batch([BatchQuestion(content="Hello")]))
+
+    # Assert
+    assert results[0].error == "LLM unavailable"
+    mock_chat_message_repository.create_all.assert_not_called()
+
+def test_answer_session(chat_message_service, mock_chat_message_repository, mock_query_ai_service):
+    # Arrange
+    session_id = 1
+    mock_chat_message_repository.iter_history.return_value = iter([MessageBase(role="user", content="Hello")])
+    mock_query_ai_service.query_ai_stream.return_value = iter(["AI ", "response"])
+    mock_chat_message_repository.create.side_effect = lambda message: message
+
+    # Act
+    events = chat_message_service.answer_session(session_id)
+    deltas = []
+    try:
+        while True:
+            deltas.append(next(events).delta)
+    except StopIteration as stop:
+        result = stop.value
+
+    # Assert
+    assert deltas == ["AI ", "response"]
+    assert result.role == "assistant"
+    assert result.content == "AI response"
+    mock_chat_message_repository.create.assert_called_once()
+
+
+def test_create_chat_message_records_usage(chat_message_service, mock_chat_message_repository,
+                                           mock_query_ai_service):
+    # Arrange
+    def query_ai(messages, trace):
+        trace.calls.append(LLMCallTrace(model="gpt-4o-mini", prompt_tokens=100, completion_tokens=5, cached_tokens=64))
+        trace.calls.append(LLMCallTrace(model="gpt-4o-mini", prompt_tokens=300, completion_tokens=20))
+        return "AI response", "response_id"
+
+    mock_chat_message_repository.iter_history.return_value = iter([MessageBase(role="user", content="Hello")])
+    mock_query_ai_service.query_ai.side_effect = query_ai
+    mock_chat_message_repository.create.side_effect = lambda message: message
+
+    # Act
+    result = chat_message_service.create_chat_message(Message(role="user", content="Hello", session_id=1), 1)
+
+    # Assert
+    assert (result.model, result.llm_calls) == ("gpt-4o-mini", 2)
+    assert (result.prompt_tokens, result.completion_tokens, result.cached_tokens) == (400, 25, 64)
+    assert result.duration_ms >= 0
+    assert result.ttft_ms is None
+
+
+def test_create_chat_message_persists_tool_calls(chat_message_service, mock_chat_message_repository,
+                                                 mock_query_ai_service):
+    # Arrange
+    def query_ai(messages, trace):
+        trace.tool_calls.append(ToolCallTrace(id="call_1", name="get_knowledge",
+                                              arguments='{"file_name": "faq.txt"}', output="FAQ content"))
+        return "AI response", "response_id"
+
+    mock_chat_message_repository.iter_history.return_value = iter([MessageBase(role="user", content="Hello")])
+    mock_query_ai_service.query_ai.side_effect = query_ai
+    mock_chat_message_repository.create_turn.side_effect = lambda messages: messages[-1]
+
+    # Act
+    result = chat_message_service.create_chat_message(Message(role="user", content="Hello", session_id=1), 1)
+
+    # Assert
+    persisted = mock_chat_message_repository.create_turn.call_args.args[0]
+    assert [(m.role, m.content, m.tool_call_id) for m in persisted] == [
+        ("assistant", "", None), ("tool", "FAQ content", "call_1"), ("assistant", "AI response", None)
+    ]
+    assert persisted[0].tool_calls == [{"id": "call_1", "name": "get_knowledge", "arguments": '{"file_name": "faq.txt"}'}]
+    assert result is persisted[-1]
+
+
+def test_create_chat_message_stream_marks_cancelled_answer_as_interrupted(chat_message_service,
+                                                                         mock_chat_message_repository,
+                                                                         mock_query_ai_service):
+    # Arrange
+    cancellation = CancellationToken()
+
+    def query_ai_stream(messages, trace, cancellation):
+        yield "Partial"
+        cancellation.cancel()
+
+    mock_query_ai_service.query_ai_stream.side_effect = query_ai_stream
+
+    # Act
+    list(chat_message_service.create_chat_message_stream(Message(role="user", content="Hello", session_id=1), 1,
+                                                         cancellation=cancellation))
+
+    # Assert
+    updated_message = mock_chat_message_repository.update.call_args.kwargs["message"]
+    assert updated_message.content == "Partial"
+    assert updated_message.interrupted is True
+
+def test_create_chat_message_stream_holds_admission_slot_while_abandoned_within_grace(chat_message_service,
+                                                                                     mock_query_ai_service):
+    # Arrange: a generation started the way the stream route starts it, streaming until it is cancelled
+    admission = AdmissionController(max_in_flight=1, max_queue=0, queue_timeout=1)
+    registry = StreamRegistry(max_events=100, ttl=60, disconnect_grace=0.2)
+    cancellation = CancellationToken()
+    streaming = threading.Event()
+
+    def query_ai_stream(messages, trace, cancellation):
+        yield "Partial"
+        streaming.set()
+        while not cancellation.cancelled:
+            time.sleep(0.01)
+
+    mock_query_ai_service.query_ai_stream.side_effect = query_ai_stream
+    message = Message(role="user", content="Hello", session_id=1)
+
+    with patch("app.service.chat_message_service.llm_admission", admission):
+        stream = registry.start(1, lambda: chat_message_service.create_chat_message_stream(
+            message, 1, cancellation=cancellation), cancellation)
+        release = stream.attach()
+        assert streaming.wait(5)
+
+        # Act: the only client disconnects
+        release()
+
+        # Assert: the slot stays taken while the generation may still be resumed, and is freed once it is cancelled
+        assert admission.in_flight == 1
+        assert not cancellation.cancelled
+        list(stream.broadcast.subscribe())
+        assert cancellation.cancelled
+        assert admission.in_flight == 0
@@ -1,7 +1,11 @@
+import datetime
+
 import pytest
 from unittest.mock import MagicMock, call
 from app.service.chat_session_service import ChatSessionService
-from app.model.chat_models import ChatSession
+from app.model.chat_models import ChatSession, Message
+
+CREATED_AT = datetime.datetime(2026, 1, 1)
 
 @pytest.fixture
 def mock_chat_session_repository():
@@ -13,7 +17,9 @@ def chat_session_service(mock_chat_session_repository):
 
 def test_get(chat_session_service, mock_chat_session_repository):
     # Arrange
-    mock_chat_session_repository.get.return_value = [ChatSession(id=1), ChatSession(id=2)]
+    mock_chat_session_repository.get.return_value = [ChatSession(id=1, created_at=CREATED_AT),
+                                                     ChatSession(id=2, created_at=CREATED_AT)]
+    mock_chat_session_repository.get_archived_messages.return_value = {}
     
     # Act
     result = chat_session_service.get(0, 100)
@@ -25,7 +31,7 @@ def test_get(chat_session_service, mock_chat_session_repository):
 def test_get_by_id(chat_session_service, mock_chat_session_repository):
     # Arrange
     session_id = 1
-    mock_chat_session_repository.get_by_id.return_value = ChatSession(id=session_id)
+    mock_chat_session_repository.get_by_id.return_value = ChatSession(id=session_id, created_at=CREATED_AT)
     
     # Act
     result = chat_session_service.get_by_id(session_id)
@@ -34,6 +40,25 @@ def test_get_by_id(chat_session_service, mock_chat_session_repository):
     assert result.id == session_id
     mock_chat_session_repository.get_by_id.assert_called_once_with(session_id)
 
+def test_get_by_id_leaves_out_tool_call_messages(chat_session_service, mock_chat_session_repository):
+    # Arrange
+    chat_session = ChatSession(id=1, created_at=CREATED_AT, messages=[
+        Message(id=1, session_id=1, role="user", content="Price?", created_at=CREATED_AT, interrupted=False),
+        Message(id=2, session_id=1, role="assistant", content="", created_at=CREATED_AT,
+                tool_calls=[{"id": "call_1", "name": "get_knowledge", "arguments": "{}"}]),
+        Message(id=3, session_id=1, role="tool", content="Pro Plan: $50/month", tool_call_id="call_1",
+                created_at=CREATED_AT),
+        Message(id=4, session_id=1, role="assistant", content="$50 per month.", created_at=CREATED_AT,
+                interrupted=False),
+    ])
+    mock_chat_session_repository.get_by_id.return_value = chat_session
+
+    # Act
+    result = chat_session_service.get_by_id(1)
+
+    # Assert
+    assert [message.id for message in result.messages] == [1, 4]
+
 def test_create(chat_session_service, mock_chat_session_repository):
     # Arrange
     mock_chat_session_repository.create.return_value = ChatSession(id=1)
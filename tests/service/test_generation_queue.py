@@ -0,0 +1,127 @@
+import time
+
+import httpx
+import openai
+import pytest
+from fastapi import HTTPException
+
+from app.model.chat_models import Message
+from app.schema.chat_message_schemas import StreamContent
+from app.service.generation_queue import GenerationQueue, is_retryable
+
+
+def make_queue(**overrides) -> GenerationQueue:
+    options = dict(workers=2, max_queue=10, max_attempts=3, retry_backoff=0, ttl=60, max_events=100)
+    options.update(overrides)
+    return GenerationQueue(**options)
+
+
+def llm_error(status_code: int) -> RuntimeError:
+    """A service error as raised by QueryAIService, wrapping the LLM error that caused it."""
+    request = httpx.Request("POST", "http://llm/v1/chat/completions")
+    cause = openai.APIStatusError("boom", response=httpx.Response(status_code, request=request), body=None)
+    try:
+        raise RuntimeError("backend unavailable") from cause
+    except RuntimeError as e:
+        return e
+
+
+def answer(*deltas, message_id=7):
+    def work():
+        for delta in deltas:
+            yield StreamContent(type="content", delta=delta)
+        return Message(id=message_id, role="assistant", content="".join(deltas))
+    return work
+
+
+def test_job_runs_and_publishes_events():
+    # Arrange
+    generation_queue = make_queue()
+
+    # Act
+    job = generation_queue.submit(1, answer("Hello", " world"))
+    events = [event for _, event in job.events.subscribe()]
+
+    # Assert
+    assert [event.type for event in events] == ["status", "content", "content", "status"]
+    assert events[-1].status == "succeeded"
+    assert events[-1].message_id == 7
+    assert generation_queue.get(job.job_id).to_schema().content == "Hello world"
+
+
+def test_failed_attempts_are_retried():
+    # Arrange
+    generation_queue = make_queue()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            yield StreamContent(type="content", delta="partial")
+            raise llm_error(503)
+        return (yield from answer("done")())
+
+    # Act
+    job = generation_queue.submit(1, flaky)
+    statuses = [event.status for _, event in job.events.subscribe() if event.type == "status"]
+
+    # Assert
+    assert statuses == ["running", "retrying", "running", "retrying", "running", "succeeded"]
+    assert job.attempts == 3
+    assert job.content == "done"
+    assert job.error is None
+
+
+def test_job_fails_after_last_attempt_or_on_client_error():
+    # Arrange
+    generation_queue = make_queue(max_attempts=2)
+
+    def broken():
+        raise llm_error(500)
+        yield
+
+    def not_found():
+        raise HTTPException(status_code=404, detail="Chat session not found")
+        yield
+
+    # Act
+    exhausted = generation_queue.submit(1, broken)
+    list(exhausted.events.subscribe())
+    rejected = generation_queue.submit(1, not_found)
+    list(rejected.events.subscribe())
+
+    # Assert
+    assert (exhausted.status, exhausted.attempts, exhausted.error) == ("failed", 2, "backend unavailable")
+    assert (rejected.status, rejected.attempts, rejected.error) == ("failed", 1, "Chat session not found")
+
+
+def test_retries_only_transient_causes():
+    assert is_retryable(llm_error(429))
+    assert is_retryable(llm_error(502))
+    assert not is_retryable(llm_error(400))
+    assert not is_retryable(RuntimeError("An unexpected error occurred"))
+    assert is_retryable(HTTPException(status_code=503))
+    assert not is_retryable(HTTPException(status_code=502))
+    assert not is_retryable(HTTPException(status_code=404))
+
+
+def test_full_queue_rejects_new_jobs():
+    # Arrange
+    generation_queue = make_queue(workers=0, max_queue=1)
+    generation_queue.submit(1, answer("queued"))
+
+    # Act / Assert
+    with pytest.raises(HTTPException) as error:
+        generation_queue.submit(1, answer("rejected"))
+    assert error.value.status_code == 429
+
+
+def test_finished_jobs_expire():
+    # Arrange
+    generation_queue = make_queue(ttl=0)
+    job = generation_queue.submit(1, answer("Hi"))
+    list(job.events.subscribe())
+    time.sleep(0.01)
+
+    # Act / Assert
+    assert generation_queue.get(job.job_id) is None
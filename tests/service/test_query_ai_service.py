@@ -1,14 +1,29 @@
+import copy
+import threading
+import time
+
+import httpx
+import openai
 import pytest
+from fastapi import HTTPException
 from unittest.mock import MagicMock, patch
-from app.service.query_ai_service import QueryAIService
-from app.schema.chat_message_schemas import MessageBase
+from app.core.cache import MemoryCache
+from app.core.cancellation import CancellationToken
+from app.core.circuit_breaker import CircuitOpenError
+from app.core.config import settings
+from app.core.knowledge_artifact import build_artifact
+from app.core.knowledge_index import KnowledgeIndex
+from app.core.metrics import metrics
+from app.service.query_ai_service import QueryAIService, get_knowledge
+from app.schema.chat_message_schemas import HistoryMessage, MessageBase, ToolCall
+from app.schema.trace_schemas import TurnTrace
 from openai.types.chat import ChatCompletion, ChatCompletionMessage, ChatCompletionChunk
 from openai.types.chat.chat_completion import Choice
 from openai.types.chat.chat_completion_chunk import Choice as ChunkChoice
 from openai.types.chat.chat_completion_chunk import ChoiceDelta, ChoiceDeltaToolCall
 from openai.types.chat.chat_completion_message_tool_call import ChatCompletionMessageToolCall, Function as ToolFunction
 from openai.types.chat.chat_completion_chunk import ChoiceDeltaToolCallFunction
-from openai.types.completion_usage import CompletionUsage
+from openai.types.completion_usage import CompletionUsage, PromptTokensDetails
 
 @pytest.fixture
 def mock_openai_client():
@@ -184,3 +199,449 @@ def test_query_ai_stream_with_tool_call(query_ai_service, mock_openai_client, sa
         assert "".join(result) == "The answer is in the FAQ."
         mock_get_knowledge.assert_called_once_with(file_name="faq.txt")
         assert mock_openai_client.chat.completions.create.call_count == 2
+
+def test_query_ai_coalesces_identical_concurrent_requests(query_ai_service, mock_openai_client, sample_messages):
+    # Arrange
+    release = threading.Event()
+    mock_response = ChatCompletion(
+        id="chatcmpl-123",
+        choices=[
+            Choice(
+                finish_reason="stop",
+                index=0,
+                message=ChatCompletionMessage(role="assistant", content="Shared answer", tool_calls=None),
+            )
+        ],
+        model="gpt-4o-mini-2024-07-18",
+        object="chat.completion",
+        created=1677652088,
+    )
+
+    def slow_create(**kwargs):
+        release.wait(timeout=5)
+        return mock_response
+
+    mock_openai_client.chat.completions.create.side_effect = slow_create
+
+    # Act
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(query_ai_service.query_ai(sample_messages)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    # Assert
+    assert results == [("Shared answer", "chatcmpl-123")] * 3
+    mock_openai_client.chat.completions.create.assert_called_once()
+
+
+def test_query_ai_follow_up_call_keeps_prompt_prefix_stable(query_ai_service, mock_openai_client, sample_messages):
+    # Arrange
+    metrics.reset()
+    tool_call = ChatCompletionMessageToolCall(
+        id="call_123",
+        function=ToolFunction(name="get_knowledge", arguments='{"file_name": "faq.txt"}'),
+        type="function"
+    )
+    first = ChatCompletion(
+        id="chatcmpl-1",
+        choices=[Choice(finish_reason="tool_calls", index=0,
+                        message=ChatCompletionMessage(role="assistant", content=None, tool_calls=[tool_call]))],
+        model="gpt-4o-mini-2024-07-18",
+        object="chat.completion",
+        usage=CompletionUsage(completion_tokens=5, prompt_tokens=100, total_tokens=105),
+        created=1677652088,
+    )
+    second = ChatCompletion(
+        id="chatcmpl-2",
+        choices=[Choice(finish_reason="stop", index=0,
+                        message=ChatCompletionMessage(role="assistant", content="Answer", tool_calls=None))],
+        model="gpt-4o-mini-2024-07-18",
+        object="chat.completion",
+        usage=CompletionUsage(completion_tokens=5, prompt_tokens=150, total_tokens=155,
+                              prompt_tokens_details=PromptTokensDetails(cached_tokens=100)),
+        created=1677652088,
+    )
+    # The message list is extended in place between calls, so keep what each call was sent
+    calls = []
+    responses = iter([first, second])
+
+    def create(**kwargs):
+        calls.append(copy.deepcopy(kwargs))
+        return next(responses)
+
+    mock_openai_client.chat.completions.create.side_effect = create
+
+    with patch('app.service.query_ai_service.get_knowledge', return_value="FAQ content"):
+        # Act
+        query_ai_service.query_ai(sample_messages)
+
+    # Assert
+    first_call, second_call = calls
+    first_messages, second_messages = first_call.pop("messages"), second_call.pop("messages")
+    assert first_call == second_call
+    assert second_messages[:len(first_messages)] == first_messages
+    assert len(second_messages) == len(first_messages) + 2
+    assert [m["role"] for m in second_messages[-2:]] == ["assistant", "tool"]
+    counters = metrics.snapshot()["counters"]
+    assert counters["llm_prompt_tokens_total"] == 250
+    assert counters["llm_cached_prompt_tokens_total"] == 100
+
+
+def test_query_ai_reuses_cached_answers(query_ai_service, mock_openai_client, sample_messages):
+    # Arrange
+    mock_openai_client.chat.completions.create.return_value = ChatCompletion(
+        id="chatcmpl-123",
+        choices=[Choice(finish_reason="stop", index=0,
+                        message=ChatCompletionMessage(role="assistant", content="Hello there!"))],
+        model="gpt-4o-mini-2024-07-18",
+        object="chat.completion",
+        created=1677652088,
+    )
+    trace = TurnTrace()
+
+    with patch('app.service.query_ai_service.get_cache', return_value=MemoryCache(max_entries=10)), \
+            patch('app.service.query_ai_service.settings.CACHE_ANSWERS', True):
+        # Act
+        first = query_ai_service.query_ai(sample_messages)
+        second = query_ai_service.query_ai(sample_messages, trace=trace)
+        streamed = list(query_ai_service.query_ai_stream(sample_messages))
+
+    # Assert
+    assert first == second == ("Hello there!", "chatcmpl-123")
+    assert streamed == ["Hello there!"]
+    assert trace.answer_cached
+    mock_openai_client.chat.completions.create.assert_called_once()
+
+
+def test_get_knowledge_reads_from_artifact(tmp_path):
+    # Arrange
+    (tmp_path / "faq.txt").write_text("FAQ content", encoding="utf-8")
+    build_artifact(str(tmp_path), str(tmp_path / "knowledge.qkb"))
+    index = KnowledgeIndex(artifact_path=str(tmp_path / "knowledge.qkb"))
+
+    with patch('app.service.query_ai_service.knowledge_index', index), patch('app.core.knowledge.knowledge_index', index):
+        # Act / Assert
+        assert get_knowledge("faq.txt") == "FAQ content"
+        assert get_knowledge("missing.txt").startswith("Error: File 'missing.txt' not found")
+
+
+def test_cached_answer_is_dropped_when_its_knowledge_changes(query_ai_service, tmp_path):
+    # Arrange
+    (tmp_path / "faq.txt").write_text("FAQ content", encoding="utf-8")
+    index = KnowledgeIndex(directory=str(tmp_path))
+    trace = TurnTrace(knowledge_files=["faq.txt"])
+
+    with patch('app.service.query_ai_service.get_cache', return_value=MemoryCache(max_entries=10)), \
+            patch('app.service.query_ai_service.knowledge_index', index), \
+            patch('app.service.query_ai_service.settings.CACHE_ANSWERS', True):
+        query_ai_service._cache_answer("fp", "Answer", "resp-1", trace)
+        # Act
+        before = query_ai_service._cached_answer("fp", TurnTrace())
+        (tmp_path / "faq.txt").write_text("FAQ content, revised", encoding="utf-8")
+        index.refresh()
+        after = query_ai_service._cached_answer("fp", TurnTrace())
+
+    # Assert
+    assert before == ("Answer", "resp-1")
+    assert after is None
+
+
+def test_query_ai_stream_merges_fragmented_tool_call_deltas(query_ai_service, mock_openai_client, sample_messages):
+    # Arrange
+    def chunk(delta):
+        return ChatCompletionChunk(id="chunk-1", choices=[ChunkChoice(delta=delta, finish_reason=None, index=0)],
+                                   model="gpt-4o-mini", object="chat.completion.chunk", created=1677652088)
+
+    fragments = ['{"file_', 'name": "faq', '.txt"}']
+    first_stream = [chunk(ChoiceDelta(tool_calls=[ChoiceDeltaToolCall(
+        index=0, id="call_1" if i == 0 else None, type="function" if i == 0 else None,
+        function=ChoiceDeltaToolCallFunction(name="get_knowledge" if i == 0 else None, arguments=fragment),
+    )])) for i, fragment in enumerate(fragments)]
+    mock_openai_client.chat.completions.create.side_effect = [first_stream, [chunk(ChoiceDelta(content="Answer"))]]
+    trace = TurnTrace()
+
+    with patch('app.service.query_ai_service.get_knowledge', return_value="FAQ content") as mock_get_knowledge:
+        # Act
+        result = list(query_ai_service.query_ai_stream(sample_messages, trace=trace))
+
+    # Assert
+    assert result == ["Answer"]
+    mock_get_knowledge.assert_called_once_with(file_name="faq.txt")
+    assert [(call.id, call.arguments, call.output) for call in trace.tool_calls] == \
+        [("call_1", '{"file_name": "faq.txt"}', "FAQ content")]
+
+
+def test_prepare_message_params_replays_tool_calls_once():
+    # Arrange
+    faq = "FAQ content " * 10
+
+    def read_faq(call_id):
+        return [
+            HistoryMessage(role="assistant", content="",
+                           tool_calls=[ToolCall(id=call_id, name="get_knowledge", arguments='{"file_name": "faq.txt"}')]),
+            HistoryMessage(role="tool", content=faq, tool_call_id=call_id),
+        ]
+
+    history = [
+        # Result whose call was cut off by the history window
+        HistoryMessage(role="tool", content="Orphan", tool_call_id="call_0"),
+        HistoryMessage(role="user", content="First"),
+        *read_faq("call_1"),
+        HistoryMessage(role="assistant", content="First answer"),
+        HistoryMessage(role="user", content="Second"),
+        *read_faq("call_2"),
+        HistoryMessage(role="assistant", content="Second answer"),
+    ]
+
+    # Act
+    params = QueryAIService._prepare_message_params(history)
+
+    # Assert
+    assert [param["role"] for param in params] == \
+        ["system", "user", "assistant", "tool", "assistant", "user", "assistant", "tool", "assistant"]
+    assert params[2]["tool_calls"][0] == {"id": "call_1", "type": "function",
+                                          "function": {"name": "get_knowledge", "arguments": '{"file_name": "faq.txt"}'}}
+    assert params[3] == {"role": "tool", "tool_call_id": "call_1", "content": faq}
+    assert params[7]["tool_call_id"] == "call_2"
+    assert params[7]["content"] == "Same content as the result of tool call call_1 above."
+
+
+def test_query_ai_stream_closes_upstream_and_skips_follow_up_when_cancelled(query_ai_service, mock_openai_client,
+                                                                            sample_messages):
+    # Arrange
+    def chunk(delta):
+        return ChatCompletionChunk(id="chunk-1", choices=[ChunkChoice(delta=delta, finish_reason=None, index=0)],
+                                   model="gpt-4o-mini-2024-07-18", object="chat.completion.chunk", created=1677652088)
+
+    class Upstream:
+        def __init__(self):
+            self.closed = threading.Event()
+
+        def __iter__(self):
+            yield chunk(ChoiceDelta(content="Let me check"))
+            # Blocks like a network read until the response is closed
+            self.closed.wait(timeout=5)
+            yield chunk(ChoiceDelta(tool_calls=[ChoiceDeltaToolCall(
+                index=0, id="call_1", type="function",
+                function=ChoiceDeltaToolCallFunction(name="get_knowledge", arguments='{"file_name": "faq.txt"}'))]))
+
+        def close(self):
+            self.closed.set()
+
+    upstream = Upstream()
+    mock_openai_client.chat.completions.create.return_value = upstream
+    cancellation = CancellationToken()
+
+    # Act
+    stream = query_ai_service.query_ai_stream(sample_messages, cancellation=cancellation)
+    first = next(stream)
+    cancellation.cancel()
+    rest = list(stream)
+
+    # Assert
+    assert first == "Let me check"
+    assert rest == []
+    assert upstream.closed.is_set()
+    mock_openai_client.chat.completions.create.assert_called_once()
+
+
+def test_query_ai_stream_cancellation_closes_both_hedged_upstreams(query_ai_service, mock_openai_client,
+                                                                  sample_messages, monkeypatch):
+    # Arrange: the primary is still waiting for its first chunk when the hedge wins, then the hedge stalls too
+    monkeypatch.setattr("app.service.query_ai_service.settings.LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr("app.service.query_ai_service.settings.LLM_HEDGE_AFTER_S", 0.05)
+
+    class Upstream:
+        def __init__(self, chunks):
+            self.chunks = chunks
+            self.closed = threading.Event()
+
+        def __iter__(self):
+            yield from self.chunks
+            # Blocks like a network read until the response is closed
+            self.closed.wait(timeout=5)
+
+        def close(self):
+            self.closed.set()
+
+    primary = Upstream([])
+    hedge = Upstream([ChatCompletionChunk(id="chunk-1", choices=[ChunkChoice(
+        delta=ChoiceDelta(content="Let me check"), finish_reason=None, index=0)], model="gpt-4o-mini-2024-07-18",
+        object="chat.completion.chunk", created=1677652088)])
+    mock_openai_client.chat.completions.create.side_effect = [primary, hedge]
+    cancellation = CancellationToken()
+    received = []
+    consumer = threading.Thread(
+        target=lambda: received.extend(query_ai_service.query_ai_stream(sample_messages, cancellation=cancellation)))
+    consumer.start()
+    time.sleep(0.2)
+
+    # Act: cancelled from another thread while the consumer is blocked reading the hedge
+    cancellation.cancel()
+    consumer.join(timeout=2)
+
+    # Assert
+    assert not consumer.is_alive()
+    assert received == ["Let me check"]
+    assert primary.closed.is_set()
+    assert hedge.closed.is_set()
+
+
+def test_query_ai_fails_fast_with_503_while_circuits_are_open(query_ai_service, mock_openai_client, sample_messages):
+    # Arrange
+    mock_openai_client.chat.completions.create.side_effect = CircuitOpenError("All LLM backends are unavailable", 12.5)
+
+    # Act
+    with pytest.raises(HTTPException) as raised:
+        query_ai_service.query_ai(sample_messages)
+
+    # Assert
+    assert raised.value.status_code == 503
+    assert raised.value.headers["Retry-After"] == "13"
+
+
+def test_query_ai_reports_exhausted_retries_as_bad_gateway(query_ai_service, mock_openai_client, sample_messages):
+    # Arrange
+    request = httpx.Request("POST", "http://llm/v1/chat/completions")
+    mock_openai_client.chat.completions.create.side_effect = openai.InternalServerError(
+        "boom", response=httpx.Response(500, request=request), body=None)
+
+    # Act
+    with pytest.raises(HTTPException) as raised:
+        query_ai_service.query_ai(sample_messages)
+
+    # Assert
+    assert raised.value.status_code == 502
+    assert isinstance(raised.value.__cause__, openai.InternalServerError)
+
+
+def completion(content, model):
+    return ChatCompletion(
+        id=f"chatcmpl-{model}",
+        choices=[Choice(finish_reason="stop", index=0,
+                        message=ChatCompletionMessage(role="assistant", content=content, tool_calls=None))],
+        model=model, object="chat.completion", created=1677652088,
+    )
+
+
+@pytest.fixture
+def cascade(monkeypatch, tmp_path):
+    (tmp_path / "pricing.txt").write_text("The Pro plan costs $50 per month.")
+    monkeypatch.setattr("app.service.query_ai_service.settings.LLM_FAST_MODEL", "fast-model")
+    monkeypatch.setattr("app.service.query_ai_service.knowledge_index", KnowledgeIndex(directory=str(tmp_path)))
+
+
+def test_cascade_keeps_a_confident_fast_answer(cascade, query_ai_service, mock_openai_client):
+    # Arrange
+    mock_openai_client.chat.completions.create.return_value = completion("$50 per month.", "fast-model")
+    trace = TurnTrace()
+
+    # Act
+    content, _ = query_ai_service.query_ai([MessageBase(role="user", content="Pro plan cost?")], trace=trace)
+
+    # Assert
+    assert content == "$50 per month."
+    assert mock_openai_client.chat.completions.create.call_args.kwargs["model"] == "fast-model"
+    assert (trace.tier, trace.routing_reason, trace.escalation_reason) == ("fast", "simple", None)
+    assert set(trace.tier_ms) == {"fast"}
+
+
+def test_cascade_escalates_a_hedging_fast_answer(cascade, query_ai_service, mock_openai_client):
+    # Arrange
+    mock_openai_client.chat.completions.create.side_effect = [
+        completion("I'm not sure, sorry.", "fast-model"), completion("$50 per month.", settings.LLM_MODEL)]
+    trace = TurnTrace()
+
+    # Act
+    content, _ = query_ai_service.query_ai([MessageBase(role="user", content="Pro plan cost?")], trace=trace)
+
+    # Assert
+    assert content == "$50 per month."
+    models = [call.kwargs["model"] for call in mock_openai_client.chat.completions.create.call_args_list]
+    assert models == ["fast-model", settings.LLM_MODEL]
+    assert (trace.tier, trace.escalation_reason) == ("large", "uncertain_answer")
+    assert set(trace.tier_ms) == {"fast", "large"}
+
+
+def test_cascade_stream_escalates_when_the_fast_model_fails(cascade, query_ai_service, mock_openai_client):
+    # Arrange
+    def create(**kwargs):
+        if kwargs["model"] == "fast-model":
+            raise RuntimeError("fast model unavailable")
+        return [ChatCompletionChunk(id="chunk-1", model=kwargs["model"], object="chat.completion.chunk",
+                                    created=1677652088,
+                                    choices=[ChunkChoice(delta=ChoiceDelta(content="$50 per month."),
+                                                         finish_reason=None, index=0)])]
+
+    mock_openai_client.chat.completions.create.side_effect = create
+    trace = TurnTrace()
+
+    # Act
+    result = list(query_ai_service.query_ai_stream([MessageBase(role="user", content="Pro plan cost?")],
+                                                   trace=trace))
+
+    # Assert
+    assert result == ["$50 per month."]
+    assert (trace.tier, trace.escalation_reason) == ("large", "fast_model_error")
+    assert mock_openai_client.chat.completions.create.call_args.kwargs["model"] == settings.LLM_MODEL
+
+
+@pytest.mark.parametrize("coalesce", [True, False])
+def test_cascade_stream_closes_the_escalated_fast_stream(cascade, query_ai_service, mock_openai_client, monkeypatch,
+                                                         coalesce):
+    # Arrange
+    monkeypatch.setattr("app.service.query_ai_service.settings.LLM_COALESCE_REQUESTS", coalesce)
+
+    def chunk(content, model):
+        return ChatCompletionChunk(id="chunk-1", model=model, object="chat.completion.chunk", created=1677652088,
+                                   choices=[ChunkChoice(delta=ChoiceDelta(content=content), finish_reason=None,
+                                                        index=0)])
+
+    class FastStream:
+        """Sends a hedging start, then waits for more tokens like an open upstream response until closed."""
+        def __init__(self):
+            self.closed = threading.Event()
+
+        def __iter__(self):
+            yield chunk("I'm not sure which plan you mean, there are several and each has its own price.",
+                        "fast-model")
+            self.closed.wait(5)
+
+        def close(self):
+            self.closed.set()
+
+    fast_stream = FastStream()
+    closed_before_escalating = []
+
+    def create(**kwargs):
+        if kwargs["model"] == "fast-model":
+            return fast_stream
+        closed_before_escalating.append(fast_stream.closed.is_set())
+        return [chunk("$50 per month.", kwargs["model"])]
+
+    mock_openai_client.chat.completions.create.side_effect = create
+
+    # Act
+    result = list(query_ai_service.query_ai_stream([MessageBase(role="user", content="Pro plan cost?")]))
+
+    # Assert
+    assert result == ["$50 per month."]
+    assert closed_before_escalating == [True]
+    assert mock_openai_client.chat.completions.create.call_args.kwargs["model"] == settings.LLM_MODEL
+
+
+def test_cascade_sends_complex_questions_straight_to_the_large_model(cascade, query_ai_service, mock_openai_client):
+    # Arrange
+    mock_openai_client.chat.completions.create.return_value = completion("Because...", settings.LLM_MODEL)
+
+    # Act
+    query_ai_service.query_ai([MessageBase(role="user", content="Why does the Pro plan cost more?")])
+
+    # Assert
+    mock_openai_client.chat.completions.create.assert_called_once()
+    assert mock_openai_client.chat.completions.create.call_args.kwargs["model"] == settings.LLM_MODEL
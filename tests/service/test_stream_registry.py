@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from app.service.stream_registry import StreamRegistry, parse_last_event_id
+
+
+def test_replays_from_any_buffered_position():
+    registry = StreamRegistry(max_events=10, ttl=60)
+
+    stream = registry.start(1, lambda: iter(["a", "b", "c"]))
+
+    assert list(stream.broadcast.subscribe()) == [(0, "a"), (1, "b"), (2, "c")]
+    assert list(registry.get(stream.stream_id).broadcast.subscribe(after=1)) == [(2, "c")]
+
+
+def test_ring_buffer_drops_oldest_events():
+    registry = StreamRegistry(max_events=2, ttl=60)
+
+    stream = registry.start(1, lambda: iter(["a", "b", "c"]))
+    while not stream.broadcast.done:
+        time.sleep(0.01)
+
+    assert stream.broadcast.first_seq == 1
+    with pytest.raises(LookupError):
+        list(stream.broadcast.subscribe())
+
+
+def test_finished_streams_expire():
+    registry = StreamRegistry(max_events=10, ttl=0)
+
+    stream = registry.start(1, lambda: iter(["a"]))
+    list(stream.broadcast.subscribe())
+    time.sleep(0.01)
+
+    assert registry.get(stream.stream_id) is None
+
+
+def test_parse_last_event_id():
+    assert parse_last_event_id("abc:12") == ("abc", 12)
+    with pytest.raises(ValueError):
+        parse_last_event_id("abc")
+
+
+def test_generation_is_cancelled_once_the_last_client_detaches():
+    registry = StreamRegistry(max_events=10, ttl=60)
+    release_source = threading.Event()
+
+    def events():
+        yield "a"
+        release_source.wait(timeout=5)
+
+    stream = registry.start(1, events)
+    stream.cancellation.on_cancel(release_source.set)
+    first, second = stream.attach(), stream.attach()
+
+    first()
+    first()
+    assert not stream.cancellation.cancelled
+    second()
+
+    assert stream.cancellation.cancelled
+
+
+def test_client_resuming_within_the_grace_period_keeps_the_generation():
+    registry = StreamRegistry(max_events=10, ttl=60, disconnect_grace=0.05)
+    release_source = threading.Event()
+
+    def events():
+        release_source.wait(timeout=5)
+        yield "a"
+
+    stream = registry.start(1, events)
+    stream.attach()()
+    resumed = stream.attach()
+    time.sleep(0.1)
+
+    assert not stream.cancellation.cancelled
+    resumed()
+    time.sleep(0.1)
+    assert stream.cancellation.cancelled
+    release_source.set()
@@ -0,0 +1,18 @@
+import build_knowledge
+from app.core.knowledge_artifact import KnowledgeArtifact
+
+
+def test_main_compiles_directory(tmp_path, capsys):
+    # Arrange
+    directory = tmp_path / "knowledge"
+    directory.mkdir()
+    (directory / "faq.txt").write_text("Q: Price?\nA: $10", encoding="utf-8")
+    output = tmp_path / "knowledge.qkb"
+
+    # Act
+    build_knowledge.main([str(directory), str(output)])
+
+    # Assert
+    artifact = KnowledgeArtifact(str(output))
+    assert artifact.read("faq.txt") == "Q: Price?\nA: $10"
+    assert artifact.version_id in capsys.readouterr().out
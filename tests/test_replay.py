@@ -0,0 +1,86 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+from openai.types.completion_usage import CompletionUsage
+
+import replay
+from app.core.config import settings
+from app.core.knowledge_index import KnowledgeIndex
+
+
+def completion(content, model="gpt-4o-mini-2024-07-18"):
+    return ChatCompletion(
+        id="chatcmpl-123",
+        choices=[Choice(finish_reason="stop", index=0,
+                        message=ChatCompletionMessage(role="assistant", content=content))],
+        model=model,
+        object="chat.completion",
+        usage=CompletionUsage(completion_tokens=5, prompt_tokens=20, total_tokens=25),
+        created=1677652088,
+    )
+
+
+def test_replay_reports_per_question_records_and_summary(tmp_path, capsys):
+    # Arrange
+    conversations = tmp_path / "conversations.jsonl"
+    conversations.write_text("\n".join(json.dumps(c) for c in [
+        {"id": "a", "messages": [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "old"},
+                                 {"role": "user", "content": "Price?"}]},
+        {"id": "b", "messages": [{"role": "user", "content": "Email?"}]},
+    ]))
+    output = tmp_path / "report.json"
+    client = MagicMock()
+    client.chat.completions.create.side_effect = lambda **kwargs: completion(f"answer to {kwargs['messages'][-1]['content']}")
+
+    # Act
+    with patch("replay.get_openai_client", return_value=client):
+        replay.main([str(conversations), "--concurrency", "2", "--output", str(output)])
+
+    # Assert
+    report = json.loads(output.read_text())
+    assert report["summary"]["questions"] == 3
+    assert report["summary"]["errors"] == 0
+    assert report["summary"]["prompt_tokens"] == 60
+    first_turns = [r for r in report["records"] if r["conversation"] == "a"]
+    assert [r["question"] for r in first_turns] == ["Hi", "Price?"]
+    # The replayed answer, not the recorded one, becomes history for the next turn
+    second_call_messages = [c.kwargs["messages"] for c in client.chat.completions.create.call_args_list
+                            if c.kwargs["messages"][-1]["content"] == "Price?"][0]
+    assert second_call_messages[-2] == {"role": "assistant", "content": "answer to Hi"}
+    assert json.loads(capsys.readouterr().out)["questions"] == 3
+
+
+def test_replay_routes_through_the_cascade_unless_a_model_is_given(tmp_path, monkeypatch):
+    # Arrange
+    (tmp_path / "pricing.txt").write_text("The Pro plan costs $50 per month.")
+    monkeypatch.setattr(settings, "LLM_FAST_MODEL", "fast-model")
+    monkeypatch.setattr("app.service.query_ai_service.knowledge_index", KnowledgeIndex(directory=str(tmp_path)))
+    conversations = tmp_path / "conversations.jsonl"
+    conversations.write_text(json.dumps({"id": "a", "messages": [{"role": "user", "content": "Pro plan cost?"}]}))
+    output = tmp_path / "report.json"
+    client = MagicMock()
+    client.chat.completions.create.side_effect = lambda **kwargs: completion("$50 per month.", kwargs["model"])
+
+    # Act
+    with patch("replay.get_openai_client", return_value=client):
+        replay.main([str(conversations), "--output", str(output)])
+        cascaded = json.loads(output.read_text())["records"][0]
+        replay.main([str(conversations), "--model", "pinned-model", "--output", str(output)])
+        pinned = json.loads(output.read_text())["records"][0]
+
+    # Assert
+    models = [c.kwargs["model"] for c in client.chat.completions.create.call_args_list]
+    assert models == ["fast-model", "pinned-model"]
+    assert (cascaded["tier"], cascaded["routing_reason"], cascaded["escalation_reason"]) == ("fast", "simple", None)
+    assert set(cascaded["tier_ms"]) == {"fast"}
+    assert pinned["tier"] is None and pinned["tier_ms"] == {}
+
+
+def test_apply_overrides(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_COALESCE_REQUESTS", True)
+
+    replay.apply_overrides(["LLM_COALESCE_REQUESTS=false"])
+
+    assert settings.LLM_COALESCE_REQUESTS is False